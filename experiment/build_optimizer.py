@@ -32,6 +32,7 @@ import level_set_fusion_optimization as cpp_module
 class OptimizerChoice(Enum):
     PYTHON_DIRECT = 0
     PYTHON_VECTORIZED = 1
+    PYTHON_VECTORIZED_ACTIVE_SET = 2
     CPP = 3
 
 
@@ -44,10 +45,11 @@ def build_optimizer(optimizer_choice, out_path, field_size, view_scaling_factor=
     :param max_iterations: maximum iteration count
     :return: an optimizer constructed using the passed arguments
     """
-    if optimizer_choice == OptimizerChoice.PYTHON_DIRECT or optimizer_choice == OptimizerChoice.PYTHON_VECTORIZED:
-        compute_method = (ComputeMethod.DIRECT
-                          if optimizer_choice == OptimizerChoice.PYTHON_DIRECT
-                          else ComputeMethod.VECTORIZED)
+    python_compute_methods = {OptimizerChoice.PYTHON_DIRECT: ComputeMethod.DIRECT,
+                              OptimizerChoice.PYTHON_VECTORIZED: ComputeMethod.VECTORIZED,
+                              OptimizerChoice.PYTHON_VECTORIZED_ACTIVE_SET: ComputeMethod.VECTORIZED_ACTIVE_SET}
+    if optimizer_choice in python_compute_methods:
+        compute_method = python_compute_methods[optimizer_choice]
         optimizer = SlavchevaOptimizer2d(out_path=out_path,
                                          field_size=field_size,
 
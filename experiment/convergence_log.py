@@ -0,0 +1,192 @@
+#  ================================================================
+#  Created by agent on 10/18/26.
+#  Copyright (c) 2026 agent
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#  ================================================================
+
+# Append-only (streaming) recording of the convergence status log & case files of multi-case experiments
+
+# stdlib
+import os
+import csv
+from collections import OrderedDict
+# libraries
+import numpy as np
+
+CONVERGENCE_STATUS_LOG_FILENAME = "convergence_status_log.csv"
+CONVERGENCE_STATUS_LOG_COLUMNS = ["canonical frame index", "live frame index", "pixel row index",
+                                  "iteration count",
+                                  "max warp length",
+                                  "max warp x",
+                                  "max warp y",
+                                  "iteration limit reached",
+                                  "largest warp below minimum threshold",
+                                  "largest warp above maximum threshold"]
+# columns of the convergence status log kept in the case files
+CASE_COLUMNS = ["canonical frame index", "live frame index", "pixel row index", "max warp x", "max warp y"]
+_CASE_COLUMN_INDICES = [CONVERGENCE_STATUS_LOG_COLUMNS.index(column) for column in CASE_COLUMNS]
+_ITERATION_COUNT_INDEX = CONVERGENCE_STATUS_LOG_COLUMNS.index("iteration count")
+_ITERATION_LIMIT_REACHED_INDEX = CONVERGENCE_STATUS_LOG_COLUMNS.index("iteration limit reached")
+_ABOVE_MAXIMUM_THRESHOLD_INDEX = CONVERGENCE_STATUS_LOG_COLUMNS.index("largest warp above maximum threshold")
+
+OUTCOMES = ("CONVERGED", "DIVERGED", "NOT CONVERGED")
+
+
+def get_convergence_outcome(iteration_limit_reached, largest_warp_above_maximum_threshold):
+    """
+    :return: one of OUTCOMES
+    """
+    if not iteration_limit_reached:
+        if largest_warp_above_maximum_threshold:
+            return "DIVERGED"
+        return "CONVERGED"
+    return "NOT CONVERGED"
+
+
+def _parse_log_entry(row):
+    # values of a log entry read back from the file, typed as in the entries produced by log_convergence_status
+    entry = []
+    for value, column in zip(row, CONVERGENCE_STATUS_LOG_COLUMNS):
+        if column == "max warp length":
+            entry.append(float(value))
+        elif column in ("iteration limit reached", "largest warp below minimum threshold",
+                        "largest warp above maximum threshold"):
+            entry.append(value == "True")
+        else:
+            entry.append(int(value))
+    return entry
+
+
+def load_convergence_status_log(file_path, row_count):
+    """
+    Load the convergence status log previously recorded via ConvergenceStatusLogWriter (if any)
+    :param file_path: path to the log file
+    :param row_count: how many leading rows (samples) to keep
+    :return: list of log entries (empty if the file doesn't exist)
+    """
+    if not os.path.exists(file_path):
+        return []
+    entries = []
+    with open(file_path, "r", newline="") as file:
+        reader = csv.reader(file)
+        # skip the header
+        next(reader, None)
+        for row in reader:
+            if len(entries) == row_count:
+                break
+            # the first column is the row index
+            entries.append(_parse_log_entry(row[1:]))
+    return entries
+
+
+class ConvergenceStatusLogWriter:
+    """
+    Records the convergence status log (see multiframe_experiment.log_convergence_status) and the case files
+    (cases.csv, as well as bad_cases.csv & good_cases.csv with the cases where the iteration limit was / wasn't
+    reached) one entry at a time, by appending to the files, and keeps running aggregates of the recorded entries.
+    Files are synced to disk after every few entries, so that they cover a contiguous range of cases that have been
+    completed should the experiment get interrupted.
+    """
+
+    def __init__(self, out_directory, kept_entry_count=0, sync_every_n_entries=5):
+        """
+        :param out_directory: directory to record the files in (created if it doesn't exist), existing files are
+        overwritten
+        :param kept_entry_count: how many leading entries of an existing convergence status log in the directory to
+        keep (for resuming an interrupted experiment), the rest of the log is discarded
+        :param sync_every_n_entries: how many entries to append between syncing the files to disk
+        """
+        self.sync_every_n_entries = sync_every_n_entries
+        self.entry_count = 0
+        # in the order of OUTCOMES (plain dicts don't preserve insertion order before Python 3.6)
+        self.outcome_counts = OrderedDict((outcome, 0) for outcome in OUTCOMES)
+        # iteration_count_histogram[i] is the number of entries where the optimization took i iterations
+        self.iteration_count_histogram = np.zeros(0, dtype=np.int64)
+        self.__unsynced_entry_count = 0
+
+        if not os.path.exists(out_directory):
+            os.makedirs(out_directory)
+        log_path = os.path.join(out_directory, CONVERGENCE_STATUS_LOG_FILENAME)
+        kept_entries = load_convergence_status_log(log_path, kept_entry_count) if kept_entry_count > 0 else []
+
+        self.__files = []
+        self.__log_writer = self.__open(log_path, [""] + CONVERGENCE_STATUS_LOG_COLUMNS)
+        self.__cases_writer = self.__open(os.path.join(out_directory, "cases.csv"), CASE_COLUMNS)
+        self.__bad_cases_writer = self.__open(os.path.join(out_directory, "bad_cases.csv"), CASE_COLUMNS)
+        self.__good_cases_writer = self.__open(os.path.join(out_directory, "good_cases.csv"), CASE_COLUMNS)
+        for entry in kept_entries:
+            self.append(entry)
+        self.sync()
+
+    def __open(self, path, header):
+        file = open(path, "w", newline="")
+        self.__files.append(file)
+        writer = csv.writer(file, lineterminator="\n")
+        writer.writerow(header)
+        return writer
+
+    def append(self, log_entry):
+        """
+        :param log_entry: convergence status log entry, see multiframe_experiment.log_convergence_status
+        """
+        self.__log_writer.writerow([self.entry_count] + list(log_entry))
+        case = [log_entry[index] for index in _CASE_COLUMN_INDICES]
+        self.__cases_writer.writerow(case)
+        if log_entry[_ITERATION_LIMIT_REACHED_INDEX]:
+            self.__bad_cases_writer.writerow(case)
+        else:
+            self.__good_cases_writer.writerow(case)
+
+        self.entry_count += 1
+        outcome = get_convergence_outcome(log_entry[_ITERATION_LIMIT_REACHED_INDEX],
+                                          log_entry[_ABOVE_MAXIMUM_THRESHOLD_INDEX])
+        self.outcome_counts[outcome] += 1
+        iteration_count = int(log_entry[_ITERATION_COUNT_INDEX])
+        if iteration_count >= len(self.iteration_count_histogram):
+            self.iteration_count_histogram = np.pad(self.iteration_count_histogram,
+                                                    (0, iteration_count + 1 - len(self.iteration_count_histogram)),
+                                                    mode="constant")
+        self.iteration_count_histogram[iteration_count] += 1
+
+        self.__unsynced_entry_count += 1
+        if self.__unsynced_entry_count >= self.sync_every_n_entries:
+            self.sync()
+
+    def sync(self):
+        """
+        Flush all appended entries to disk
+        """
+        for file in self.__files:
+            file.flush()
+            os.fsync(file.fileno())
+        self.__unsynced_entry_count = 0
+
+    def get_summary(self):
+        """
+        :return: one-line summary of the outcome counts & iteration counts of the recorded entries
+        """
+        summary = "{:d} cases: ".format(self.entry_count) + \
+                  ", ".join("{:d} {:s}".format(self.outcome_counts[outcome], outcome) for outcome in OUTCOMES)
+        if self.entry_count > 0:
+            iteration_counts = np.arange(len(self.iteration_count_histogram))
+            mean_iteration_count = np.dot(iteration_counts, self.iteration_count_histogram) / self.entry_count
+            summary += "; mean iteration count: {:.1f}".format(mean_iteration_count)
+        return summary
+
+    def close(self):
+        if len(self.__files) == 0:
+            return
+        self.sync()
+        for file in self.__files:
+            file.close()
+        self.__files = []
@@ -20,10 +20,10 @@ from enum import Enum
 
 from abc import ABC, abstractmethod
 
-import cv2
 import numpy as np
 from calib.camerarig import DepthCameraRig
 from tsdf import generation as tsdf_gen
+from utils.image_cache import load_image
 
 
 class PredefinedDatasetEnum(Enum):
@@ -82,7 +82,7 @@ class ImageBasedSingleFrameDataset(SingleFrameDataset):
     def generate_2d_sdf_canonical(self, method=tsdf_gen.GenerationMethod.NONE):
         rig = DepthCameraRig.from_infinitam_format(self.calibration_file_path)
         depth_camera = rig.depth_camera
-        depth_image0 = cv2.imread(self.first_frame_path, cv2.IMREAD_UNCHANGED)
+        depth_image0 = load_image(self.first_frame_path).copy()
         max_depth = np.iinfo(np.uint16).max
         depth_image0[depth_image0 == 0] = max_depth
         canonical_field = \
@@ -95,7 +95,7 @@ class ImageBasedSingleFrameDataset(SingleFrameDataset):
     def generate_2d_sdf_live(self, method=tsdf_gen.GenerationMethod.NONE):
         rig = DepthCameraRig.from_infinitam_format(self.calibration_file_path)
         depth_camera = rig.depth_camera
-        depth_image1 = cv2.imread(self.second_frame_path, cv2.IMREAD_UNCHANGED)
+        depth_image1 = load_image(self.second_frame_path).copy()
         max_depth = np.iinfo(np.uint16).max
         depth_image1[depth_image1 == 0] = max_depth
         live_field = \
@@ -128,8 +128,8 @@ class MaskedImageBasedSingleFrameDataset(SingleFrameDataset):
     def generate_2d_sdf_fields(self, method=tsdf_gen.GenerationMethod.NONE):
         rig = DepthCameraRig.from_infinitam_format(self.calibration_file_path)
         depth_camera = rig.depth_camera
-        depth_image0 = cv2.imread(self.first_frame_path, cv2.IMREAD_UNCHANGED)
-        mask_image0 = cv2.imread(self.first_mask_path, cv2.IMREAD_UNCHANGED)
+        depth_image0 = load_image(self.first_frame_path).copy()
+        mask_image0 = load_image(self.first_mask_path)
         max_depth = np.iinfo(np.uint16).max
         depth_image0[mask_image0 == 0] = max_depth
         depth_image0[depth_image0 == 0] = max_depth
@@ -137,8 +137,8 @@ class MaskedImageBasedSingleFrameDataset(SingleFrameDataset):
             tsdf_gen.generate_2d_tsdf_field_from_depth_image(depth_image0, depth_camera, self.image_pixel_row,
                                                              field_size=self.field_size, array_offset=self.offset,
                                                              generation_method=method)
-        depth_image1 = cv2.imread(self.second_frame_path, cv2.IMREAD_UNCHANGED)
-        mask_image1 = cv2.imread(self.second_mask_path, cv2.IMREAD_UNCHANGED)
+        depth_image1 = load_image(self.second_frame_path).copy()
+        mask_image1 = load_image(self.second_mask_path)
         depth_image1[mask_image1 == 0] = max_depth
         depth_image1[depth_image0 == 0] = max_depth
         live_field = \
@@ -148,6 +148,46 @@ class MaskedImageBasedSingleFrameDataset(SingleFrameDataset):
         return live_field, canonical_field
 
 
+class DepthStackSingleFrameDataset(SingleFrameDataset):
+    """
+    Dataset for a pair of frames from a depth stack file (see experiment/depth_stack.py). Only the image rows that
+    the generation method actually samples are read.
+    """
+
+    def __init__(self, depth_stack, canonical_frame_index, live_frame_index, image_pixel_row, field_size, offset,
+                 voxel_size=0.004, use_masks=True):
+        """
+        :type depth_stack: experiment.depth_stack.DepthStack
+        :param depth_stack: depth stack to read the frames from
+        """
+        super(DepthStackSingleFrameDataset).__init__()
+        self.depth_stack = depth_stack
+        self.canonical_frame_index = canonical_frame_index
+        self.live_frame_index = live_frame_index
+        self.image_pixel_row = image_pixel_row
+        self.field_size = field_size
+        self.offset = offset
+        self.voxel_size = voxel_size
+        self.use_masks = use_masks
+
+    def generate_2d_sdf_field(self, frame_index, depth_camera, method=tsdf_gen.GenerationMethod.NONE):
+        # conventional methods sample only the pixel row and (when interpolating) the one right below it
+        row_range = (self.image_pixel_row, self.image_pixel_row + 2) \
+            if method in tsdf_gen.generate_tsdf_2d_conventional_functions else None
+        depth_image = self.depth_stack.get_masked_depth_image(frame_index, row_range, self.use_masks)
+        return tsdf_gen.generate_2d_tsdf_field_from_depth_image(depth_image, depth_camera, self.image_pixel_row,
+                                                                field_size=self.field_size,
+                                                                array_offset=self.offset,
+                                                                generation_method=method,
+                                                                voxel_size=self.voxel_size)
+
+    def generate_2d_sdf_fields(self, method=tsdf_gen.GenerationMethod.NONE):
+        depth_camera = self.depth_stack.depth_camera
+        live_field = self.generate_2d_sdf_field(self.live_frame_index, depth_camera, method)
+        canonical_field = self.generate_2d_sdf_field(self.canonical_frame_index, depth_camera, method)
+        return live_field, canonical_field
+
+
 datasets = {
     PredefinedDatasetEnum.ZIGZAG001: ImageBasedSingleFrameDataset(
         "/media/algomorph/Data/Reconstruction/synthetic_data/zigzag/inf_calib.txt",
@@ -0,0 +1,212 @@
+#  ================================================================
+#  Created by agent on 10/18/26.
+#  Copyright (c) 2026 agent
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#  ================================================================
+
+# Depth stack format: a whole sequence of depth frames (and, optionally, masks) packed into one memory-mapped file.
+#
+# Layout (little-endian):
+#   magic (8 bytes), then uint32 fields: version, frame count, height, width, plane count,
+#   frame filename format (see experiment_shared_routines.FrameFilenameFormat), calibration text length in bytes;
+#   calibration text (InfiniTAM format, UTF-8), zero-padded to a multiple of DATA_ALIGNMENT bytes;
+#   uint16 data of shape (frame count, plane count, height, width), where plane 0 is depth and plane 1 (if present)
+#   is the mask.
+
+# stdlib
+import sys
+import io
+import os
+import struct
+import argparse
+# libraries
+import numpy as np
+import cv2
+
+# local
+from calib.camerarig import DepthCameraRig
+from experiment import experiment_shared_routines as shared
+
+MAGIC = b"LSFDSTK\0"
+VERSION = 1
+HEADER_FORMAT = "<8s7I"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+DATA_ALIGNMENT = 64
+
+DEPTH_PLANE = 0
+MASK_PLANE = 1
+
+EXIT_CODE_SUCCESS = 0
+EXIT_CODE_FAILURE = 1
+
+
+def is_depth_stack_file(path):
+    if not os.path.isfile(path):
+        return False
+    with open(path, "rb") as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def compute_data_offset(calibration_length):
+    return ((HEADER_SIZE + calibration_length + DATA_ALIGNMENT - 1) // DATA_ALIGNMENT) * DATA_ALIGNMENT
+
+
+def convert_frames_to_depth_stack(frames_path, calibration_path, output_path, use_masks=True):
+    """
+    Pack a directory of depth_XXXXXX.png / mask_XXXXXX.png frames (numbered from 0) into a single depth stack file
+    :param frames_path: path to the directory with the frames
+    :param calibration_path: path to the InfiniTAM-format calibration file of the camera that captured the frames
+    :param output_path: path to the depth stack file to write
+    :param use_masks: whether to pack the masks (if found) along with the depth frames
+    :return: the resulting depth stack, opened for reading
+    :rtype: DepthStack
+    """
+    frame_count, filename_format, masks_found = shared.check_frame_count_and_format(frames_path, not use_masks)
+    use_masks = use_masks and masks_found
+    if filename_format == shared.FrameFilenameFormat.SIX_DIGIT:
+        frame_path_format_string = os.path.join(frames_path, "depth_{:0>6d}.png")
+        mask_path_format_string = os.path.join(frames_path, "mask_{:0>6d}.png")
+    else:  # has to be FIVE_DIGIT
+        frame_path_format_string = os.path.join(frames_path, "depth_{:0>5d}.png")
+        mask_path_format_string = os.path.join(frames_path, "mask_{:0>5d}.png")
+
+    with open(calibration_path, "rb") as calibration_file:
+        calibration = calibration_file.read()
+
+    first_frame = cv2.imread(frame_path_format_string.format(0), cv2.IMREAD_UNCHANGED)
+    height, width = first_frame.shape
+    plane_count = 2 if use_masks else 1
+
+    data_offset = compute_data_offset(len(calibration))
+    with open(output_path, "wb") as file:
+        file.write(struct.pack(HEADER_FORMAT, MAGIC, VERSION, frame_count, height, width, plane_count,
+                               filename_format.value, len(calibration)))
+        file.write(calibration)
+        file.write(b"\0" * (data_offset - HEADER_SIZE - len(calibration)))
+
+    data = np.memmap(output_path, dtype="<u2", mode="r+", offset=data_offset,
+                     shape=(frame_count, plane_count, height, width))
+    for frame_index in range(frame_count):
+        data[frame_index, DEPTH_PLANE] = cv2.imread(frame_path_format_string.format(frame_index),
+                                                    cv2.IMREAD_UNCHANGED)
+        if use_masks:
+            data[frame_index, MASK_PLANE] = cv2.imread(mask_path_format_string.format(frame_index),
+                                                       cv2.IMREAD_UNCHANGED)
+    data.flush()
+    del data
+    return DepthStack(output_path)
+
+
+class DepthStack:
+    """
+    Read-only, memory-mapped access to a depth stack file. Only the pages holding the rows that are actually accessed
+    get read from disk.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as file:
+            magic, version, frame_count, height, width, plane_count, filename_format, calibration_length = \
+                struct.unpack(HEADER_FORMAT, file.read(HEADER_SIZE))
+            if magic != MAGIC:
+                raise ValueError("'{:s}' is not a depth stack file".format(path))
+            if version != VERSION:
+                raise ValueError("Unsupported depth stack version: {:d}".format(version))
+            self.calibration = file.read(calibration_length).decode("utf-8")
+        self.frame_count = frame_count
+        self.height = height
+        self.width = width
+        self.has_masks = plane_count > 1
+        self.filename_format = shared.FrameFilenameFormat(filename_format)
+        self.data = np.memmap(path, dtype="<u2", mode="r", offset=compute_data_offset(calibration_length),
+                              shape=(frame_count, plane_count, height, width))
+
+    @property
+    def depth_camera(self):
+        return DepthCameraRig.from_infinitam_format(io.StringIO(self.calibration)).depth_camera
+
+    def get_depth_image(self, frame_index):
+        return self.data[frame_index, DEPTH_PLANE]
+
+    def get_mask_image(self, frame_index):
+        return self.data[frame_index, MASK_PLANE]
+
+    def get_depth_row(self, frame_index, ix_row):
+        return self.data[frame_index, DEPTH_PLANE, ix_row]
+
+    def get_mask_row(self, frame_index, ix_row):
+        return self.data[frame_index, MASK_PLANE, ix_row]
+
+    def is_row_empty(self, frame_index, ix_row, check_masked=True):
+        depth_row = self.get_depth_row(frame_index, ix_row)
+        if check_masked and self.has_masks:
+            depth_row = depth_row[self.get_mask_row(frame_index, ix_row) != 0]
+        return np.sum(depth_row) == 0
+
+    def find_non_empty_rows(self, use_masks=True):
+        """
+        Build the row emptiness index for the whole stack, see experiment_shared_routines.find_non_empty_rows
+        :return: boolean array of shape (frame_count, height), True for non-empty rows
+        """
+        use_masks = use_masks and self.has_masks
+        non_empty_rows = np.empty((self.frame_count, self.height), dtype=np.bool_)
+        for frame_index in range(self.frame_count):
+            mask = self.get_mask_image(frame_index) if use_masks else None
+            non_empty_rows[frame_index] = shared.find_non_empty_rows(self.get_depth_image(frame_index), mask)
+        return non_empty_rows
+
+    def get_masked_depth_image(self, frame_index, row_range=None, use_mask=True):
+        """
+        Get the depth image with zero-depth (and masked-out, if applicable) pixels set to the maximum depth value.
+        :param frame_index: index of the frame
+        :param row_range: (start, end) range of rows to read. Other rows are filled with the maximum depth value. If
+        None, the whole image is read.
+        :param use_mask: whether to apply the mask
+        :return: resulting depth image (a new array with the full frame shape)
+        """
+        max_depth = np.iinfo(np.uint16).max
+        if row_range is None:
+            row_range = (0, self.height)
+        start_row = max(0, row_range[0])
+        end_row = min(self.height, row_range[1])
+        depth_image = np.full((self.height, self.width), max_depth, dtype=np.uint16)
+        depth_rows = self.data[frame_index, DEPTH_PLANE, start_row:end_row]
+        if use_mask and self.has_masks:
+            invalid = self.data[frame_index, MASK_PLANE, start_row:end_row] == 0
+            invalid |= depth_rows == 0
+        else:
+            invalid = depth_rows == 0
+        depth_image[start_row:end_row] = np.where(invalid, max_depth, depth_rows)
+        return depth_image
+
+
+def main():
+    parser = argparse.ArgumentParser("Pack a sequence of depth frames (and masks) into a single depth stack file")
+    parser.add_argument("-f", "--frames", type=str, required=True,
+                        help="Path to the depth frames. Frame image files should have names "
+                             "that follow depth_{:0>6d}.png pattern, i.e. depth_000000.png")
+    parser.add_argument("-c", "--calibration", type=str, required=True,
+                        help="Path to the InfiniTAM-format camera calibration file")
+    parser.add_argument("-o", "--output_path", type=str, required=True, help="Path to the depth stack file to write")
+    parser.add_argument("--no_masks", action="store_true", help="Don't pack the masks, even if present")
+    arguments = parser.parse_args()
+
+    stack = convert_frames_to_depth_stack(arguments.frames, arguments.calibration, arguments.output_path,
+                                          use_masks=not arguments.no_masks)
+    print("Packed {:d} frames ({:s}masks) into {:s}".format(stack.frame_count, "" if stack.has_masks else "no ",
+                                                           arguments.output_path))
+    return EXIT_CODE_SUCCESS
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -21,22 +21,21 @@ from enum import Enum
 import re
 import os
 # libraries
-import cv2
 import numpy as np
 
-
 # local
+from utils.image_cache import load_image
+
 
 def is_unmasked_image_row_empty(path, ix_row):
-    image = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+    image = load_image(path)
     return np.sum(image[ix_row]) == 0
 
 
 def is_masked_image_row_empty(image_path, mask_path, ix_row):
-    image = cv2.imread(image_path, cv2.IMREAD_UNCHANGED)
-    mask = cv2.imread(mask_path, cv2.IMREAD_UNCHANGED)
-    image[mask == 0] = 0
-    return np.sum(image[ix_row]) == 0
+    image = load_image(image_path)
+    mask = load_image(mask_path)
+    return np.sum(image[ix_row][mask[ix_row] != 0]) == 0
 
 
 def is_image_row_empty(image_path, mask_path, ix_row, check_masked):
@@ -46,6 +45,94 @@ def is_image_row_empty(image_path, mask_path, ix_row, check_masked):
         return is_unmasked_image_row_empty(image_path, ix_row)
 
 
+# region ================ Row emptiness index ========================================================================
+# per-frame bitmaps of non-empty image rows, used to pick valid pixel rows without loading any images
+
+NON_EMPTY_ROW_INDEX_FILENAME = "non_empty_row_index.npz"
+
+
+def find_non_empty_rows(image, mask=None):
+    """
+    :param image: depth image
+    :param mask: mask image or None (if masks aren't used)
+    :return: boolean array with an entry for every image row, True where the (masked) row has any nonzero depth
+    """
+    if mask is not None:
+        return np.any((image != 0) & (mask != 0), axis=1)
+    return np.any(image != 0, axis=1)
+
+
+def build_non_empty_row_index(frame_count, frame_path_format_string, mask_path_format_string, use_masks):
+    """
+    :return: boolean array of shape (frame_count, image height), True for non-empty rows, see find_non_empty_rows
+    """
+    rows_by_frame = []
+    for frame_index in range(frame_count):
+        image = load_image(frame_path_format_string.format(frame_index))
+        mask = load_image(mask_path_format_string.format(frame_index)) if use_masks else None
+        rows_by_frame.append(find_non_empty_rows(image, mask))
+    return np.stack(rows_by_frame)
+
+
+def save_non_empty_row_index(path, non_empty_rows, use_masks):
+    np.savez(path, bitmap=np.packbits(non_empty_rows, axis=1), frame_count=non_empty_rows.shape[0],
+             height=non_empty_rows.shape[1], use_masks=use_masks)
+
+
+def load_non_empty_row_index(path, frame_count, use_masks):
+    """
+    :return: the index stored at path, or None if there is none or it doesn't match the frame count and mask usage
+    """
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as index_file:
+        if int(index_file["frame_count"]) != frame_count or bool(index_file["use_masks"]) != use_masks:
+            return None
+        # unpacked rows are padded to a multiple of 8 (the 'count' argument of unpackbits requires numpy 1.17)
+        return np.unpackbits(index_file["bitmap"], axis=1)[:, :int(index_file["height"])].astype(np.bool_)
+
+
+def load_or_build_non_empty_row_index(index_path, frame_count, use_masks, build_index):
+    """
+    Load the row emptiness index from index_path, or, if it's missing or out of date, build and save it there.
+    :param index_path: where the index is persisted
+    :param frame_count: number of frames in the dataset
+    :param use_masks: whether the index should account for the masks
+    :param build_index: function that takes no arguments and builds the index
+    :return: boolean array of shape (frame_count, image height), True for non-empty rows
+    """
+    non_empty_rows = load_non_empty_row_index(index_path, frame_count, use_masks)
+    if non_empty_rows is None:
+        non_empty_rows = build_index()
+        try:
+            save_non_empty_row_index(index_path, non_empty_rows, use_masks)
+        except OSError:
+            print("Warning: could not save the row emptiness index to " + index_path)
+    return non_empty_rows
+
+
+def sample_non_empty_row(non_empty_rows, frame_indices, line_range, pixel_row_index=None):
+    """
+    Pick a row in line_range that is non-empty in every one of the specified frames.
+    :param non_empty_rows: row emptiness index, see load_or_build_non_empty_row_index
+    :param frame_indices: indices of the frames
+    :param line_range: (start, end) range of pixel rows to pick from
+    :param pixel_row_index: preferred row; returned as is when it's valid
+    :return: index of the pixel row or None if there are no valid rows in line_range
+    """
+    valid_rows = np.all(non_empty_rows[list(frame_indices), line_range[0]:line_range[1]], axis=0)
+    if pixel_row_index is not None and line_range[0] <= pixel_row_index < line_range[1] \
+            and valid_rows[pixel_row_index - line_range[0]]:
+        return pixel_row_index
+    valid_row_indices = np.flatnonzero(valid_rows)
+    if len(valid_row_indices) == 0:
+        return None
+    return line_range[0] + int(valid_row_indices[np.random.randint(len(valid_row_indices))])
+
+
+# endregion ============================================================================================================
+
+
 class FrameFilenameFormat(Enum):
     FIVE_DIGIT = 0
     SIX_DIGIT = 1
@@ -20,17 +20,19 @@
 import os
 import os.path
 import gc
+from multiprocessing import Pool
 
 # libraries
 import cv2
 import numpy as np
 from matplotlib import pyplot as plt
-import pandas as pd
 
 # local
 from experiment.build_optimizer import OptimizerChoice, build_optimizer
 from nonrigid_opt.data_term import DataTermMethod
-from experiment.dataset import ImageBasedSingleFrameDataset, MaskedImageBasedSingleFrameDataset
+from experiment.dataset import ImageBasedSingleFrameDataset, MaskedImageBasedSingleFrameDataset, \
+    DepthStackSingleFrameDataset
+from experiment.depth_stack import DepthStack, is_depth_stack_file
 from tsdf.generation import GenerationMethod
 from utils.point2d import Point2d
 from utils.printing import *
@@ -38,6 +40,7 @@ from utils.visualization import save_initial_fields, save_final_fields, rescale_
     save_tiled_tsdf_comparison_image, plot_warp_statistics
 import utils.sampling as sampling
 from experiment import experiment_shared_routines as shared
+from experiment.convergence_log import ConvergenceStatusLogWriter, get_convergence_outcome
 
 
 def log_convergence_status(log, convergence_status, canonical_frame_index, live_frame_index, pixel_row_index):
@@ -53,36 +56,204 @@ def log_convergence_status(log, convergence_status, canonical_frame_index, live_
                 convergence_status.largest_warp_above_maximum_threshold])
 
 
-def record_convergence_status_log(log, file_path):
-    df = pd.DataFrame(log, columns=["canonical frame index", "live frame index", "pixel row index",
-                                    "iteration count",
-                                    "max warp length",
-                                    "max warp x",
-                                    "max warp y",
-                                    "iteration limit reached",
-                                    "largest warp below minimum threshold",
-                                    "largest warp above maximum threshold"])
-    df.to_csv(file_path)
+class CaseRunSettings:
+    """
+    Settings shared by all (canonical frame, pixel row) cases of a multiple-test run
+    """
+
+    def __init__(self, data_term_method, optimizer_choice, depth_interpolation_method, out_path, calibration_path,
+                 frame_path_format_string, mask_path_format_string, use_masks, field_size, offset, max_iterations,
+                 enable_warp_statistics_logging, save_initial_and_final_fields, save_frame_images,
+                 save_per_case_results_in_root_output_folder, keep_case_fields, depth_stack_path=None):
+        self.data_term_method = data_term_method
+        self.optimizer_choice = optimizer_choice
+        self.depth_interpolation_method = depth_interpolation_method
+        self.out_path = out_path
+        self.calibration_path = calibration_path
+        self.frame_path_format_string = frame_path_format_string
+        self.mask_path_format_string = mask_path_format_string
+        self.use_masks = use_masks
+        # if set, frames are read from this depth stack file instead of the individual image files
+        self.depth_stack_path = depth_stack_path
+        self.field_size = field_size
+        self.offset = offset
+        self.view_scaling_factor = 1024 // field_size
+        self.max_iterations = max_iterations
+        self.enable_warp_statistics_logging = enable_warp_statistics_logging
+        self.save_initial_and_final_fields = save_initial_and_final_fields
+        self.save_frame_images = save_frame_images
+        self.save_per_case_results_in_root_output_folder = save_per_case_results_in_root_output_folder
+        # whether to return the input fields with each case result (for the good-vs-bad comparison image)
+        self.keep_case_fields = keep_case_fields
+        # C++ optimizer is reused between cases, python optimizers are rebuilt for each
+        self.rebuild_optimizer = optimizer_choice != OptimizerChoice.CPP
+
+    def build_optimizer(self, out_path):
+        return build_optimizer(self.optimizer_choice, out_path, self.field_size, view_scaling_factor=8,
+                               max_iterations=self.max_iterations,
+                               enable_warp_statistics_logging=self.enable_warp_statistics_logging,
+                               data_term_method=self.data_term_method)
+
+
+class CaseResult:
+    """
+    Compact result record of a single (canonical frame, pixel row) case
+    """
+
+    def __init__(self, log_entry, outcome, canonical_field=None, original_live_field=None, max_warp_at=None):
+        # entry for the convergence status log, see log_convergence_status
+        self.log_entry = log_entry
+        # one of "CONVERGED", "DIVERGED", "NOT CONVERGED"
+        self.outcome = outcome
+        self.canonical_field = canonical_field
+        self.original_live_field = original_live_field
+        self.max_warp_at = max_warp_at
+
+    @property
+    def iteration_count(self):
+        return self.log_entry[3]
+
+
+def print_case_header(canonical_frame_index, live_frame_index, pixel_row_index):
+    print("{:s} OPTIMIZATION BETWEEN FRAMES {:0>6d} AND {:0>6d} ON LINE {:0>3d}{:s}"
+          .format(BOLD_LIGHT_CYAN, canonical_frame_index, live_frame_index, pixel_row_index, RESET), end="")
+
+
+def print_case_outcome(result):
+    print(": " + result.outcome, end="")
+    print(" IN", result.iteration_count, "ITERATIONS")
+
+
+def run_case(settings, canonical_frame_index, pixel_row_index, focus_x, focus_y, optimizer=None,
+             print_progress=True):
+    """
+    Generate the canonical & live fields for a single case, run the optimizer on them, and log/save results
+    :type settings: CaseRunSettings
+    :param settings: settings shared by all cases
+    :param canonical_frame_index: index of the canonical frame (live frame index is assumed to be this + 1)
+    :param pixel_row_index: pixel row of the depth images to use for field generation
+    :param focus_x: x coordinate of the focus voxel for debug output
+    :param focus_y: y coordinate of the focus voxel for debug output
+    :param optimizer: optimizer to reuse (ignored if settings.rebuild_optimizer is set)
+    :param print_progress: whether to print the case header & outcome
+    :rtype: CaseResult
+    :return: compact record with the results of the run
+    """
+    sampling.set_focus_coordinates(focus_x, focus_y)
+
+    live_frame_index = canonical_frame_index + 1
+    out_path = settings.out_path
+    out_subpath = os.path.join(out_path, "frames {:0>6d}-{:0>6d} line {:0>3d}"
+                               .format(canonical_frame_index, live_frame_index, pixel_row_index))
+
+    canonical_frame_path = settings.frame_path_format_string.format(canonical_frame_index)
+    canonical_mask_path = settings.mask_path_format_string.format(canonical_frame_index)
+    live_frame_path = settings.frame_path_format_string.format(live_frame_index)
+    live_mask_path = settings.mask_path_format_string.format(live_frame_index)
+
+    depth_stack = DepthStack(settings.depth_stack_path) if settings.depth_stack_path is not None else None
+
+    if settings.save_frame_images:
+        def highlight_row_and_save_image(path_to_original, frame_index, output_name, ix_row):
+            if depth_stack is not None:
+                original_image = depth_stack.get_depth_image(frame_index)
+            else:
+                original_image = cv2.imread(path_to_original, cv2.IMREAD_UNCHANGED)
+            output_image = highlight_row_on_gray(rescale_depth_to_8bit(original_image), ix_row)
+            cv2.imwrite(os.path.join(out_subpath, output_name), output_image)
+
+        highlight_row_and_save_image(canonical_frame_path, canonical_frame_index, "canonical_frame_rh.png",
+                                     pixel_row_index)
+        highlight_row_and_save_image(live_frame_path, live_frame_index, "live_frame_rh.png", pixel_row_index)
+
+    # Generate SDF fields
+    if depth_stack is not None:
+        dataset = DepthStackSingleFrameDataset(depth_stack, canonical_frame_index, live_frame_index, pixel_row_index,
+                                               settings.field_size, settings.offset, use_masks=settings.use_masks)
+    elif settings.use_masks:
+        dataset = MaskedImageBasedSingleFrameDataset(settings.calibration_path, canonical_frame_path,
+                                                     canonical_mask_path, live_frame_path, live_mask_path,
+                                                     pixel_row_index, settings.field_size, settings.offset)
+    else:
+        dataset = ImageBasedSingleFrameDataset(settings.calibration_path, canonical_frame_path, live_frame_path,
+                                               pixel_row_index, settings.field_size, settings.offset)
+
+    live_field, canonical_field = dataset.generate_2d_sdf_fields(method=settings.depth_interpolation_method)
+
+    if settings.save_initial_and_final_fields:
+        save_initial_fields(canonical_field, live_field, out_subpath, settings.view_scaling_factor)
+
+    if print_progress:
+        print_case_header(canonical_frame_index, live_frame_index, pixel_row_index)
+
+    if settings.rebuild_optimizer:
+        optimizer = settings.build_optimizer(out_subpath)
+    original_live_field = live_field.copy()
+    live_field = optimizer.optimize(live_field, canonical_field)
+
+    # ===================== LOG AFTER-RUN RESULTS ======================================================================
+
+    if settings.save_initial_and_final_fields:
+        save_final_fields(canonical_field, live_field, out_subpath, settings.view_scaling_factor)
+
+    if settings.optimizer_choice != OptimizerChoice.CPP:
+        # call python-specific logging routines
+        optimizer.plot_logged_sdf_and_warp_magnitudes()
+        optimizer.plot_logged_energies_and_max_warps()
+    else:
+        # call C++-specific logging routines
+        if settings.enable_warp_statistics_logging:
+            warp_statistics = optimizer.get_warp_statistics_as_matrix()
+            root_subpath = os.path.join(out_path, "warp_statistics_frames_{:0>6d}-{:0>6d}_row_{:0>3d}.png"
+                                        .format(canonical_frame_index, live_frame_index, pixel_row_index))
+            if settings.save_per_case_results_in_root_output_folder:
+                plot_warp_statistics(out_subpath, warp_statistics, extra_path=root_subpath)
+            else:
+                plot_warp_statistics(out_subpath, warp_statistics, extra_path=None)
+
+    convergence_status = optimizer.get_convergence_status()
+    max_warp_at = Point2d(convergence_status.max_warp_location.x, convergence_status.max_warp_location.y)
+    outcome = get_convergence_outcome(convergence_status.iteration_limit_reached,
+                                      convergence_status.largest_warp_above_maximum_threshold)
+
+    log = []
+    log_convergence_status(log, convergence_status, canonical_frame_index, live_frame_index, pixel_row_index)
+    if settings.keep_case_fields:
+        result = CaseResult(log[0], outcome, canonical_field, original_live_field, max_warp_at)
+    else:
+        result = CaseResult(log[0], outcome)
+
+    if print_progress:
+        print_case_outcome(result)
+
+    if settings.rebuild_optimizer:
+        del optimizer
+        plt.close('all')
+        gc.collect()
+
+    return result
+
+
+# region ================ Process pool workers ========================================================================
+# each worker process keeps its own settings and (reusable) optimizer
+
+worker_settings = None
+worker_optimizer = None
 
 
-def record_cases_files(log, out_directory):
-    df = pd.DataFrame(log, columns=["canonical frame index", "live frame index", "pixel row index",
-                                    "iteration count",
-                                    "max warp length",
-                                    "max warp x",
-                                    "max warp y",
-                                    "iteration limit reached",
-                                    "largest warp below minimum threshold",
-                                    "largest warp above maximum threshold"])
-    cases_df = df.drop(columns=["iteration count", "max warp length", "iteration limit reached",
-                                "largest warp below minimum threshold", "largest warp above maximum threshold"])
+def initialize_worker(settings):
+    global worker_settings, worker_optimizer
+    worker_settings = settings
+    worker_optimizer = None if settings.rebuild_optimizer else settings.build_optimizer(settings.out_path)
 
-    bad_cases_df = cases_df[df["iteration limit reached"] == True]  # TODO: PyCharm bug
-    good_cases_df = cases_df[df["iteration limit reached"] == False]
 
-    cases_df.to_csv(os.path.join(out_directory, "cases.csv"), index=False)
-    bad_cases_df.to_csv(os.path.join(out_directory, "bad_cases.csv"), index=False)
-    good_cases_df.to_csv(os.path.join(out_directory, "good_cases.csv"), index=False)
+def run_case_in_worker(case):
+    canonical_frame_index, pixel_row_index, focus_x, focus_y = case
+    return run_case(worker_settings, canonical_frame_index, pixel_row_index, focus_x, focus_y,
+                    optimizer=worker_optimizer, print_progress=False)
+
+
+# endregion ============================================================================================================
 
 
 def perform_multiple_tests(start_from_sample=0,
@@ -95,7 +266,18 @@ def perform_multiple_tests(start_from_sample=0,
                            "/media/algomorph/Data/Reconstruction/real_data/KillingFusion Snoopy/snoopy_calib.txt",
                            frame_path=
                            "/media/algomorph/Data/Reconstruction/real_data/KillingFusion Snoopy/frames/",
-                           z_offset=128):
+                           z_offset=128,
+                           worker_count=1):
+    """
+    Run the optimizer on multiple (canonical frame, pixel row) cases and record the convergence status log and
+    case files in out_path
+    :param start_from_sample: index of the case to start from, 0-based (log entries of prior cases recorded in
+    out_path are kept)
+    :param frame_path: path to the directory with the depth frames (and masks) or to a depth stack file
+    (see experiment/depth_stack.py), in which case the calibration stored in the depth stack is used
+    :param worker_count: number of processes to run cases in; cases are distributed to a process pool if this is
+    greater than one, while the results are still merged & logged in order
+    """
     # CANDIDATES FOR ARGS
 
     save_initial_and_final_fields = input_case_file is not None
@@ -107,11 +289,16 @@ def perform_multiple_tests(start_from_sample=0,
     save_tiled_good_vs_bad_case_comparison_image = True
     save_per_case_results_in_root_output_folder = False
 
-    rebuild_optimizer = optimizer_choice != OptimizerChoice.CPP
     max_iterations = 400 if optimizer_choice == OptimizerChoice.CPP else 100
 
     # dataset location
-    frame_count, frame_filename_format, use_masks = shared.check_frame_count_and_format(frame_path, not use_masks)
+    depth_stack = DepthStack(frame_path) if is_depth_stack_file(frame_path) else None
+    if depth_stack is not None:
+        frame_count = depth_stack.frame_count
+        frame_filename_format = depth_stack.filename_format
+        use_masks = use_masks and depth_stack.has_masks
+    else:
+        frame_count, frame_filename_format, use_masks = shared.check_frame_count_and_format(frame_path, not use_masks)
     if frame_filename_format == shared.FrameFilenameFormat.SIX_DIGIT:
         frame_path_format_string = frame_path + os.path.sep + "depth_{:0>6d}.png"
         mask_path_format_string = frame_path + os.path.sep + "mask_{:0>6d}.png"
@@ -142,149 +329,81 @@ def perform_multiple_tests(start_from_sample=0,
         focus_y = np.zeros((len(frame_set), 1,))
         frame_row_and_focus_set = zip(frame_set, pixel_row_set, focus_x, focus_y)
         if check_empty_row:
-            # replace empty rows
+            # replace empty rows using the (persisted) row emptiness index
+            if depth_stack is not None:
+                index_path = os.path.splitext(frame_path)[0] + "_" + shared.NON_EMPTY_ROW_INDEX_FILENAME
+                non_empty_rows = shared.load_or_build_non_empty_row_index(
+                    index_path, frame_count, use_masks, lambda: depth_stack.find_non_empty_rows(use_masks))
+            else:
+                index_path = os.path.join(frame_path, shared.NON_EMPTY_ROW_INDEX_FILENAME)
+                non_empty_rows = shared.load_or_build_non_empty_row_index(
+                    index_path, frame_count, use_masks,
+                    lambda: shared.build_non_empty_row_index(frame_count, frame_path_format_string,
+                                                             mask_path_format_string, use_masks))
+            new_frame_set = []
             new_pixel_row_set = []
-            for canonical_frame_index, pixel_row_index, _, _ in frame_row_and_focus_set:
+            for canonical_frame_index, pixel_row_index in zip(frame_set, pixel_row_set):
                 live_frame_index = canonical_frame_index + 1
-                canonical_frame_path = frame_path_format_string.format(canonical_frame_index)
-                canonical_mask_path = mask_path_format_string.format(canonical_frame_index)
-                live_frame_path = frame_path_format_string.format(live_frame_index)
-                live_mask_path = mask_path_format_string.format(live_frame_index)
-                while shared.is_image_row_empty(canonical_frame_path, canonical_mask_path, pixel_row_index, use_masks) \
-                        or shared.is_image_row_empty(live_frame_path, live_mask_path, pixel_row_index, use_masks):
-                    pixel_row_index = line_range[0] + (line_range[1] - line_range[0]) * np.random.rand()
+                pixel_row_index = shared.sample_non_empty_row(non_empty_rows, (canonical_frame_index, live_frame_index),
+                                                              line_range, pixel_row_index)
+                if pixel_row_index is None:
+                    print("Warning: no non-empty rows in range {:s} for frames {:d} and {:d}, skipping them"
+                          .format(str(line_range), canonical_frame_index, live_frame_index))
+                    continue
+                new_frame_set.append(canonical_frame_index)
                 new_pixel_row_set.append(pixel_row_index)
-            frame_row_and_focus_set = zip(frame_set, pixel_row_set, focus_x, focus_y)
-
-    view_scaling_factor = 1024 // field_size
+            frame_row_and_focus_set = zip(new_frame_set, new_pixel_row_set, focus_x, focus_y)
 
     # endregion ========================================================================================================
 
-    # logging
-    convergence_status_log = []
-    convergence_status_log_file_path = os.path.join(out_path, "convergence_status_log.csv")
+    settings = CaseRunSettings(data_term_method, optimizer_choice, depth_interpolation_method, out_path,
+                               calibration_path, frame_path_format_string, mask_path_format_string, use_masks,
+                               field_size, offset, max_iterations, enable_warp_statistics_logging,
+                               save_initial_and_final_fields, save_frame_images,
+                               save_per_case_results_in_root_output_folder,
+                               keep_case_fields=save_tiled_good_vs_bad_case_comparison_image,
+                               depth_stack_path=frame_path if depth_stack is not None else None)
+
+    # logging: log entries of prior samples are kept when resuming
+    convergence_status_log_writer = ConvergenceStatusLogWriter(out_path, kept_entry_count=start_from_sample,
+                                                               sync_every_n_entries=5)
 
     max_case_count = 36
     good_case_sdfs = []
     bad_case_sdfs = []
 
-    save_log_every_n_runs = 5
-
     if start_from_sample == 0 and os.path.exists(os.path.join(out_path, "output_log.txt")):
         os.unlink(os.path.join(out_path, "output_log.txt"))
 
-    i_sample = 0
-
-    optimizer = None if rebuild_optimizer else \
-        build_optimizer(optimizer_choice, out_path, field_size, view_scaling_factor=8, max_iterations=max_iterations,
-                        enable_warp_statistics_logging=enable_warp_statistics_logging,
-                        data_term_method=data_term_method)
-
-    # run the optimizers
-    for canonical_frame_index, pixel_row_index, focus_x, focus_y in frame_row_and_focus_set:
-        if i_sample < start_from_sample:
-            i_sample += 1
-            continue
-
-        sampling.set_focus_coordinates(focus_x, focus_y)
-
-        live_frame_index = canonical_frame_index + 1
-        out_subpath = os.path.join(out_path, "frames {:0>6d}-{:0>6d} line {:0>3d}"
-                                   .format(canonical_frame_index, live_frame_index, pixel_row_index))
-
-        canonical_frame_path = frame_path_format_string.format(canonical_frame_index)
-        canonical_mask_path = mask_path_format_string.format(canonical_frame_index)
-        live_frame_path = frame_path_format_string.format(live_frame_index)
-        live_mask_path = mask_path_format_string.format(live_frame_index)
-
-        if save_frame_images:
-            def highlight_row_and_save_image(path_to_original, output_name, ix_row):
-                output_image = highlight_row_on_gray(
-                    rescale_depth_to_8bit(cv2.imread(path_to_original, cv2.IMREAD_UNCHANGED)), ix_row)
-                cv2.imwrite(os.path.join(out_subpath, output_name), output_image)
-
-            highlight_row_and_save_image(canonical_frame_path, "canonical_frame_rh.png", pixel_row_index)
-            highlight_row_and_save_image(live_frame_path, "live_frame_rh.png", pixel_row_index)
-
-        # Generate SDF fields
-        if use_masks:
-            dataset = MaskedImageBasedSingleFrameDataset(calibration_path, canonical_frame_path, canonical_mask_path,
-                                                         live_frame_path, live_mask_path, pixel_row_index,
-                                                         field_size, offset)
-        else:
-            dataset = ImageBasedSingleFrameDataset(calibration_path, canonical_frame_path, live_frame_path,
-                                                   pixel_row_index, field_size, offset)
-
-        live_field, canonical_field = dataset.generate_2d_sdf_fields(method=depth_interpolation_method)
-
-        if save_initial_and_final_fields:
-            save_initial_fields(canonical_field, live_field, out_subpath, view_scaling_factor)
-
-        print("{:s} OPTIMIZATION BETWEEN FRAMES {:0>6d} AND {:0>6d} ON LINE {:0>3d}{:s}"
-              .format(BOLD_LIGHT_CYAN, canonical_frame_index, live_frame_index, pixel_row_index, RESET), end="")
-
-        if rebuild_optimizer:
-            optimizer = build_optimizer(optimizer_choice, out_subpath, field_size, view_scaling_factor=8,
-                                        max_iterations=max_iterations,
-                                        enable_warp_statistics_logging=enable_warp_statistics_logging,
-                                        data_term_method=data_term_method)
-        original_live_field = live_field.copy()
-        live_field = optimizer.optimize(live_field, canonical_field)
-
-        # ===================== LOG AFTER-RUN RESULTS ==================================================================
-
-        if save_initial_and_final_fields:
-            save_final_fields(canonical_field, live_field, out_subpath, view_scaling_factor)
-
-        if optimizer_choice != OptimizerChoice.CPP:
-            # call python-specific logging routines
-            optimizer.plot_logged_sdf_and_warp_magnitudes()
-            optimizer.plot_logged_energies_and_max_warps()
+    cases = list(frame_row_and_focus_set)[start_from_sample:]
+
+    def merge_case_result(result):
+        convergence_status_log_writer.append(result.log_entry)
+        if settings.keep_case_fields:
+            case_sdfs = (result.canonical_field, result.original_live_field, result.max_warp_at)
+            if result.outcome == "CONVERGED" and len(good_case_sdfs) < max_case_count:
+                good_case_sdfs.append(case_sdfs)
+            elif result.outcome == "NOT CONVERGED" and len(bad_case_sdfs) < max_case_count:
+                bad_case_sdfs.append(case_sdfs)
+
+    # run the optimizers (the log is closed, i.e. synced, even if a case fails, so that the completed ones are kept)
+    try:
+        if worker_count > 1:
+            with Pool(processes=worker_count, initializer=initialize_worker, initargs=(settings,)) as pool:
+                # imap yields results in case order, so the recorded log always covers a contiguous range of samples
+                for result in pool.imap(run_case_in_worker, cases):
+                    print_case_header(*result.log_entry[:3])
+                    print_case_outcome(result)
+                    merge_case_result(result)
         else:
-            # call C++-specific logging routines
-            if enable_warp_statistics_logging:
-                warp_statistics = optimizer.get_warp_statistics_as_matrix()
-                root_subpath = os.path.join(out_path, "warp_statistics_frames_{:0>6d}-{:0>6d}_row_{:0>3d}.png"
-                                            .format(canonical_frame_index, live_frame_index, pixel_row_index))
-                if save_per_case_results_in_root_output_folder:
-                    plot_warp_statistics(out_subpath, warp_statistics, extra_path=root_subpath)
-                else:
-                    plot_warp_statistics(out_subpath, warp_statistics, extra_path=None)
-
-        convergence_status = optimizer.get_convergence_status()
-        max_warp_at = Point2d(convergence_status.max_warp_location.x, convergence_status.max_warp_location.y)
-        if not convergence_status.iteration_limit_reached:
-            if convergence_status.largest_warp_above_maximum_threshold:
-                print(": DIVERGED", end="")
-            else:
-                print(": CONVERGED", end="")
-
-            if (save_tiled_good_vs_bad_case_comparison_image and
-                    not convergence_status.largest_warp_above_maximum_threshold
-                    and len(good_case_sdfs) < max_case_count):
-                good_case_sdfs.append((canonical_field, original_live_field, max_warp_at))
-
-        else:
-            print(": NOT CONVERGED", end="")
-            if save_tiled_good_vs_bad_case_comparison_image and len(bad_case_sdfs) < max_case_count:
-                bad_case_sdfs.append((canonical_field, original_live_field, max_warp_at))
-        print(" IN", convergence_status.iteration_count, "ITERATIONS")
-
-        log_convergence_status(convergence_status_log, convergence_status,
-                               canonical_frame_index, live_frame_index, pixel_row_index)
-
-        if rebuild_optimizer:
-            del optimizer
-            plt.close('all')
-            gc.collect()
-
-        i_sample += 1
-
-        if i_sample % save_log_every_n_runs == 0:
-            record_convergence_status_log(convergence_status_log, convergence_status_log_file_path)
-
-    record_convergence_status_log(convergence_status_log, convergence_status_log_file_path)
-    record_cases_files(convergence_status_log, out_path)
+            optimizer = None if settings.rebuild_optimizer else settings.build_optimizer(out_path)
+            for canonical_frame_index, pixel_row_index, focus_x, focus_y in cases:
+                result = run_case(settings, canonical_frame_index, pixel_row_index, focus_x, focus_y, optimizer)
+                merge_case_result(result)
+    finally:
+        convergence_status_log_writer.close()
+
+    print(convergence_status_log_writer.get_summary())
     if save_tiled_good_vs_bad_case_comparison_image:
         if len(good_case_sdfs) > 0 and len(bad_case_sdfs) > 0:
             save_tiled_tsdf_comparison_image(os.path.join(out_path, "good_vs_bad.png"), good_case_sdfs, bad_case_sdfs)
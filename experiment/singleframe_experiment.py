@@ -29,6 +29,7 @@ from nonrigid_opt.smoothing_term import SmoothingTermMethod
 from tsdf.generation import generate_initial_orthographic_2d_tsdf_fields, GenerationMethod
 from nonrigid_opt.slavcheva_optimizer2d import SlavchevaOptimizer2d, AdaptiveLearningRateMethod, ComputeMethod
 from nonrigid_opt.sobolev_filter import generate_1d_sobolev_kernel
+from nonrigid_opt.focus_probe import FocusVoxelProbe
 from utils.visualization import visualize_and_save_initial_fields, visualize_final_fields
 from experiment import experiment_shared_routines as shared
 
@@ -113,7 +114,9 @@ def perform_single_test(depth_interpolation_method=GenerationMethod.NONE, out_pa
                                                                                strength=0.1),
                                      visualization_settings=SlavchevaVisualizer.Settings(
                                          enable_component_fields=True,
-                                         view_scaling_factor=view_scaling_factor))
+                                         view_scaling_factor=view_scaling_factor,
+                                         render_queue_size=16),
+                                     probes=[FocusVoxelProbe(detailed=True)])
 
     start_time = time.time()
     optimizer.optimize(live_field, canonical_field)
@@ -14,6 +14,8 @@
 #  limitations under the License.
 #  ================================================================
 import numpy as np
+import scipy.ndimage
+import scipy.signal
 from utils.sampling import get_focus_coordinates
 from utils.printing import *
 
@@ -26,36 +28,87 @@ sobolev_kernel_1d = np.array([2.995900285895913839e-04,
                               2.995900285895913839e-04])
 
 
-def convolve_with_kernel_y(vector_field, kernel):
-    y_convolved = np.zeros_like(vector_field)
-    for x in range(vector_field.shape[1]):
-        y_convolved[:, x, 0] = np.convolve(vector_field[:, x, 0], kernel, mode='same')
-        y_convolved[:, x, 1] = np.convolve(vector_field[:, x, 1], kernel, mode='same')
+class ConvolutionMethod:
+    DIRECT = 0  # one np.convolve call per field line & component (reference implementation)
+    SEPARABLE = 1  # one scipy.ndimage.convolve1d call per axis for the whole field
+    FFT = 2  # one FFT-based convolution per axis for the whole field, preferable for large kernels
+
+
+def convolve_along_axis_single_precision(field, kernel, axis):
+    """
+    Single-precision counterpart of scipy.ndimage.convolve1d(..., mode='constant') with np.convolve 'same'
+    alignment: accumulates shifted copies of the zero-padded field, weighted by kernel coefficients, in float32.
+    """
+    kernel = np.asarray(kernel, dtype=np.float32)
+    kernel_size = len(kernel)
+    line_length = field.shape[axis]
+    padding = [(0, 0)] * field.ndim
+    padding[axis] = (kernel_size // 2, (kernel_size - 1) // 2)
+    padded_field = np.pad(field, padding, mode='constant')
+    convolved = np.zeros(field.shape, dtype=np.float32)
+    shifted_slice = [slice(None)] * field.ndim
+    for i_shift, coefficient in enumerate(kernel[::-1]):
+        shifted_slice[axis] = slice(i_shift, i_shift + line_length)
+        convolved += padded_field[tuple(shifted_slice)] * coefficient
+    return convolved
+
+
+def convolve_along_axis(field, kernel, axis, method=ConvolutionMethod.SEPARABLE):
+    """
+    Convolve every line of the field along the specified axis with the 1D kernel, with the same boundary handling
+    (zero padding) and output alignment as np.convolve(line, kernel, mode='same')
+    :param field: field (e.g. an H x W x 2 vector field) to convolve
+    :param kernel: 1D kernel
+    :param axis: axis along which to convolve
+    :param method: convolution method to use
+    :type method: ConvolutionMethod
+    :return: convolved field (new array of the same shape & type as the input field)
+    """
+    if method == ConvolutionMethod.SEPARABLE:
+        if np.result_type(field, kernel) == np.float32:
+            # ndimage always accumulates in double precision, whereas np.convolve keeps to single precision here
+            return convolve_along_axis_single_precision(field, kernel, axis)
+        # for even kernel lengths, np.convolve 'same' output is shifted by one relative to ndimage's centering
+        origin = -1 if len(kernel) % 2 == 0 else 0
+        return scipy.ndimage.convolve1d(field, kernel, axis=axis, mode='constant', cval=0.0, origin=origin)
+    elif method == ConvolutionMethod.FFT:
+        kernel_shape = [1] * field.ndim
+        kernel_shape[axis] = len(kernel)
+        convolved = scipy.signal.fftconvolve(field, np.reshape(kernel, kernel_shape), mode='same')
+        return convolved.astype(field.dtype, copy=False)
+    elif method == ConvolutionMethod.DIRECT:
+        lines = np.moveaxis(field, axis, -1)
+        convolved = np.zeros_like(lines)
+        for index in np.ndindex(lines.shape[:-1]):
+            convolved[index] = np.convolve(lines[index], kernel, mode='same')
+        return np.moveaxis(convolved, -1, axis)
+    else:
+        raise ValueError("Unrecognized ConvolutionMethod value: " + str(method))
+
+
+# vector fields are of shape (height, width, component_count), or stacks of such along the first dimension
+VECTOR_FIELD_Y_AXIS = -3
+VECTOR_FIELD_X_AXIS = -2
+
+
+def convolve_with_kernel_y(vector_field, kernel, method=ConvolutionMethod.SEPARABLE):
+    y_convolved = convolve_along_axis(vector_field, kernel, VECTOR_FIELD_Y_AXIS, method)
     np.copyto(vector_field, y_convolved)
     return y_convolved
 
 
-def convolve_with_kernel_x(vector_field, kernel):
-    x_convolved = np.zeros_like(vector_field)
-    for y in range(vector_field.shape[0]):
-        x_convolved[y, :, 0] = np.convolve(vector_field[y, :, 0], kernel, mode='same')
-        x_convolved[y, :, 1] = np.convolve(vector_field[y, :, 1], kernel, mode='same')
+def convolve_with_kernel_x(vector_field, kernel, method=ConvolutionMethod.SEPARABLE):
+    x_convolved = convolve_along_axis(vector_field, kernel, VECTOR_FIELD_X_AXIS, method)
     np.copyto(vector_field, x_convolved)
     return x_convolved
 
 
-def convolve_with_kernel(vector_field, kernel=sobolev_kernel_1d, print_focus_coord_info=False):
-    x_convolved = np.zeros_like(vector_field)
-    y_convolved = np.zeros_like(vector_field)
+def convolve_with_kernel(vector_field, kernel=sobolev_kernel_1d, print_focus_coord_info=False,
+                         method=ConvolutionMethod.SEPARABLE):
     focus_coordinates = get_focus_coordinates()
 
-    for x in range(vector_field.shape[1]):
-        y_convolved[:, x, 0] = np.convolve(vector_field[:, x, 0], kernel, mode='same')
-        y_convolved[:, x, 1] = np.convolve(vector_field[:, x, 1], kernel, mode='same')
-
-    for y in range(vector_field.shape[0]):
-        x_convolved[y, :, 0] = np.convolve(y_convolved[y, :, 0], kernel, mode='same')
-        x_convolved[y, :, 1] = np.convolve(y_convolved[y, :, 1], kernel, mode='same')
+    y_convolved = convolve_along_axis(vector_field, kernel, VECTOR_FIELD_Y_AXIS, method)
+    x_convolved = convolve_along_axis(y_convolved, kernel, VECTOR_FIELD_X_AXIS, method)
 
     np.copyto(vector_field, x_convolved)
     if print_focus_coord_info:
@@ -65,18 +118,13 @@ def convolve_with_kernel(vector_field, kernel=sobolev_kernel_1d, print_focus_coo
     return vector_field
 
 
-def convolve_with_kernel_preserve_zeros(vector_field, kernel=sobolev_kernel_1d, print_focus_coord_info=False):
-    x_convolved = np.zeros_like(vector_field)
-    y_convolved = np.zeros_like(vector_field)
+def convolve_with_kernel_preserve_zeros(vector_field, kernel=sobolev_kernel_1d, print_focus_coord_info=False,
+                                        method=ConvolutionMethod.SEPARABLE):
     focus_coordinates = get_focus_coordinates()
     zero_check = np.abs(vector_field) < 1e-6
-    for x in range(vector_field.shape[1]):
-        y_convolved[:, x, 0] = np.convolve(vector_field[:, x, 0], kernel, mode='same')
-        y_convolved[:, x, 1] = np.convolve(vector_field[:, x, 1], kernel, mode='same')
+    y_convolved = convolve_along_axis(vector_field, kernel, VECTOR_FIELD_Y_AXIS, method)
     y_convolved[zero_check] = 0.0
-    for y in range(vector_field.shape[0]):
-        x_convolved[y, :, 0] = np.convolve(y_convolved[y, :, 0], kernel, mode='same')
-        x_convolved[y, :, 1] = np.convolve(y_convolved[y, :, 1], kernel, mode='same')
+    x_convolved = convolve_along_axis(y_convolved, kernel, VECTOR_FIELD_X_AXIS, method)
     x_convolved[zero_check] = 0.0
     np.copyto(vector_field, x_convolved)
     if print_focus_coord_info:
@@ -84,3 +132,78 @@ def convolve_with_kernel_preserve_zeros(vector_field, kernel=sobolev_kernel_1d,
         print(" H1 grad: {:s}[{:f} {:f}{:s}]".format(BOLD_GREEN, -new_gradient_at_focus[0], -new_gradient_at_focus[1],
                                                      RESET), sep='', end='')
     return vector_field
+
+
+def compute_vector_field_laplacian(vector_field, out=None, buffer=None):
+    """
+    Apply scipy.ndimage.laplace (mode 'reflect') to each component of the vector field separately, i.e. over the two
+    spatial axes only, so that stacks of vector fields are handled as well.
+    :param vector_field: vector field of shape (height, width, component_count) or a stack of such fields
+    :param out: optional array of the same shape & type as the vector field to store the result in
+    :param buffer: optional array of the same shape & type as the vector field to use for intermediate results
+    :return: laplacian of the same shape & type as the vector field
+    """
+    if out is None:
+        out = np.empty_like(vector_field)
+    if buffer is None:
+        buffer = np.empty_like(vector_field)
+    # same as scipy.ndimage.generic_laplace: second derivatives along each axis, summed in the output precision
+    scipy.ndimage.correlate1d(vector_field, [1, -2, 1], axis=VECTOR_FIELD_Y_AXIS, output=out, mode='reflect')
+    scipy.ndimage.correlate1d(vector_field, [1, -2, 1], axis=VECTOR_FIELD_X_AXIS, output=buffer, mode='reflect')
+    out += buffer
+    return out
+
+
+def convolve_along_axis_at(field, kernel, axis, y_coordinates, x_coordinates):
+    """
+    Evaluate convolve_along_axis(field, kernel, axis) (with the SEPARABLE or DIRECT method) only at the specified
+    locations. Values are accumulated the same way as in convolve_along_axis_single_precision, but in
+    np.result_type(field, kernel), so for single-precision inputs results are identical to those of the whole-field
+    convolution.
+    :param field: 2D scalar or vector field to convolve
+    :param kernel: 1D kernel
+    :param axis: axis along which to convolve, 0 (y) or 1 (x)
+    :param y_coordinates: 1D integer array with y coordinates of the locations
+    :param x_coordinates: 1D integer array with x coordinates of the locations
+    :return: array of convolved values at the locations, of shape (location count,) + field.shape[2:]
+    """
+    result_type = np.result_type(field, kernel)
+    kernel = np.asarray(kernel, dtype=result_type)
+    kernel_size = len(kernel)
+    line_length = field.shape[axis]
+    line_coordinates = y_coordinates if axis == 0 else x_coordinates
+    convolved = np.zeros(y_coordinates.shape + field.shape[2:], dtype=result_type)
+    for i_shift, coefficient in enumerate(kernel[::-1]):
+        shifted_coordinates = line_coordinates + (i_shift - kernel_size // 2)
+        out_of_bounds = (shifted_coordinates < 0) | (shifted_coordinates >= line_length)
+        shifted_coordinates = np.clip(shifted_coordinates, 0, line_length - 1)
+        if axis == 0:
+            values = field[shifted_coordinates, x_coordinates]
+        else:
+            values = field[y_coordinates, shifted_coordinates]
+        values[out_of_bounds] = 0.0
+        convolved += values * coefficient
+    return convolved
+
+
+def convolve_with_kernel_preserve_zeros_at(vector_field, kernel, y_coordinates, x_coordinates, buffer):
+    """
+    Counterpart of convolve_with_kernel_preserve_zeros that updates the vector field only at the specified locations,
+    for a vector field that is zero everywhere else. Work is proportional to the number of locations rather than to the
+    field size.
+    :param vector_field: vector field to convolve in-place
+    :param kernel: 1D kernel
+    :param y_coordinates: 1D integer array with y coordinates of the locations
+    :param x_coordinates: 1D integer array with x coordinates of the locations
+    :param buffer: scratch array of the same shape as the vector field, holding zeros everywhere except (possibly) at
+    the specified locations. Entries at the locations are overwritten.
+    :return: the vector field
+    """
+    zero_check = np.abs(vector_field[y_coordinates, x_coordinates]) < 1e-6
+    y_convolved = convolve_along_axis_at(vector_field, kernel, 0, y_coordinates, x_coordinates)
+    y_convolved[zero_check] = 0.0
+    buffer[y_coordinates, x_coordinates] = y_convolved
+    x_convolved = convolve_along_axis_at(buffer, kernel, 1, y_coordinates, x_coordinates)
+    x_convolved[zero_check] = 0.0
+    vector_field[y_coordinates, x_coordinates] = x_convolved
+    return vector_field
@@ -73,13 +73,14 @@ def sampling_convolve2d(field, kernel, x, y):
 
 
 # region ======================================= PRINTING ROUTINES =====================================================
-def print_gradient_data(live_y_minus_one, live_x_minus_one, live_y_plus_one, live_x_plus_one, central_value):
-    print()
-    print("[Grad data         ]", BOLD_BLUE, sep='')
-    print("                     ", "      {:+01.3f}".format(live_y_minus_one), sep='')
+def print_gradient_data(live_y_minus_one, live_x_minus_one, live_y_plus_one, live_x_plus_one, central_value,
+                        file=None):
+    print(file=file)
+    print("[Grad data         ]", BOLD_BLUE, sep='', file=file)
+    print("                     ", "      {:+01.3f}".format(live_y_minus_one), sep='', file=file)
     print("                     ",
-          "{:+01.3f}{:+01.3f}{:+01.3f}".format(live_x_minus_one, central_value, live_x_plus_one), sep='')
-    print("                     ", "      {:+01.3f}".format(live_y_plus_one), RESET, sep='')
+          "{:+01.3f}{:+01.3f}{:+01.3f}".format(live_x_minus_one, central_value, live_x_plus_one), sep='', file=file)
+    print("                     ", "      {:+01.3f}".format(live_y_plus_one), RESET, sep='', file=file)
 
 
 def print_gradient_data_3x3_receptive_field(field, x, y, live_y_minus_one, live_x_minus_one, live_y_plus_one,
@@ -119,7 +120,7 @@ def print_gradient_data_3x3_receptive_field(field, x, y, live_y_minus_one, live_
 # endregion
 
 # region ================================== LOCAL GRADIENTS ============================================================
-def compute_local_gradient_central_differences(field, x, y, verbose=False, use_replacement=False):
+def compute_local_gradient_central_differences(field, x, y, verbose=False, use_replacement=False, file=None):
     if use_replacement:
         current_value = sample_at(field, x, y)
         live_y_minus_one = sample_at_replacement(field, current_value, x, y - 1)
@@ -136,7 +137,7 @@ def compute_local_gradient_central_differences(field, x, y, verbose=False, use_r
 
     if verbose:
         print_gradient_data(live_y_minus_one, live_x_minus_one, live_y_plus_one, live_x_plus_one,
-                            sample_at(field, x, y))
+                            sample_at(field, x, y), file=file)
 
     return np.array([x_grad, y_grad])
 
@@ -345,7 +346,7 @@ def compute_data_term_gradient_vectorized(warped_live_field, canonical_field, li
     """
     diff = warped_live_field - canonical_field
 
-    data_gradient = np.stack((diff * live_gradient_x, diff * live_gradient_y), axis=2) * scaling_factor
+    data_gradient = np.stack((diff * live_gradient_x, diff * live_gradient_y), axis=-1) * scaling_factor
     return data_gradient
 
 
@@ -0,0 +1,125 @@
+#  ================================================================
+#  Created by agent on 10/18/26.
+#  Copyright (c) 2026 agent
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#  ================================================================
+
+# Diagnostic probes that optimizers report their per-iteration state at specific voxels to
+
+# stdlib
+import sys
+import io
+# libraries
+import numpy as np
+# local
+from utils.printing import *
+from utils.sampling import get_focus_coordinates, sample_warp
+from utils.field_resampling import get_and_print_interpolation_data
+from nonrigid_opt import data_term as dt, smoothing_term as st
+
+
+class FocusVoxelProbe:
+    """
+    Observer of the optimization at a single (focus) voxel. Optimizers notify the probes registered with them at fixed
+    points of each iteration and do no probe-related work at all when there are none registered. Probe output is
+    buffered and only written out on flush (the optimizers flush their probes at the end of each optimization).
+    """
+
+    def __init__(self, x=None, y=None, detailed=False, stream=None):
+        """
+        :param x: x coordinate of the voxel, if None, the current focus coordinates (see utils.sampling) are used
+        :param y: y coordinate of the voxel, if None, the current focus coordinates (see utils.sampling) are used
+        :param detailed: also output the inputs of the data and smoothing terms and of the interpolation at the voxel
+        :param stream: file-like object to flush the output to, if None, sys.stdout is used
+        """
+        if x is None or y is None:
+            x, y = get_focus_coordinates()
+        self.x = x
+        self.y = y
+        self.detailed = detailed
+        self.stream = stream
+        self.iteration_count = 0
+        self.__buffer = io.StringIO()
+
+    def voxel_is_within(self, field):
+        return 0 <= self.x < field.shape[1] and 0 <= self.y < field.shape[0]
+
+    def record_gradients(self, warped_live_field, canonical_field, warp_field, data_gradient,
+                         scaled_smoothing_gradient, scaled_level_set_gradient=None):
+        """
+        Record the gradients computed at the voxel (before any Sobolev smoothing)
+        :param data_gradient: data term gradient at the voxel
+        :param scaled_smoothing_gradient: smoothing term gradient at the voxel, scaled by the term weight
+        :param scaled_level_set_gradient: level set term gradient at the voxel scaled by the term weight, if the term
+        is enabled
+        """
+        print("[Iteration {:d}] Point: ".format(self.iteration_count), self.x, ",", self.y, sep='', end='',
+              file=self.__buffer)
+        if self.detailed:
+            self.__print_data_term_inputs(warped_live_field, canonical_field)
+        print(" Data grad: ", BOLD_GREEN, -data_gradient, RESET, sep='', end='', file=self.__buffer)
+        if scaled_level_set_gradient is not None:
+            print(" Level-set grad (scaled): ", BOLD_GREEN, -scaled_level_set_gradient, RESET, sep='', end='',
+                  file=self.__buffer)
+        if self.detailed:
+            self.__print_smoothing_term_inputs(warp_field)
+        print(" Smoothing grad (scaled): ", BOLD_GREEN, -scaled_smoothing_gradient, RESET, sep='', end='',
+              file=self.__buffer)
+
+    def record_sobolev_gradient(self, gradient_field):
+        """
+        Record the gradient at the voxel after Sobolev smoothing (only called when Sobolev smoothing is enabled)
+        :param gradient_field: the smoothed gradient field
+        """
+        gradient = gradient_field[self.y, self.x]
+        print(" H1 grad: {:s}[{:f} {:f}{:s}]".format(BOLD_GREEN, -gradient[0], -gradient[1], RESET), end='',
+              file=self.__buffer)
+
+    def record_warp(self, warped_live_field, canonical_field, warp_field):
+        """
+        Record the warp at the voxel, before it is used to resample the warped live field
+        """
+        warp = warp_field[self.y, self.x]
+        print(" Warp: ", BOLD_GREEN, warp, RESET, " Warp length: ", BOLD_GREEN, np.linalg.norm(warp), RESET,
+              sep='', file=self.__buffer)
+        if self.detailed:
+            get_and_print_interpolation_data(canonical_field, warped_live_field, warp_field, self.x, self.y,
+                                             file=self.__buffer)
+        self.iteration_count += 1
+
+    def __print_data_term_inputs(self, warped_live_field, canonical_field):
+        live_sdf = warped_live_field[self.y, self.x]
+        canonical_sdf = canonical_field[self.y, self.x]
+        print("; Live - canonical: {:+01.4f} - {:+01.4f} = {:+01.4f}"
+              .format(live_sdf, canonical_sdf, live_sdf - canonical_sdf), file=self.__buffer)
+        dt.compute_local_gradient_central_differences(warped_live_field, self.x, self.y, verbose=True,
+                                                      use_replacement=True, file=self.__buffer)
+
+    def __print_smoothing_term_inputs(self, warp_field):
+        warp = warp_field[self.y, self.x]
+        st.print_smoothing_term_data(sample_warp(warp_field, self.x, self.y - 1, warp),
+                                     sample_warp(warp_field, self.x - 1, self.y, warp),
+                                     sample_warp(warp_field, self.x, self.y + 1, warp),
+                                     sample_warp(warp_field, self.x + 1, self.y, warp), warp, file=self.__buffer)
+
+    def get_output(self):
+        """
+        :return: output buffered since the last flush
+        """
+        return self.__buffer.getvalue()
+
+    def flush(self):
+        stream = sys.stdout if self.stream is None else self.stream
+        stream.write(self.__buffer.getvalue())
+        stream.flush()
+        self.__buffer = io.StringIO()
@@ -18,15 +18,139 @@
 # stdlib
 # libraries
 import numpy as np
-import scipy.ndimage
 # local
-from utils.pyramid import ScalarFieldPyramid2d
-from utils import field_resampling as resampling
+from utils.pyramid import FieldPyramid, PyramidShapePolicy
+from utils.sampling import BilinearWarpSampler
+from utils.point2d import Point2d
 import utils.printing as printing
 import math_utils.convolution as convolution
 from nonrigid_opt.hns_visualizer import HNSOVisualizer
 
 
+class WarpUpsamplingMethod:
+    NEAREST = 0  # repeat each warp vector, keeping its magnitude (same as the C++ HierarchicalOptimizer)
+    BILINEAR = 1  # interpolate warp vectors bilinearly and double their magnitude to match the finer voxel size
+
+
+class HNSOLevelWorkspace:
+    """
+    Arrays used to optimize a batch of field pairs at a single level of the hierarchy, allocated once and then reused
+    by every iteration
+    """
+    # out-of-bounds replacement values for the live fields and their x & y gradients, which are resampled together
+    LIVE_STACK_REPLACEMENTS = (1.0, 0.0, 0.0)
+
+    def __init__(self, canonical_fields, live_stack, warp_fields, stagnation_window=0):
+        """
+        :param canonical_fields: canonical fields of shape (pair count, height, width)
+        :param live_stack: live fields and their x & y gradients, of shape (3, pair count, height, width)
+        :param warp_fields: warp fields of shape (pair count, height, width, 2), updated in-place by the optimization
+        :param stagnation_window: number of iterations over which energy decrease is checked, 0 if not checked
+        """
+        self.canonical_fields = canonical_fields
+        self.live_stack = live_stack
+        self.warp_fields = warp_fields
+        self.sampler = BilinearWarpSampler(warp_fields)
+        self.resampled_live_stack = np.empty_like(live_stack)
+        self.diff = np.empty(canonical_fields.shape, dtype=np.result_type(live_stack, canonical_fields))
+        self.data_gradient = np.empty(warp_fields.shape, dtype=self.diff.dtype)
+        self.tikhonov_gradient = np.empty_like(self.data_gradient)
+        # the gradient of the previous iteration is used by the tikhonov term
+        self.gradient = np.zeros_like(self.data_gradient)
+        self.vector_buffer = np.empty_like(self.data_gradient)
+        self.update_lengths = np.empty(warp_fields.shape[:-1], dtype=self.diff.dtype)
+        self.maximum_update_lengths = np.empty(warp_fields.shape[0], dtype=self.diff.dtype)
+        # data energies of each pair over the last stagnation_window + 1 iterations (ring buffer)
+        self.stagnation_window = stagnation_window
+        if stagnation_window > 0:
+            self.energy_history = np.empty((stagnation_window + 1, warp_fields.shape[0]), dtype=np.float64)
+            self.squared_diff = np.empty_like(self.diff)
+
+    def __len__(self):
+        return len(self.warp_fields)
+
+    def resample_live_stack(self):
+        self.sampler.update(self.warp_fields)
+        return self.sampler.sample_stack(self.live_stack, self.LIVE_STACK_REPLACEMENTS, out=self.resampled_live_stack)
+
+    def compute_maximum_update_lengths(self):
+        """
+        :return: maximum vector length in the current gradient of each pair, i.e. np.linalg.norm(gradient, axis=-1)
+        maximum over each field
+        """
+        np.multiply(self.gradient, self.gradient, out=self.vector_buffer)
+        np.add.reduce(self.vector_buffer, axis=-1, out=self.update_lengths)
+        np.sqrt(self.update_lengths, out=self.update_lengths)
+        return np.max(self.update_lengths.reshape(len(self), -1), axis=1, out=self.maximum_update_lengths)
+
+    def record_energies(self, iteration_index):
+        """
+        Record the data energy of each pair, 0.5 * sum((warped live - canonical)^2), computed from the current diff
+        """
+        np.multiply(self.diff, self.diff, out=self.squared_diff)
+        energies = self.energy_history[iteration_index % (self.stagnation_window + 1)]
+        np.sum(self.squared_diff.reshape(len(self), -1), axis=1, out=energies)
+        energies *= 0.5
+
+    def find_stagnated(self, iteration_index, threshold):
+        """
+        :param iteration_index: index of the last iteration for which energies were recorded
+        :param threshold: minimum energy decrease over the window, relative to the energy at the start of the window
+        :return: boolean mask of pairs whose energy has decreased by less than the threshold over the window
+        """
+        if iteration_index < self.stagnation_window:
+            return np.zeros(len(self), dtype=np.bool_)
+        window_start_energies = self.energy_history[(iteration_index + 1) % (self.stagnation_window + 1)]
+        current_energies = self.energy_history[iteration_index % (self.stagnation_window + 1)]
+        return window_start_energies - current_energies < threshold * window_start_energies
+
+    def select(self, pairs):
+        """
+        :param pairs: boolean mask of the pairs to select
+        :return: a new workspace for the selected pairs, with their warps, last gradients & energy histories
+        """
+        workspace = HNSOLevelWorkspace(self.canonical_fields[pairs], self.live_stack[:, pairs], self.warp_fields[pairs],
+                                       self.stagnation_window)
+        workspace.gradient[:] = self.gradient[pairs]
+        if self.stagnation_window > 0:
+            workspace.energy_history[:] = self.energy_history[:, pairs]
+        return workspace
+
+
+def upsample_along_axis_bilinearly(field, axis):
+    """
+    Upsample the field by a factor of two along the given axis using linear interpolation. Samples of the upsampled
+    field are centered at 1/4 & 3/4 of each source sample, source values are extended past the field boundaries.
+    """
+    size = field.shape[axis]
+    indices = np.arange(size)
+    previous_values = np.take(field, np.maximum(indices - 1, 0), axis=axis)
+    next_values = np.take(field, np.minimum(indices + 1, size - 1), axis=axis)
+    upsampled = np.stack((0.75 * field + 0.25 * previous_values, 0.75 * field + 0.25 * next_values), axis=axis + 1)
+    upsampled_shape = list(field.shape)
+    upsampled_shape[axis] *= 2
+    return upsampled.reshape(upsampled_shape)
+
+
+def upsample_warp_fields(warp_fields, out, method=WarpUpsamplingMethod.NEAREST):
+    """
+    Upsample warp fields by a factor of two in both spatial dimensions
+    :param warp_fields: warp fields of shape (pair count, height, width, 2)
+    :param out: array of shape (pair count, 2 * height, 2 * width, 2) to store the upsampled fields in
+    :param method: upsampling method
+    :type method: WarpUpsamplingMethod
+    :return: out
+    """
+    if method == WarpUpsamplingMethod.NEAREST:
+        pair_count, height, width = warp_fields.shape[:3]
+        out.reshape(pair_count, height, 2, width, 2, 2)[:] = warp_fields[:, :, np.newaxis, :, np.newaxis]
+    elif method == WarpUpsamplingMethod.BILINEAR:
+        np.multiply(upsample_along_axis_bilinearly(upsample_along_axis_bilinearly(warp_fields, 1), 2), 2.0, out=out)
+    else:
+        raise ValueError("Unrecognized WarpUpsamplingMethod value: " + str(method))
+    return out
+
+
 class HierarchicalNonrigidSLAMOptimizer2d:
     """
     An alternative approach to level sets which still optimizes on voxel-level, in theory being able to
@@ -64,7 +188,12 @@ class HierarchicalNonrigidSLAMOptimizer2d:
                  verbosity_parameters=None,
                  visualization_parameters=None,
                  tikhonov_term_enabled=True,
-                 gradient_kernel_enabled=True
+                 gradient_kernel_enabled=True,
+                 warp_upsampling_method=WarpUpsamplingMethod.NEAREST,
+                 stagnation_window=0,
+                 stagnation_threshold=0.001,
+                 pyramid_shape_policy=PyramidShapePolicy.STRICT,
+                 trace_writer=None
                  ):
 
         """
@@ -74,8 +203,22 @@ class HierarchicalNonrigidSLAMOptimizer2d:
         :param rate: rate of gradient descent (update = gradient*factor)
         :param tikhonov_strength: strength of the tikhonov (i.e. similarity-based) regularizer for the warps
         :param kernel: kernel used to convolve the gradient at each iteration
-        :param maximum_warp_update_threshold: lower threshold on the maximum vector length (after which optimization terminates)
-        :param maximum_iteration_count: top threshold on the number of iterations (after which optimization terminates)
+        :param maximum_warp_update_threshold: lower threshold on the maximum vector length (after which optimization
+        of a level terminates), either a single value or a sequence of values for each level (coarsest first)
+        :param maximum_iteration_count: top threshold on the number of iterations (after which optimization of a level
+        terminates), either a single value or a sequence of values for each level (coarsest first)
+        :param warp_upsampling_method: how warps found at each level are upsampled to initialize the next level
+        :type warp_upsampling_method: WarpUpsamplingMethod
+        :param stagnation_window: if positive, optimization of a level also terminates when the data energy decreases
+        by less than stagnation_threshold (relative to the energy at the start of the window) over this many iterations
+        :param stagnation_threshold: see stagnation_window
+        :param pyramid_shape_policy: how to handle fields whose dimensions are not divisible by maximum_chunk_size.
+        With PyramidShapePolicy.PAD, the resulting warps are cropped back to the field size; with
+        PyramidShapePolicy.CROP, the warps are zero in the cropped-away region.
+        :type pyramid_shape_policy: PyramidShapePolicy
+        :param trace_writer: writer to record the state after each iteration of optimize to, with the hierarchy level
+        as the run index and the maximum warp update as the maximum warp
+        :type trace_writer: utils.optimization_trace.OptimizationTraceWriter
         :@type verbosity_parameters: HierarchicalNonrigidSLAMOptimizer2d.VerbosityParameters
         :param verbosity_parameters: parameters for stdout verbosity during optimization
         """
@@ -98,6 +241,13 @@ class HierarchicalNonrigidSLAMOptimizer2d:
 
         self.maximum_warp_update_threshold = maximum_warp_update_threshold
         self.maximum_iteration_count = maximum_iteration_count
+        self.warp_upsampling_method = warp_upsampling_method
+        self.stagnation_window = stagnation_window
+        self.stagnation_threshold = stagnation_threshold
+        self.pyramid_shape_policy = pyramid_shape_policy
+        self.trace_writer = trace_writer
+        # traces are only recorded by optimize, not by optimize_batch
+        self.__tracing = False
         if verbosity_parameters:
             self.verbosity_parameters = verbosity_parameters
         else:
@@ -109,24 +259,69 @@ class HierarchicalNonrigidSLAMOptimizer2d:
             self.visualization_parameters = HNSOVisualizer.Parameters()
         self.visualizer = None
         self.hierarchy_level = 0
+        # iteration count of each pair at each level during the last optimization, of shape (level count, pair count)
+        self.iteration_counts = None
+
+    @staticmethod
+    def __get_level_value(value, level_count, hierarchy_level):
+        if np.isscalar(value):
+            return value
+        if len(value) != level_count:
+            raise ValueError("Expecting one value per hierarchy level ({:d}), got {:d}".format(level_count, len(value)))
+        return value[hierarchy_level]
 
     def optimize(self, canonical_field, live_field):
         field_size = canonical_field.shape[0]
+        level_count = len(self.__build_pyramid(canonical_field).levels)
 
-        live_gradient_y, live_gradient_x = np.gradient(live_field)
+        self.visualizer = HNSOVisualizer(parameters=self.visualization_parameters, field_size=field_size,
+                                         level_count=level_count)
+        self.visualizer.generate_pre_optimization_visualizations(canonical_field, live_field)
 
-        canonical_pyramid = ScalarFieldPyramid2d(canonical_field, self.maximum_chunk_size)
-        live_pyramid = ScalarFieldPyramid2d(live_field, self.maximum_chunk_size)
-        live_gradient_x_pyramid = ScalarFieldPyramid2d(live_gradient_x, self.maximum_chunk_size)
-        live_gradient_y_pyramid = ScalarFieldPyramid2d(live_gradient_y, self.maximum_chunk_size)
-        self.hierarchy_level = 0
+        self.__tracing = self.trace_writer is not None
+        warp_field = self.__optimize_pyramids(canonical_field[np.newaxis], live_field[np.newaxis])[0]
+        self.__tracing = False
+        if self.trace_writer is not None:
+            self.trace_writer.flush()
+
+        self.visualizer.generate_post_optimization_visualizations(canonical_field, live_field, warp_field)
+        self.visualizer.close()
+        del self.visualizer
+        self.visualizer = None
+        return warp_field
 
+    def optimize_batch(self, canonical_fields, live_fields):
+        """
+        Optimize a batch of canonical/live field pairs at once. All pairs are advanced in lock-step using the same
+        (broadcasted) array operations. At each hierarchy level, each pair is optimized until its own termination
+        conditions are reached, at which point it drops out of the batch for the remainder of that level. Results for
+        each pair are the same as the results of optimize for that pair. Per-iteration visualizations and traces are
+        not generated.
+        :param canonical_fields: canonical fields of equal size, stacked along the first dimension
+        :param live_fields: live fields of the same size, stacked along the first dimension
+        :return: resulting warp fields, of shape (pair count, height, width, 2)
+        """
+        if canonical_fields.shape != live_fields.shape or canonical_fields.ndim != 3:
+            raise ValueError("canonical_fields and live_fields need to be stacks of 2D fields of the same shape.")
+        return self.__optimize_pyramids(canonical_fields, live_fields)
+
+    def __build_pyramid(self, fields):
+        # the optimization never writes to the pyramid levels, so the finest level doesn't need to be a copy
+        return FieldPyramid(fields, self.maximum_chunk_size, shape_policy=self.pyramid_shape_policy,
+                            share_finest_level=True)
+
+    def __optimize_pyramids(self, canonical_fields, live_fields):
+        canonical_pyramid = self.__build_pyramid(canonical_fields)
+        live_pyramid = self.__build_pyramid(live_fields)
+        # gradients are computed after padding / cropping, so that they are consistent with the finest live level
+        live_gradient_y, live_gradient_x = np.gradient(live_pyramid.levels[-1], axis=(1, 2))
+        live_gradient_x_pyramid = self.__build_pyramid(live_gradient_x)
+        live_gradient_y_pyramid = self.__build_pyramid(live_gradient_y)
+        self.hierarchy_level = 0
         level_count = len(canonical_pyramid.levels)
-        warp_field = None
+        self.iteration_counts = np.zeros((level_count, canonical_fields.shape[0]), dtype=np.int64)
 
-        self.visualizer = HNSOVisualizer(parameters=self.visualization_parameters, field_size=field_size,
-                                         level_count=level_count)
-        self.visualizer.generate_pre_optimization_visualizations(canonical_field, live_field)
+        warp_fields = None
 
         for canonical_pyramid_level, live_pyramid_level, live_gradient_x_level, live_gradient_y_level \
                 in zip(canonical_pyramid.levels,
@@ -135,14 +330,20 @@ class HierarchicalNonrigidSLAMOptimizer2d:
                        live_gradient_y_pyramid.levels):
 
             if self.hierarchy_level == 0:
-                warp_field = np.zeros((canonical_pyramid_level.shape[0], canonical_pyramid_level.shape[1], 2),
-                                      dtype=np.float32)
-            warp_field = \
+                warp_fields = np.zeros(canonical_pyramid_level.shape + (2,), dtype=np.float32)
+            else:
+                warp_fields = upsample_warp_fields(warp_fields, out=np.empty(canonical_pyramid_level.shape + (2,),
+                                                                             dtype=np.float32),
+                                                   method=self.warp_upsampling_method)
+            maximum_warp_update_threshold = self.__get_level_value(self.maximum_warp_update_threshold, level_count,
+                                                                   self.hierarchy_level)
+            maximum_iteration_count = self.__get_level_value(self.maximum_iteration_count, level_count,
+                                                             self.hierarchy_level)
+            warp_fields = \
                 self.__optimize_level(canonical_pyramid_level, live_pyramid_level,
-                                      live_gradient_x_level, live_gradient_y_level, warp_field)
-
-            if self.hierarchy_level != level_count - 1:
-                warp_field = warp_field.repeat(2, axis=0).repeat(2, axis=1)
+                                      live_gradient_x_level, live_gradient_y_level, warp_fields,
+                                      maximum_warp_update_threshold, maximum_iteration_count,
+                                      self.iteration_counts[self.hierarchy_level])
 
             if self.verbosity_parameters.print_per_iteration_info:
                 print("%s[LEVEL %d COMPLETED]%s" % (printing.BOLD_RED, self.hierarchy_level, printing.RESET),
@@ -151,87 +352,122 @@ class HierarchicalNonrigidSLAMOptimizer2d:
                 print()
 
             self.hierarchy_level += 1
-        self.visualizer.generate_post_optimization_visualizations(canonical_field, live_field, warp_field)
-        del self.visualizer
-        return warp_field
-
-    def __termination_conditions_reached(self, maximum_warp_update, iteration_count):
-        return maximum_warp_update < self.maximum_warp_update_threshold or \
-               iteration_count >= self.maximum_iteration_count
+        return canonical_pyramid.restore_source_shape(warp_fields)
 
     def __optimize_level(self, canonical_pyramid_level, live_pyramid_level,
-                         live_gradient_x_level, live_gradient_y_level, warp_field):
-
-        maximum_warp_update_length = np.finfo(np.float32).max
+                         live_gradient_x_level, live_gradient_y_level, warp_fields,
+                         maximum_warp_update_threshold, maximum_iteration_count, iteration_counts):
+        """
+        Optimize the warp fields of a batch of field pairs at a single hierarchy level
+        :param canonical_pyramid_level: canonical fields at this level, of shape (pair count, height, width)
+        :param warp_fields: warp fields at this level, of shape (pair count, height, width, 2), updated in-place
+        :param maximum_warp_update_threshold: warp update length threshold for this level
+        :param maximum_iteration_count: iteration count threshold for this level
+        :param iteration_counts: array to store the number of iterations performed for each pair in
+        :return: the warp fields
+        """
         iteration_count = 0
 
-        gradient = np.zeros_like(warp_field)
+        # indices of the pairs that are still being optimized
+        active_pairs = np.arange(warp_fields.shape[0] if maximum_iteration_count > 0 else 0)
+
         normalized_tikhonov_energy = 0
-        data_gradient = None
         tikhonov_gradient = None
 
-        while not self.__termination_conditions_reached(maximum_warp_update_length, iteration_count):
+        # the live field and its gradients are always resampled together using the same warps
+        live_stack = np.stack((live_pyramid_level, live_gradient_x_level, live_gradient_y_level))
+        workspace = HNSOLevelWorkspace(canonical_pyramid_level, live_stack, warp_fields, self.stagnation_window)
+
+        while len(active_pairs) > 0:
             # resample the live & gradients using current warps
-            resampled_live = resampling.resample_field(live_pyramid_level, warp_field)
-            resampled_live_gradient_x = resampling.resample_field_replacement(live_gradient_x_level, warp_field, 0.0)
-            resampled_live_gradient_y = resampling.resample_field_replacement(live_gradient_y_level, warp_field, 0.0)
+            resampled_live, resampled_live_gradient_x, resampled_live_gradient_y = workspace.resample_live_stack()
 
             # see how badly our sampled values correspond to the canonical values at the same locations
             # data_gradient = (warped_live - canonical) * warped_gradient(live)
-            diff = (resampled_live - canonical_pyramid_level)
-            data_gradient_x = diff * resampled_live_gradient_x
-            data_gradient_y = diff * resampled_live_gradient_y
+            diff = np.subtract(resampled_live, workspace.canonical_fields, out=workspace.diff)
             # this results in the data term gradient
-            data_gradient = np.dstack((data_gradient_x, data_gradient_y))
+            data_gradient = workspace.data_gradient
+            np.multiply(diff, resampled_live_gradient_x, out=data_gradient[..., 0])
+            np.multiply(diff, resampled_live_gradient_y, out=data_gradient[..., 1])
+            if self.stagnation_window > 0:
+                workspace.record_energies(iteration_count)
 
+            gradient = workspace.gradient
             if self.tikhonov_term_enabled:
                 # calculate tikhonov regularizer (laplacian of the previous update)
-                laplace_u = scipy.ndimage.laplace(gradient[:, :, 0])
-                laplace_v = scipy.ndimage.laplace(gradient[:, :, 1])
-                tikhonov_gradient = np.stack((laplace_u, laplace_v), axis=2)
+                tikhonov_gradient = convolution.compute_vector_field_laplacian(gradient,
+                                                                               out=workspace.tikhonov_gradient,
+                                                                               buffer=workspace.vector_buffer)
 
                 if self.verbosity_parameters.print_iteration_tikhonov_energy:
-                    warp_gradient_u_x, warp_gradient_u_y = np.gradient(gradient[:, :, 0])
-                    warp_gradient_v_x, warp_gradient_v_y = np.gradient(gradient[:, :, 1])
+                    warp_gradient_u_x, warp_gradient_u_y = np.gradient(gradient[..., 0], axis=(1, 2))
+                    warp_gradient_v_x, warp_gradient_v_y = np.gradient(gradient[..., 1], axis=(1, 2))
                     gradient_aggregate = \
                         warp_gradient_u_x ** 2 + warp_gradient_v_x ** 2 + \
                         warp_gradient_u_y ** 2 + warp_gradient_v_y ** 2
                     normalized_tikhonov_energy = 1000000 * 0.5 * gradient_aggregate.mean()
 
-                gradient = self.data_term_amplifier * data_gradient - self.tikhonov_strength * tikhonov_gradient
+                np.multiply(data_gradient, self.data_term_amplifier, out=gradient)
+                gradient -= np.multiply(tikhonov_gradient, self.tikhonov_strength, out=workspace.vector_buffer)
             else:
-                gradient = self.data_term_amplifier * data_gradient
+                np.multiply(data_gradient, self.data_term_amplifier, out=gradient)
 
             if self.gradient_kernel_enabled:
                 convolution.convolve_with_kernel(gradient, self.gradient_kernel)
 
             # apply gradient-based update to existing warps
-            warp_field -= self.rate * gradient
+            workspace.warp_fields -= np.multiply(gradient, self.rate, out=workspace.vector_buffer)
 
             # perform termination condition updates
-            update_lengths = np.linalg.norm(gradient, axis=2)
-            max_at = np.unravel_index(np.argmax(update_lengths), update_lengths.shape)
-            maximum_warp_update_length = update_lengths[max_at]
+            maximum_warp_update_lengths = workspace.compute_maximum_update_lengths()
 
             # print output to stdout / log
             if self.verbosity_parameters.print_per_iteration_info:
                 print("%s[ITERATION %d COMPLETED]%s" % (printing.BOLD_LIGHT_CYAN, iteration_count, printing.RESET),
                       end="")
                 if self.verbosity_parameters.print_max_warp_update:
-                    print(" max upd. l.: %f" % maximum_warp_update_length, end="")
+                    print(" max upd. l.: %f" % maximum_warp_update_lengths.max(), end="")
                 if self.verbosity_parameters.print_iteration_data_energy:
                     normalized_data_energy = 1000000 * (diff ** 2).mean()
                     print(" norm. data energy: %f" % normalized_data_energy, end="")
                 if self.verbosity_parameters.print_iteration_tikhonov_energy and self.tikhonov_term_enabled:
                     print(" norm. tikhonov energy: %f" % normalized_tikhonov_energy, end="")
                 print()
-            inverse_tikhonov_gradient = None if tikhonov_gradient is None else -tikhonov_gradient
 
             # save & show per-iteration visualizations
-            self.visualizer.generate_per_iteration_visualizations(self.hierarchy_level, iteration_count,
-                                                                  canonical_pyramid_level, resampled_live,
-                                                                  warp_field, data_gradient=data_gradient,
-                                                                  inverse_tikhonov_gradient=inverse_tikhonov_gradient)
+            if self.visualizer is not None:
+                inverse_tikhonov_gradient = None if tikhonov_gradient is None else -tikhonov_gradient[0]
+                energy = 0.5 * np.vdot(diff[0], diff[0]) if self.visualizer.energy_needed else None
+                self.visualizer.generate_per_iteration_visualizations(self.hierarchy_level, iteration_count,
+                                                                      workspace.canonical_fields[0],
+                                                                      resampled_live[0], workspace.warp_fields[0],
+                                                                      data_gradient=data_gradient[0],
+                                                                      inverse_tikhonov_gradient=
+                                                                      inverse_tikhonov_gradient,
+                                                                      energy=energy)
+            if self.__tracing:
+                self.__record_trace(iteration_count, workspace, maximum_warp_update_lengths)
+            # drop the pairs that are done from the batch
+            finished = np.logical_or(maximum_warp_update_lengths < maximum_warp_update_threshold,
+                                     iteration_count + 1 >= maximum_iteration_count)
+            if self.stagnation_window > 0:
+                finished |= workspace.find_stagnated(iteration_count, self.stagnation_threshold)
             iteration_count += 1
-
-        return warp_field
+            if np.any(finished):
+                warp_fields[active_pairs[finished]] = workspace.warp_fields[finished]
+                iteration_counts[active_pairs[finished]] = iteration_count
+                remaining = np.logical_not(finished)
+                active_pairs = active_pairs[remaining]
+                if len(active_pairs) > 0:
+                    workspace = workspace.select(remaining)
+
+        return warp_fields
+
+    def __record_trace(self, iteration_count, workspace, maximum_warp_update_lengths):
+        # workspace.update_lengths holds the update lengths computed for maximum_warp_update_lengths
+        maximum_warp_update_y, maximum_warp_update_x = \
+            np.unravel_index(np.argmax(workspace.update_lengths[0]), workspace.update_lengths.shape[1:])
+        self.trace_writer.record(self.hierarchy_level, iteration_count, float(maximum_warp_update_lengths[0]),
+                                 Point2d(int(maximum_warp_update_x), int(maximum_warp_update_y)),
+                                 data_energy=0.5 * np.vdot(workspace.diff[0], workspace.diff[0]),
+                                 warp_field=workspace.warp_fields[0], gradient_field=workspace.gradient[0])
@@ -24,6 +24,7 @@ import os
 import cv2
 # local
 import utils.visualization as viz
+from utils.visualization_queue import VisualizationQueue, FullQueuePolicy, VisualizationScheduleMode
 
 
 class HNSOVisualizer:
@@ -35,7 +36,10 @@ class HNSOVisualizer:
                      save_final_fields=False,
                      save_warp_field_progression=False,
                      save_data_gradients=False,
-                     save_tikhonov_gradients=False):
+                     save_tikhonov_gradients=False,
+                     render_queue_size=0,
+                     render_queue_full_policy=FullQueuePolicy.BLOCK,
+                     visualization_schedule=None):
             self.out_path = out_path
             self.view_scaling_factor = view_scaling_fator
             self.show_live_progress = show_live_progression
@@ -46,6 +50,11 @@ class HNSOVisualizer:
             self.save_warp_field_progression = save_warp_field_progression
             self.save_data_gradients = save_data_gradients
             self.save_tikhonov_gradients = save_tikhonov_gradients
+            # if positive, frames are rendered & encoded in the background, with up to this many iterations queued
+            self.render_queue_size = render_queue_size
+            self.render_queue_full_policy = render_queue_full_policy
+            # which iterations of each level to visualize (see utils.visualization_queue.VisualizationSchedule)
+            self.visualization_schedule = visualization_schedule
             self.using_output_folder = self.save_final_fields or \
                                        self.save_initial_fields or \
                                        self.save_live_field_progression or \
@@ -59,6 +68,9 @@ class HNSOVisualizer:
         self.level_count = level_count
         if not parameters:
             self.parameters = HNSOVisualizer.Parameters()
+        self.render_queue = VisualizationQueue(self.parameters.render_queue_size,
+                                               self.parameters.render_queue_full_policy,
+                                               self.parameters.visualization_schedule)
         # initialize video-writers
         self.live_progression_writer = None
         self.warp_video_writer2D = None
@@ -90,50 +102,77 @@ class HNSOVisualizer:
                 os.path.join(self.parameters.out_path, 'tikhonov_gradient_2D_quiverplot.mkv'),
                 cv2.VideoWriter_fourcc('X', '2', '6', '4'), 10, (1920, 1200), isColor=True)
 
+    @property
+    def energy_needed(self):
+        """
+        Whether energies have to be passed to generate_per_iteration_visualizations
+        """
+        return self.render_queue.schedule.mode == VisualizationScheduleMode.ON_ENERGY_CHANGE
+
     def generate_pre_optimization_visualizations(self, canonical_field, live_field):
         if self.parameters.save_initial_fields:
             viz.save_initial_fields(canonical_field, live_field, self.parameters.out_path,
                                     self.parameters.view_scaling_factor)
 
     def generate_post_optimization_visualizations(self, canonical_field, live_field, warp_field):
+        self.render_queue.flush()
         if self.parameters.save_final_fields:
             viz.save_final_fields(canonical_field, live_field, self.parameters.out_path,
                                   self.parameters.view_scaling_factor)
 
     def generate_per_iteration_visualizations(self, hierarchy_level_index, iteration_number,
                                               canonical_field, live_field, warp_field,
-                                              data_gradient=None, inverse_tikhonov_gradient=None):
+                                              data_gradient=None, inverse_tikhonov_gradient=None, energy=None):
+        if self.parameters.save_tikhonov_gradients and inverse_tikhonov_gradient is None:
+            raise ValueError("Expected a numpy array for inverse_tikhonov_gradient, got None. "
+                             "Is Tikhonov term enabled for the calling optimizer?")
+        # all frames of the iteration are rendered by a single task, so that the videos stay in sync even if some
+        # iterations get dropped
+        self.render_queue.submit_iteration(hierarchy_level_index, iteration_number, energy,
+                                           self.__write_per_iteration_visualizations, hierarchy_level_index,
+                                           iteration_number, live_field, warp_field, data_gradient,
+                                           inverse_tikhonov_gradient)
+
+    def __write_per_iteration_visualizations(self, hierarchy_level_index, iteration_number, live_field, warp_field,
+                                             data_gradient, inverse_tikhonov_gradient):
         level_scaling = 2 ** (self.level_count - hierarchy_level_index - 1)
         if self.parameters.save_live_field_progression:
             live_field_out = viz.sdf_field_to_image(live_field, self.parameters.view_scaling_factor * level_scaling)
             self.live_progression_writer.write(live_field_out)
 
+        # vector fields of coarser levels are plotted at their native resolution, the plot fills the whole frame
         if self.parameters.save_warp_field_progression:
-            upscaled_warp_field = warp_field.repeat(level_scaling, axis=0).repeat(level_scaling, axis=1)
             self.warp_video_writer2D.write(
-                viz.make_vector_field_plot(upscaled_warp_field, scale=1.0, iteration_number=iteration_number,
+                viz.make_vector_field_plot(warp_field, scale=1.0, iteration_number=iteration_number,
                                            vectors_name="Warp vectors"))
         if self.parameters.save_data_gradients:
-            upscaled_data_gradient = data_gradient.repeat(level_scaling, axis=0).repeat(level_scaling, axis=1)
             self.data_gradient_video_writer2D.write(
-                viz.make_vector_field_plot(upscaled_data_gradient, scale=10.0, iteration_number=iteration_number,
+                viz.make_vector_field_plot(data_gradient, scale=10.0, iteration_number=iteration_number,
                                            vectors_name="Data gradient (10X magnitude)"))
         if self.parameters.save_tikhonov_gradients:
-            if inverse_tikhonov_gradient is None:
-                raise ValueError("Expected a numpy array for inverse_tikhonov_gradient, got None. "
-                                 "Is Tikhonov term enabled for the calling optimizer?")
-            upscaled_tikhonov_gradient = \
-                inverse_tikhonov_gradient.repeat(level_scaling, axis=0).repeat(level_scaling, axis=1)
             self.tikhonov_gradient_video_writer2D.write(
-                viz.make_vector_field_plot(upscaled_tikhonov_gradient, scale=10.0, iteration_number=iteration_number,
+                viz.make_vector_field_plot(inverse_tikhonov_gradient, scale=10.0, iteration_number=iteration_number,
                                            vectors_name="Inverse tikhonov gradient (10X magnitude)"))
 
+    def close(self):
+        """
+        Finish writing all submitted frames and release the video writers
+        """
+        if self.render_queue is None:
+            return
+        render_queue = self.render_queue
+        self.render_queue = None
+        try:
+            render_queue.close()
+        finally:
+            if self.live_progression_writer:
+                self.live_progression_writer.release()
+            if self.warp_video_writer2D:
+                self.warp_video_writer2D.release()
+            if self.data_gradient_video_writer2D:
+                self.data_gradient_video_writer2D.release()
+            if self.tikhonov_gradient_video_writer2D:
+                self.tikhonov_gradient_video_writer2D.release()
+
     def __del__(self):
-        if self.live_progression_writer:
-            self.live_progression_writer.release()
-        if self.warp_video_writer2D:
-            self.warp_video_writer2D.release()
-        if self.data_gradient_video_writer2D:
-            self.data_gradient_video_writer2D.release()
-        if self.tikhonov_gradient_video_writer2D:
-            self.tikhonov_gradient_video_writer2D.release()
+        self.close()
@@ -0,0 +1,126 @@
+#  ================================================================
+#  Created by agent on 10/18/26.
+#  Copyright (c) 2026 agent
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#  ================================================================
+
+# Sparse (active-set) evaluation of the optimization terms within the narrow band union of the live & canonical fields
+
+# libraries
+import numpy as np
+
+
+def __get_neighbor_coordinates(coordinates, size):
+    # neighbors beyond the field boundary are replaced with the voxel itself
+    return np.maximum(coordinates - 1, 0), np.minimum(coordinates + 1, size - 1)
+
+
+def compute_gradient_at(field, y_coordinates, x_coordinates):
+    """
+    Evaluate np.gradient(field) (over the first two axes) only at the specified locations, i.e. compute central
+    differences in the interior and one-sided first-order differences at the boundaries.
+    :param field: 2D scalar or vector field
+    :param y_coordinates: 1D integer array with y coordinates of the locations
+    :param x_coordinates: 1D integer array with x coordinates of the locations
+    :return: y and x components of the gradient at the locations, as arrays of shape
+    (location count,) + field.shape[2:]
+    """
+    height, width = field.shape[:2]
+    extra_dimensions = (1,) * (field.ndim - 2)
+    y_minus_one, y_plus_one = __get_neighbor_coordinates(y_coordinates, height)
+    x_minus_one, x_plus_one = __get_neighbor_coordinates(x_coordinates, width)
+    y_spans = (y_plus_one - y_minus_one).astype(field.dtype).reshape(y_coordinates.shape + extra_dimensions)
+    x_spans = (x_plus_one - x_minus_one).astype(field.dtype).reshape(x_coordinates.shape + extra_dimensions)
+    gradient_y = (field[y_plus_one, x_coordinates] - field[y_minus_one, x_coordinates]) / y_spans
+    gradient_x = (field[y_coordinates, x_plus_one] - field[y_coordinates, x_minus_one]) / x_spans
+    return gradient_y, gradient_x
+
+
+def compute_laplacian_at(field, y_coordinates, x_coordinates):
+    """
+    Evaluate scipy.ndimage.laplace (mode 'reflect') of each component of the field only at the specified locations.
+    Like scipy.ndimage, computes second derivatives along each axis in double precision, then sums them up in the
+    precision of the field.
+    :param field: 2D scalar or vector field
+    :param y_coordinates: 1D integer array with y coordinates of the locations
+    :param x_coordinates: 1D integer array with x coordinates of the locations
+    :return: laplacian at the locations, as an array of shape (location count,) + field.shape[2:]
+    """
+    height, width = field.shape[:2]
+    y_minus_one, y_plus_one = __get_neighbor_coordinates(y_coordinates, height)
+    x_minus_one, x_plus_one = __get_neighbor_coordinates(x_coordinates, width)
+    center_term = field[y_coordinates, x_coordinates].astype(np.float64) * -2.0
+    second_derivative_y = center_term + (field[y_minus_one, x_coordinates].astype(np.float64) +
+                                         field[y_plus_one, x_coordinates].astype(np.float64))
+    second_derivative_x = center_term + (field[y_coordinates, x_minus_one].astype(np.float64) +
+                                         field[y_coordinates, x_plus_one].astype(np.float64))
+    return second_derivative_y.astype(field.dtype) + second_derivative_x.astype(field.dtype)
+
+
+def find_narrow_band_union(warped_live_field, canonical_field):
+    """
+    :return: boolean mask of voxels within the narrow band union (where either the live or the canonical value is not
+    truncated), the complement of what set_zeros_for_values_outside_narrow_band_union nullifies
+    """
+    return np.logical_not(np.logical_and(np.abs(warped_live_field) == 1.0, np.abs(canonical_field) == 1.0))
+
+
+class NarrowBandActiveSet:
+    """
+    Coordinates of all voxels within the narrow band union of the warped live & canonical fields, in row-major order.
+    Optimization terms need to be evaluated only at these voxels: outside of the band, gradients are nullified, so
+    warps stay zero and the warped live field never changes there. The band therefore never grows, and updating it
+    after each iteration only requires re-checking the voxels that are already in it.
+    """
+
+    def __init__(self, warped_live_field, canonical_field):
+        self.shape = warped_live_field.shape
+        self.y_coordinates, self.x_coordinates = \
+            np.nonzero(find_narrow_band_union(warped_live_field, canonical_field))
+
+    def __len__(self):
+        return len(self.y_coordinates)
+
+    @property
+    def coordinates(self):
+        return self.y_coordinates, self.x_coordinates
+
+    @property
+    def band_fraction(self):
+        return len(self) / (self.shape[0] * self.shape[1])
+
+    def update(self, warped_live_field, canonical_field):
+        """
+        Drop voxels that have left the narrow band union since the last update
+        :return: coordinates (y, x) of the dropped voxels
+        """
+        still_in_band = find_narrow_band_union(warped_live_field[self.y_coordinates, self.x_coordinates],
+                                               canonical_field[self.y_coordinates, self.x_coordinates])
+        removed_coordinates = (self.y_coordinates[~still_in_band], self.x_coordinates[~still_in_band])
+        if len(removed_coordinates[0]) > 0:
+            self.y_coordinates = self.y_coordinates[still_in_band]
+            self.x_coordinates = self.x_coordinates[still_in_band]
+        return removed_coordinates
+
+    def find(self, x, y):
+        """
+        :return: index of the voxel at (x, y) within the band, or None if the voxel is not in the band
+        """
+        indices = np.flatnonzero((self.y_coordinates == y) & (self.x_coordinates == x))
+        return indices[0] if len(indices) > 0 else None
+
+    def gather(self, field):
+        return field[self.y_coordinates, self.x_coordinates]
+
+    def scatter(self, field, values):
+        field[self.y_coordinates, self.x_coordinates] = values
@@ -22,7 +22,7 @@ from inspect import currentframe, getframeinfo
 import numpy as np
 import os.path
 
-from math_utils.convolution import convolve_with_kernel_preserve_zeros
+from math_utils.convolution import convolve_with_kernel_preserve_zeros, convolve_with_kernel_preserve_zeros_at
 
 # local
 from utils.tsdf_set_routines import set_zeros_for_values_outside_narrow_band_union, voxel_is_outside_narrow_band_union
@@ -30,11 +30,14 @@ from utils.visualization import visualize_and_save_sdf_and_warp_magnitude_progre
     visualzie_and_save_energy_and_max_warp_progression
 from utils.point2d import Point2d
 from utils.printing import *
-from utils.sampling import focus_coordinates_match, get_focus_coordinates
+from utils.sampling import get_focus_coordinates
 from utils.tsdf_set_routines import value_outside_narrow_band
-from utils.field_resampling import resample_warped_live, get_and_print_interpolation_data
+from utils.field_resampling import resample_warped_live
+from utils.sampling import BilinearWarpSampler
 from nonrigid_opt.level_set_term import level_set_term_at_location
 from nonrigid_opt import slavcheva_visualizer as viz, data_term as dt, smoothing_term as st
+from nonrigid_opt.narrow_band import NarrowBandActiveSet, find_narrow_band_union, compute_gradient_at, \
+    compute_laplacian_at
 
 # C++ extension
 import level_set_fusion_optimization as cpp_extension
@@ -67,6 +70,8 @@ class OptimizationLog:
 class ComputeMethod(Enum):
     DIRECT = 0
     VECTORIZED = 1
+    # same as VECTORIZED, but evaluates everything only within the narrow band union, see NarrowBandActiveSet
+    VECTORIZED_ACTIVE_SET = 2
 
 
 class SlavchevaOptimizer2d:
@@ -98,7 +103,12 @@ class SlavchevaOptimizer2d:
 
                  sobolev_kernel=None,
                  visualization_settings=None,
-                 enable_convergence_status_logging=True
+                 enable_convergence_status_logging=True,
+                 # list of FocusVoxelProbe objects to report the state at specific voxels to during the optimization,
+                 # no per-voxel diagnostics are collected or printed when empty
+                 probes=None,
+                 # OptimizationTraceWriter to record the state after each iteration of optimize to
+                 trace_writer=None
                  ):
 
         if visualization_settings:
@@ -148,10 +158,17 @@ class SlavchevaOptimizer2d:
         self.focus_neighborhood_log = None
         self.log = None
         self.enable_convergence_status_logging = enable_convergence_status_logging
+        self.probes = list(probes) if probes is not None else []
+        self.trace_writer = trace_writer
 
         self.gradient_field = None
+        # narrow band union tracking for ComputeMethod.VECTORIZED_ACTIVE_SET
+        self.active_set = None
+        self.convolution_buffer = None
         # adaptive learning rate
         self.edasg_field = None
+        # per-pair results of optimize_batch
+        self.batch_convergence_statuses = None
 
     @staticmethod
     def __run_checks(warped_live_field, canonical_field, warp_field):
@@ -189,37 +206,22 @@ class SlavchevaOptimizer2d:
         if band_union_only:
             set_zeros_for_values_outside_narrow_band_union(warped_live_field, canonical_field, self.gradient_field)
 
-        # *** Print information at focus voxel
-        focus_x, focus_y = get_focus_coordinates()
-        focus = (focus_y, focus_x)
-        print("Point: ", focus_x, ",", focus_y, sep='', end='')
-        dt.compute_local_data_term(warped_live_field, canonical_field, focus_x, focus_y, live_gradient_x,
-                                   live_gradient_y, method=dt.DataTermMethod.BASIC)
-        focus_data_gradient = data_gradient_field[focus]
-        print(" Data grad: ", BOLD_GREEN, -focus_data_gradient, RESET, sep='', end='')
-
-        st.compute_local_smoothing_term_gradient(warp_field, focus_x, focus_y, method=self.smoothing_term_method,
-                                                 copy_if_zero=False,
-                                                 isomorphic_enforcement_factor=self.isomorphic_enforcement_factor)
-        focus_smoothing_gradient = smoothing_gradient_field[focus] * self.smoothing_term_weight
-        print(" Smoothing grad (scaled): ", BOLD_GREEN,
-              -focus_smoothing_gradient, RESET, sep='', end='')
-
-        # ***
+        for probe in self.probes:
+            if probe.voxel_is_within(warped_live_field):
+                probe.record_gradients(warped_live_field, canonical_field, warp_field,
+                                       data_gradient_field[probe.y, probe.x],
+                                       smoothing_gradient_field[probe.y, probe.x] * self.smoothing_term_weight)
+
         if self.sobolev_smoothing_enabled:
-            convolve_with_kernel_preserve_zeros(self.gradient_field, self.sobolev_kernel, True)
+            convolve_with_kernel_preserve_zeros(self.gradient_field, self.sobolev_kernel)
+            self.__record_probe_sobolev_gradients(warped_live_field)
 
         np.copyto(warp_field, -self.gradient_field * self.gradient_descent_rate)
         warp_lengths = np.linalg.norm(warp_field, axis=2)
         maximum_warp_length_at = np.unravel_index(np.argmax(warp_lengths), warp_lengths.shape)
         maximum_warp_length = warp_lengths[maximum_warp_length_at]
 
-        # ***
-        print(" Warp: ", BOLD_GREEN, warp_field[focus], RESET, " Warp length: ", BOLD_GREEN,
-              np.linalg.norm(warp_field[focus]), RESET, sep='')
-        # ***
-
-        get_and_print_interpolation_data(canonical_field, warped_live_field, warp_field, focus_x, focus_y)
+        self.__record_probe_warps(warped_live_field, canonical_field, warp_field)
 
         u_vectors = warp_field[:, :, 0].copy()
         v_vectors = warp_field[:, :, 1].copy()
@@ -235,6 +237,82 @@ class SlavchevaOptimizer2d:
 
         return maximum_warp_length, Point2d(maximum_warp_length_at[1], maximum_warp_length_at[0])
 
+    def __optimization_iteration_vectorized_active_set(self, warped_live_field, canonical_field, warp_field):
+        active_set = self.active_set
+        # voxels that left the band last iteration now get zero gradients & warps, as in the full-grid version
+        removed_coordinates = active_set.update(warped_live_field, canonical_field)
+        for field in (self.gradient_field, warp_field, self.convolution_buffer):
+            field[removed_coordinates] = 0.0
+        band_coordinates = active_set.coordinates
+
+        live_gradient_y, live_gradient_x = compute_gradient_at(warped_live_field, *band_coordinates)
+        band_live = active_set.gather(warped_live_field)
+        band_canonical = active_set.gather(canonical_field)
+        data_gradient = dt.compute_data_term_gradient_vectorized(band_live, band_canonical,
+                                                                 live_gradient_x, live_gradient_y)
+        self.total_data_energy = dt.compute_data_term_energy_contribution(band_live, band_canonical,
+                                                                          band_union_only=False) * self.data_term_weight
+        smoothing_gradient = -compute_laplacian_at(warp_field, *band_coordinates)
+        warp_gradient_y, warp_gradient_x = compute_gradient_at(warp_field, *band_coordinates)
+        gradient_aggregate = warp_gradient_y[:, 0] ** 2 + warp_gradient_y[:, 1] ** 2 + \
+                             warp_gradient_x[:, 0] ** 2 + warp_gradient_x[:, 1] ** 2
+        self.total_smoothing_energy = 0.5 * np.sum(gradient_aggregate) * self.smoothing_term_weight
+
+        if self.visualizer.data_component_field is not None:
+            self.visualizer.data_component_field.fill(0.0)
+            active_set.scatter(self.visualizer.data_component_field, data_gradient)
+        if self.visualizer.smoothing_component_field is not None:
+            # smoothing gradients bleed out of the band by one voxel, so the full-grid version is used here
+            np.copyto(self.visualizer.smoothing_component_field,
+                      st.compute_smoothing_term_gradient_vectorized(warp_field))
+        if self.visualizer.level_set_component_field is not None:
+            frame_info = getframeinfo(currentframe())
+            print("Warning: level set term not implemented in vectorized version, "
+                  "passed level_set_component_field is not None, {:s} : {:d}".format(frame_info.filename,
+                                                                                     frame_info.lineno))
+
+        gradient = self.data_term_weight * data_gradient + self.smoothing_term_weight * smoothing_gradient
+        active_set.scatter(self.gradient_field, gradient)
+
+        for probe in self.probes:
+            if probe.voxel_is_within(warped_live_field):
+                band_index = active_set.find(probe.x, probe.y)
+                if band_index is None:
+                    probe.record_gradients(warped_live_field, canonical_field, warp_field, np.zeros(2), np.zeros(2))
+                else:
+                    probe.record_gradients(warped_live_field, canonical_field, warp_field, data_gradient[band_index],
+                                           smoothing_gradient[band_index] * self.smoothing_term_weight)
+
+        if self.sobolev_smoothing_enabled:
+            convolve_with_kernel_preserve_zeros_at(self.gradient_field, self.sobolev_kernel, *band_coordinates,
+                                                   self.convolution_buffer)
+            self.__record_probe_sobolev_gradients(warped_live_field)
+
+        band_warps = -active_set.gather(self.gradient_field) * self.gradient_descent_rate
+        active_set.scatter(warp_field, band_warps)
+        warp_lengths = np.linalg.norm(band_warps, axis=1)
+        if len(warp_lengths) > 0 and np.max(warp_lengths) > 0.0:
+            maximum_warp_length_index = np.argmax(warp_lengths)
+            maximum_warp_length = warp_lengths[maximum_warp_length_index]
+            maximum_warp_length_at = Point2d(band_coordinates[1][maximum_warp_length_index],
+                                             band_coordinates[0][maximum_warp_length_index])
+        else:
+            # all warps are zero, report the first voxel like the full-grid version does
+            maximum_warp_length = warp_field.dtype.type(0.0)
+            maximum_warp_length_at = Point2d(0, 0)
+
+        self.__record_probe_warps(warped_live_field, canonical_field, warp_field)
+
+        # resample the band, equivalent to resample_warped_live(..., band_union_only=False, known_values_only=False,
+        # substitute_original=False): voxels outside of the band have zero warps and their values stay as they are
+        new_band_live = BilinearWarpSampler(warp_field, band_coordinates).sample(warped_live_field, replacement=1.0)
+        truncated = 1.0 - np.abs(new_band_live) < 1e-6
+        new_band_live[truncated] = np.sign(new_band_live[truncated])
+        warp_field[band_coordinates[0][truncated], band_coordinates[1][truncated]] = 0.0
+        active_set.scatter(warped_live_field, new_band_live)
+
+        return maximum_warp_length, maximum_warp_length_at
+
     def __optimization_iteration_direct(self, warped_live_field, canonical_field, warp_field,
                                         data_component_field=None, smoothing_component_field=None,
                                         level_set_component_field=None, band_union_only=True):
@@ -247,11 +325,10 @@ class SlavchevaOptimizer2d:
 
         live_gradient_y, live_gradient_x = np.gradient(warped_live_field)
 
+        probes_by_voxel = {(probe.x, probe.y): probe for probe in self.probes}
+
         for y in range(0, field_size):
             for x in range(0, field_size):
-                if focus_coordinates_match(x, y):
-                    print("Point: ", x, ",", y, sep='', end='')
-
                 gradient = 0.0
 
                 live_sdf = warped_live_field[y, x]
@@ -259,6 +336,9 @@ class SlavchevaOptimizer2d:
                 live_is_truncated = value_outside_narrow_band(live_sdf)
 
                 if band_union_only and voxel_is_outside_narrow_band_union(warped_live_field, canonical_field, x, y):
+                    if (x, y) in probes_by_voxel:
+                        probes_by_voxel[(x, y)].record_gradients(warped_live_field, canonical_field, warp_field,
+                                                                 np.zeros(2), np.zeros(2))
                     continue
 
                 data_gradient, local_data_energy = \
@@ -267,10 +347,9 @@ class SlavchevaOptimizer2d:
                 scaled_data_gradient = self.data_term_weight * data_gradient
                 self.total_data_energy += self.data_term_weight * local_data_energy
                 gradient += scaled_data_gradient
-                if focus_coordinates_match(x, y):
-                    print(" Data grad: ", BOLD_GREEN, -data_gradient, RESET, sep='', end='')
                 if data_component_field is not None:
                     data_component_field[y, x] = data_gradient
+                scaled_level_set_gradient = None
                 if self.level_set_term_enabled and not live_is_truncated:
                     level_set_gradient, local_level_set_energy = \
                         level_set_term_at_location(warped_live_field, x, y)
@@ -279,9 +358,6 @@ class SlavchevaOptimizer2d:
                     gradient += scaled_level_set_gradient
                     if level_set_component_field is not None:
                         level_set_component_field[y, x] = level_set_gradient
-                    if focus_coordinates_match(x, y):
-                        print(" Level-set grad (scaled): ", BOLD_GREEN,
-                              -scaled_level_set_gradient, RESET, sep='', end='')
 
                 smoothing_gradient, local_smoothing_energy = \
                     st.compute_local_smoothing_term_gradient(warp_field, x, y, method=self.smoothing_term_method,
@@ -293,14 +369,16 @@ class SlavchevaOptimizer2d:
                 gradient += scaled_smoothing_gradient
                 if smoothing_component_field is not None:
                     smoothing_component_field[y, x] = smoothing_gradient
-                if focus_coordinates_match(x, y):
-                    print(" Smoothing grad (scaled): ", BOLD_GREEN,
-                          -scaled_smoothing_gradient, RESET, sep='', end='')
+                if (x, y) in probes_by_voxel:
+                    probes_by_voxel[(x, y)].record_gradients(warped_live_field, canonical_field, warp_field,
+                                                             data_gradient, scaled_smoothing_gradient,
+                                                             scaled_level_set_gradient)
 
                 self.gradient_field[y, x] = gradient
 
         if self.sobolev_smoothing_enabled:
-            convolve_with_kernel_preserve_zeros(self.gradient_field, self.sobolev_kernel, True)
+            convolve_with_kernel_preserve_zeros(self.gradient_field, self.sobolev_kernel)
+            self.__record_probe_sobolev_gradients(warped_live_field)
 
         max_warp = 0.0
         max_warp_location = -1
@@ -309,9 +387,6 @@ class SlavchevaOptimizer2d:
         for y in range(0, field_size):
             for x in range(0, field_size):
                 warp_field[y, x] = -self.gradient_field[y, x] * self.gradient_descent_rate
-                if focus_coordinates_match(x, y):
-                    print(" Warp: ", BOLD_GREEN, warp_field[y, x], RESET, " Warp length: ", BOLD_GREEN,
-                          np.linalg.norm(warp_field[y, x]), RESET, sep='')
                 warp_length = np.linalg.norm(warp_field[y, x])
                 if warp_length > max_warp:
                     max_warp = warp_length
@@ -321,6 +396,8 @@ class SlavchevaOptimizer2d:
                     log.warp_magnitudes.append(warp_length)
                     log.sdf_values.append(warped_live_field[y, x])
 
+        self.__record_probe_warps(warped_live_field, canonical_field, warp_field)
+
         new_warped_live_field = resample_warped_live(canonical_field, warped_live_field, warp_field,
                                                      self.gradient_field,
                                                      band_union_only=False, known_values_only=False,
@@ -329,6 +406,16 @@ class SlavchevaOptimizer2d:
 
         return max_warp, max_warp_location
 
+    def __record_probe_sobolev_gradients(self, warped_live_field):
+        for probe in self.probes:
+            if probe.voxel_is_within(warped_live_field):
+                probe.record_sobolev_gradient(self.gradient_field)
+
+    def __record_probe_warps(self, warped_live_field, canonical_field, warp_field):
+        for probe in self.probes:
+            if probe.voxel_is_within(warped_live_field):
+                probe.record_warp(warped_live_field, canonical_field, warp_field)
+
     def optimize(self, live_field, canonical_field):
 
         self.visualizer = viz.SlavchevaVisualizer(len(live_field), self.out_path, self.visualization_settings)
@@ -345,6 +432,10 @@ class SlavchevaOptimizer2d:
 
         self.__run_checks(live_field, canonical_field, warp_field)
 
+        if self.compute_method == ComputeMethod.VECTORIZED_ACTIVE_SET:
+            self.active_set = NarrowBandActiveSet(live_field, canonical_field)
+            self.convolution_buffer = np.zeros_like(warp_field)
+
         if self.adaptive_learning_rate_method == AdaptiveLearningRateMethod.RMS_PROP:
             # exponentially decaying average of squared gradients
             self.edasg_field = np.zeros_like(live_field)
@@ -367,11 +458,21 @@ class SlavchevaOptimizer2d:
             elif self.compute_method == ComputeMethod.VECTORIZED:
                 max_warp, max_warp_location = \
                     self.__optimization_iteration_vectorized(live_field, canonical_field, warp_field)
+            elif self.compute_method == ComputeMethod.VECTORIZED_ACTIVE_SET:
+                max_warp, max_warp_location = \
+                    self.__optimization_iteration_vectorized_active_set(live_field, canonical_field, warp_field)
             # log energy aggregates
             self.log.max_warps.append(max_warp)
             self.log.data_energies.append(self.total_data_energy)
             self.log.smoothing_energies.append(self.total_smoothing_energy)
             self.log.level_set_energies.append(self.total_level_set_energy)
+            if self.trace_writer is not None:
+                self.trace_writer.record(0, iteration_number, max_warp,
+                                         max_warp_location if isinstance(max_warp_location, Point2d) else None,
+                                         data_energy=self.total_data_energy,
+                                         smoothing_energy=self.total_smoothing_energy,
+                                         level_set_energy=self.total_level_set_energy,
+                                         warp_field=warp_field, gradient_field=self.gradient_field)
 
             # print end-of-iteration output
             level_set_energy_string = ""
@@ -385,7 +486,10 @@ class SlavchevaOptimizer2d:
                   "; max warp:", max_warp, "@", max_warp_location, sep="")
 
             self.visualizer.write_all_iteration_visualizations(iteration_number, warp_field, self.gradient_field,
-                                                               live_field, canonical_field)
+                                                               live_field, canonical_field,
+                                                               energy=self.total_data_energy +
+                                                               self.total_smoothing_energy +
+                                                               self.total_level_set_energy)
 
             iteration_number += 1
 
@@ -398,13 +502,120 @@ class SlavchevaOptimizer2d:
                 bool(max_warp < self.maximum_warp_length_lower_threshold),
                 bool(max_warp > self.maximum_warp_length_upper_threshold))
 
-        del self.visualizer
+        for probe in self.probes:
+            probe.flush()
+        if self.trace_writer is not None:
+            self.trace_writer.flush()
+
+        self.visualizer.close()
         self.visualizer = None
+        self.active_set = None
+        self.convolution_buffer = None
         return live_field
 
+    def __optimization_iteration_batch(self, warped_live_fields, canonical_fields, warp_fields):
+        live_gradient_y, live_gradient_x = np.gradient(warped_live_fields, axis=(1, 2))
+        data_gradient_fields = dt.compute_data_term_gradient_vectorized(warped_live_fields, canonical_fields,
+                                                                        live_gradient_x, live_gradient_y)
+        smoothing_gradient_fields = st.compute_smoothing_term_gradient_vectorized(warp_fields)
+
+        gradient_fields = self.data_term_weight * data_gradient_fields + \
+                          self.smoothing_term_weight * smoothing_gradient_fields
+        # the whole gradient is nullified outside of the narrow band union, so the data term gradient doesn't need to be
+        band_union = find_narrow_band_union(warped_live_fields, canonical_fields)
+        gradient_fields = np.where(band_union[..., np.newaxis], gradient_fields, np.float32(0.0))
+
+        if self.sobolev_smoothing_enabled:
+            convolve_with_kernel_preserve_zeros(gradient_fields, self.sobolev_kernel)
+
+        np.copyto(warp_fields, -gradient_fields * self.gradient_descent_rate)
+        warp_lengths = np.linalg.norm(warp_fields, axis=-1).reshape(len(warp_fields), -1)
+        maximum_warp_length_flat_indices = np.argmax(warp_lengths, axis=1)
+        maximum_warp_lengths = warp_lengths[np.arange(len(warp_fields)), maximum_warp_length_flat_indices]
+        maximum_warp_length_y, maximum_warp_length_x = \
+            np.unravel_index(maximum_warp_length_flat_indices, warped_live_fields.shape[1:])
+
+        # resample, equivalent to resample_warped_live(..., band_union_only=False, known_values_only=False,
+        # substitute_original=False) for each pair
+        new_warped_live_fields = BilinearWarpSampler(warp_fields).sample(warped_live_fields, replacement=1.0)
+        truncated = 1.0 - np.abs(new_warped_live_fields) < 1e-6
+        new_warped_live_fields[truncated] = np.sign(new_warped_live_fields[truncated])
+        warp_fields[truncated] = 0.0
+        np.copyto(warped_live_fields, new_warped_live_fields)
+
+        return maximum_warp_lengths, maximum_warp_length_x, maximum_warp_length_y
+
+    def __termination_conditions_reached(self, max_warps, iteration_number):
+        return np.logical_not((iteration_number < self.min_iterations) |
+                              ((iteration_number < self.max_iterations) &
+                               (self.maximum_warp_length_lower_threshold < max_warps) &
+                               (max_warps < self.maximum_warp_length_upper_threshold)))
+
+    def optimize_batch(self, live_fields, canonical_fields):
+        """
+        Optimize a batch of live/canonical field pairs at once, advancing all of their warp fields in lock-step with
+        the array operations of ComputeMethod.VECTORIZED (regardless of the compute_method setting) broadcast over the
+        whole batch. Each pair has its own termination conditions, and pairs that meet them drop out of the batch.
+        Results for each pair are the same as those of optimize with ComputeMethod.VECTORIZED, but no visualizations,
+        probes, energy & focus neighborhood logs, or per-iteration output are produced.
+        :param live_fields: live fields of shape (pair count, field_size, field_size), warped in-place
+        :param canonical_fields: canonical fields of the same shape
+        :return: the warped live fields
+        """
+        if live_fields.ndim != 3 or live_fields.shape != canonical_fields.shape or \
+                live_fields.shape[1] != live_fields.shape[2]:
+            raise ValueError("live_fields and canonical_fields need to be stacks of square 2D fields of the same size.")
+
+        pair_count = live_fields.shape[0]
+        max_warps = np.full(pair_count, np.inf)
+        max_warp_locations_x = np.zeros(pair_count, dtype=np.int64)
+        max_warp_locations_y = np.zeros(pair_count, dtype=np.int64)
+        iteration_counts = np.zeros(pair_count, dtype=np.int64)
+        iteration_number = 0
+
+        # indices of the pairs that are still being optimized & their data
+        active_pairs = np.flatnonzero(np.logical_not(self.__termination_conditions_reached(max_warps,
+                                                                                           iteration_number)))
+        warped_live_fields = live_fields[active_pairs]
+        active_canonical_fields = canonical_fields[active_pairs]
+        warp_fields = np.zeros(warped_live_fields.shape + (2,), dtype=np.float32)
+
+        while len(active_pairs) > 0:
+            max_warps[active_pairs], max_warp_locations_x[active_pairs], max_warp_locations_y[active_pairs] = \
+                self.__optimization_iteration_batch(warped_live_fields, active_canonical_fields, warp_fields)
+            iteration_number += 1
+
+            finished = self.__termination_conditions_reached(max_warps[active_pairs], iteration_number)
+            if np.any(finished):
+                iteration_counts[active_pairs[finished]] = iteration_number
+                live_fields[active_pairs[finished]] = warped_live_fields[finished]
+                remaining = np.logical_not(finished)
+                active_pairs = active_pairs[remaining]
+                warped_live_fields = warped_live_fields[remaining]
+                active_canonical_fields = active_canonical_fields[remaining]
+                warp_fields = warp_fields[remaining]
+
+        # log end-of-optimization stats
+        if self.enable_convergence_status_logging:
+            self.batch_convergence_statuses = [
+                cpp_extension.ConvergenceStatus(
+                    int(iteration_count), float(max_warp), cpp_extension.Vector2i(int(max_warp_x), int(max_warp_y)),
+                    bool(iteration_count >= self.max_iterations),
+                    bool(max_warp < self.maximum_warp_length_lower_threshold),
+                    bool(max_warp > self.maximum_warp_length_upper_threshold))
+                for iteration_count, max_warp, max_warp_x, max_warp_y
+                in zip(iteration_counts, max_warps, max_warp_locations_x, max_warp_locations_y)]
+        return live_fields
+
     def get_convergence_status(self):
         return self.log.convergence_status
 
+    def get_batch_convergence_statuses(self):
+        """
+        :return: convergence status of each pair optimized during the last optimize_batch call
+        """
+        return self.batch_convergence_statuses
+
     def plot_logged_sdf_and_warp_magnitudes(self):
         visualize_and_save_sdf_and_warp_magnitude_progression(get_focus_coordinates(),
                                                               self.focus_neighborhood_log,
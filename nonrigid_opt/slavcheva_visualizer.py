@@ -20,6 +20,7 @@ import cv2
 import numpy as np
 
 from utils.visualization import make_3d_plots, sdf_field_to_image, make_vector_field_plot, warp_field_to_heatmap
+from utils.visualization_queue import VisualizationQueue, FullQueuePolicy
 
 
 class SlavchevaVisualizer:
@@ -29,7 +30,10 @@ class SlavchevaVisualizer:
                      enable_3d_plot=False,
                      enable_warp_quiverplot=True,
                      enable_gradient_quiverplot=True,
-                     level_set_term_enabled=False
+                     level_set_term_enabled=False,
+                     render_queue_size=0,
+                     render_queue_full_policy=FullQueuePolicy.BLOCK,
+                     visualization_schedule=None
                      ):
             # visualization flags & parameters
             self.enable_3d_plot = enable_3d_plot
@@ -38,6 +42,11 @@ class SlavchevaVisualizer:
             self.enable_component_fields = enable_component_fields
             self.view_scaling_factor = view_scaling_factor
             self.level_set_term_enabled = level_set_term_enabled
+            # if positive, frames are rendered & encoded in the background, with up to this many iterations queued
+            self.render_queue_size = render_queue_size
+            self.render_queue_full_policy = render_queue_full_policy
+            # which iterations to visualize (see utils.visualization_queue.VisualizationSchedule)
+            self.visualization_schedule = visualization_schedule
 
     def __init__(self, field_size, out_path, settings=None):
         if settings:
@@ -46,6 +55,9 @@ class SlavchevaVisualizer:
             self.settings = SlavchevaVisualizer.Settings()
 
         self.out_path = out_path
+        self.render_queue = VisualizationQueue(self.settings.render_queue_size,
+                                               self.settings.render_queue_full_policy,
+                                               self.settings.visualization_schedule)
 
         self.data_component_field = None
         self.smoothing_component_field = None
@@ -104,24 +116,40 @@ class SlavchevaVisualizer:
                     os.path.join(self.out_path, 'level_set_2D_quiverplot.mkv'),
                     cv2.VideoWriter_fourcc('X', '2', '6', '4'), 10, (1920, 1200), isColor=True)
 
-    def __del__(self):
-        if self.live_video_writer3D is not None:
-            self.live_video_writer3D.release()
-        if self.warp_video_writer2D is not None:
-            self.warp_video_writer2D.release()
-        if self.gradient_video_writer2D is not None:
-            self.gradient_video_writer2D.release()
-        if self.data_gradient_video_writer2D is not None:
-            self.data_gradient_video_writer2D.release()
-        if self.smoothing_gradient_video_writer2D is not None:
-            self.smoothing_gradient_video_writer2D.release()
-        if self.level_set_gradient_video_writer2D is not None:
-            self.level_set_gradient_video_writer2D.release()
+    def close(self):
+        """
+        Finish writing all submitted frames and release the video writers
+        """
+        if self.render_queue is None:
+            return
+        render_queue = self.render_queue
+        self.render_queue = None
+        try:
+            render_queue.close()
+        finally:
+            if self.live_video_writer3D is not None:
+                self.live_video_writer3D.release()
+            if self.warp_video_writer2D is not None:
+                self.warp_video_writer2D.release()
+            if self.gradient_video_writer2D is not None:
+                self.gradient_video_writer2D.release()
+            if self.data_gradient_video_writer2D is not None:
+                self.data_gradient_video_writer2D.release()
+            if self.smoothing_gradient_video_writer2D is not None:
+                self.smoothing_gradient_video_writer2D.release()
+            if self.level_set_gradient_video_writer2D is not None:
+                self.level_set_gradient_video_writer2D.release()
+
+            self.live_video_writer2D.release()
+            self.warp_magnitude_video_writer2D.release()
 
-        self.live_video_writer2D.release()
-        self.warp_magnitude_video_writer2D.release()
+    def __del__(self):
+        self.close()
 
     def write_live_sdf_visualizations(self, canonical_field, live_field):
+        self.render_queue.submit(self.__write_live_sdf_visualizations, canonical_field, live_field)
+
+    def __write_live_sdf_visualizations(self, canonical_field, live_field):
         if self.live_video_writer3D is not None:
             self.live_video_writer3D.write(make_3d_plots(canonical_field, live_field))
         if self.live_video_writer2D is not None:
@@ -129,7 +157,20 @@ class SlavchevaVisualizer:
         pass
 
     def write_all_iteration_visualizations(self, iteration_number, warp_field, gradient_field, live_field,
-                                           canonical_field):
+                                           canonical_field, energy=None):
+        """
+        :param energy: total energy at this iteration, required if the visualization schedule depends on energy
+        """
+        # all frames of the iteration are rendered by a single task, so that the videos stay in sync even if some
+        # iterations get dropped
+        self.render_queue.submit_iteration(0, iteration_number, energy, self.__write_all_iteration_visualizations,
+                                           iteration_number, warp_field, gradient_field, live_field, canonical_field,
+                                           self.data_component_field, self.smoothing_component_field,
+                                           self.level_set_component_field)
+
+    def __write_all_iteration_visualizations(self, iteration_number, warp_field, gradient_field, live_field,
+                                             canonical_field, data_component_field, smoothing_component_field,
+                                             level_set_component_field):
         if self.warp_video_writer2D is not None:
             self.warp_video_writer2D.write(
                 make_vector_field_plot(warp_field, scale=10.0, iteration_number=iteration_number,
@@ -141,15 +182,15 @@ class SlavchevaVisualizer:
                                        vectors_name="Gradient vectors (negated)"))
         if self.data_gradient_video_writer2D is not None:
             self.data_gradient_video_writer2D.write(
-                make_vector_field_plot(-self.data_component_field,
+                make_vector_field_plot(-data_component_field,
                                        iteration_number=iteration_number, vectors_name="Data gradients (negated)"))
             if self.smoothing_gradient_video_writer2D is not None:
                 self.smoothing_gradient_video_writer2D.write(
-                    make_vector_field_plot(-self.smoothing_component_field, iteration_number=iteration_number,
+                    make_vector_field_plot(-smoothing_component_field, iteration_number=iteration_number,
                                            vectors_name="Smoothing gradients (negated)"))
             if self.level_set_gradient_video_writer2D is not None:
                 self.level_set_gradient_video_writer2D.write(
-                    make_vector_field_plot(-self.level_set_component_field, iteration_number=iteration_number,
+                    make_vector_field_plot(-level_set_component_field, iteration_number=iteration_number,
                                            vectors_name="Level set gradients (negated)"))
             if self.live_video_writer2D is not None:
                 self.live_video_writer2D.write(sdf_field_to_image(live_field, self.settings.view_scaling_factor))
@@ -19,6 +19,7 @@ from utils.printing import *
 import scipy.ndimage
 import scipy
 
+from math_utils.convolution import compute_vector_field_laplacian
 from utils.sampling import focus_coordinates_match, sample_warp_replace_if_zero, sample_warp
 from utils.tsdf_set_routines import set_zeros_for_values_outside_narrow_band_union_multitarget, \
     value_outside_narrow_band, voxel_is_outside_narrow_band_union, set_zeros_for_values_outside_narrow_band_union
@@ -30,17 +31,18 @@ class SmoothingTermMethod(Enum):
 
 
 # region ==================================== PRINTING ROUTINES ========================================================
-def print_smoothing_term_data(warp_y_minus_one, warp_x_minus_one, warp_y_plus_one, warp_x_plus_one, warp):
-    print()
-    print("[Warp data         ]", BOLD_LIGHT_CYAN, sep='')
+def print_smoothing_term_data(warp_y_minus_one, warp_x_minus_one, warp_y_plus_one, warp_x_plus_one, warp,
+                              file=None):
+    print(file=file)
+    print("[Warp data         ]", BOLD_LIGHT_CYAN, sep='', file=file)
     print("                     ", "                 [{:+01.4f},{:+01.4f}]"
-          .format(warp_y_minus_one[0], warp_y_minus_one[1]), sep='')
+          .format(warp_y_minus_one[0], warp_y_minus_one[1]), sep='', file=file)
     print("                     ",
           "[{:+01.4f},{:+01.4f}][{:+01.4f},{:+01.4f}][{:+01.4f},{:+01.4f}]"
           .format(warp_x_minus_one[0], warp_x_minus_one[1], warp[0], warp[1], warp_x_plus_one[0], warp_x_plus_one[1]),
-          sep='')
+          sep='', file=file)
     print("                     ", "                 [{:+01.4f},{:+01.4f}]"
-          .format(warp_y_plus_one[0], warp_y_plus_one[1]), RESET, sep='')
+          .format(warp_y_plus_one[0], warp_y_plus_one[1]), RESET, sep='', file=file)
 
 
 # endregion
@@ -153,10 +155,11 @@ def compute_local_smoothing_term_gradient(warp_field, x, y, ignore_if_zero=False
 
 
 def compute_smoothing_term_gradient_vectorized(warp_field):
-    laplace_u = scipy.ndimage.laplace(warp_field[:, :, 0])
-    laplace_v = scipy.ndimage.laplace(warp_field[:, :, 1])
-    smoothing_gradient = -np.stack((laplace_u, laplace_v), axis=2)
-    return smoothing_gradient
+    """
+    :param warp_field: warp field of shape (height, width, 2) or a stack of such fields
+    :return: tikhonov smoothing term gradient for each location (and each field in the stack)
+    """
+    return -compute_vector_field_laplacian(warp_field)
 
 
 def compute_smoothing_term_energy(warp_field, warped_live_field=None, canonical_field=None, band_union_only=True):
@@ -17,6 +17,8 @@
 
 from __future__ import print_function
 import sys
+import os
+import tempfile
 from sktensor import dtensor
 from math_utils import tenmat, tucker
 
@@ -24,10 +26,28 @@ import numpy as np
 import argparse as ap
 import sys
 import scipy.io
+import scipy.sparse
+import scipy.sparse.linalg
 
 EXIT_STATUS_SUCCESS = 0
 EXIT_STATUS_FAILURE = 1
 
+# persistent store for computed kernels, shared between runs (set cache_directory=None to bypass it)
+DEFAULT_KERNEL_CACHE_DIRECTORY = os.path.join(os.path.expanduser("~"), ".cache", "level_set_fusion", "sobolev_kernels")
+# in-process memo for computed kernels, maps cache keys to U matrices
+kernel_memo = {}
+
+
+class SobolevSystemSolver:
+    """
+    Method used to solve the (Id - lambda * Laplacian) S = v system for the 3D Sobolev kernel S
+    """
+    DENSE = 0  # LAPACK solve on the densified system, O(s^6) memory
+    SPARSE_DIRECT = 1  # sparse LU factorization (SuperLU)
+    CONJUGATE_GRADIENT = 2  # iterative, the system is symmetric positive-definite
+
+    names = {DENSE: "dense", SPARSE_DIRECT: "sparse_direct", CONJUGATE_GRADIENT: "conjugate_gradient"}
+
 
 def print_to_stderr(*args, **kwargs):
     print(*args, file=sys.stderr, **kwargs)
@@ -159,6 +179,42 @@ def generate_7pt_stencil_finite_difference_laplacian_matrix2(s, precision):
     return stencil_laplacian_operator
 
 
+def generate_sparse_7pt_stencil_finite_difference_laplacian_matrix(s, precision, clip_at_block_boundaries=True):
+    """
+    Generates the same s^3-by-s^3 Laplacian operator matrix as generate_7pt_stencil_finite_difference_laplacian_matrix
+    (if clip_at_block_boundaries is set) or generate_7pt_stencil_finite_difference_laplacian_matrix2 (otherwise), but
+    in sparse form and in O(s^3) time & memory.
+    :type s: int
+    :param s: lateral size of the kernel
+    :type precision: type
+    :param precision: numpy precision
+    :param clip_at_block_boundaries: when set, neighbors are restricted to the s x s x s block. Otherwise, neighbors
+    are restricted only by the range of voxel indices, i.e. the x - 1 neighbor of a voxel at x = 0 is the last voxel
+    of the previous row, as in generate_7pt_stencil_finite_difference_laplacian_matrix2.
+    :rtype: scipy.sparse.csr_matrix
+    :return: the sparse Laplacian operator matrix
+    """
+    s_cubed = s ** 3
+    voxel_indices = np.arange(s_cubed)
+    x, y, z = get_voxel_coord(voxel_indices, s)
+
+    rows = [voxel_indices]
+    columns = [voxel_indices]
+    values = [np.full(s_cubed, -6.0, precision)]
+    for coordinate, direction, stride in ((x, -1, 1), (x, 1, 1), (y, 1, s), (y, -1, s), (z, -1, s * s), (z, 1, s * s)):
+        neighbor_indices = voxel_indices + direction * stride
+        if clip_at_block_boundaries:
+            valid = (coordinate + direction >= 0) & (coordinate + direction < s)
+        else:
+            valid = (neighbor_indices >= 0) & (neighbor_indices < s_cubed)
+        rows.append(voxel_indices[valid])
+        columns.append(neighbor_indices[valid])
+        values.append(np.ones(np.count_nonzero(valid), precision))
+
+    return scipy.sparse.csr_matrix((np.concatenate(values), (np.concatenate(rows), np.concatenate(columns))),
+                                   shape=(s_cubed, s_cubed), dtype=precision)
+
+
 def args_to_parameters():
     parser = ap.ArgumentParser("Generates Sobolev separable 1D filters (approximations) for given s (filter size) and "
                                "lambda (filter strength) parameters")
@@ -176,6 +232,10 @@ def args_to_parameters():
     parser.set_defaults(alternative_laplacian_method=False)
     parser.add_argument("-sar", "--use_s_as_rank", dest='use_s_as_rank', action='store_true')
     parser.set_defaults(use_s_as_rank=False)
+    parser.add_argument("-sv", "--solver", type=str, default="dense",
+                        choices=list(SobolevSystemSolver.names.values()),
+                        help="Method for solving the linear system for the 3D kernel. Use one of the sparse methods "
+                             "for large kernel sizes.")
 
     parameters = parser.parse_args()
 
@@ -202,11 +262,54 @@ def args_to_parameters():
     else:
         precision = np.float64
     parameters.precision = precision
+    parameters.solver = {name: solver for solver, name in SobolevSystemSolver.names.items()}[parameters.solver]
     return parameters
 
 
-def generate_1d_sobolev_kernel(size=7, strength=0.1, precision=np.float32,
-                               alternative_laplacian_method=False, use_size_as_rank=False, return_u_matrices=False):
+def solve_sobolev_system(system_matrix, right_hand_side, solver=SobolevSystemSolver.DENSE,
+                         tolerance=1e-10):
+    """
+    Solve the sparse linear system for the flat Sobolev kernel
+    :type system_matrix: scipy.sparse.spmatrix
+    :param system_matrix: the (Id - lambda * Laplacian) matrix
+    :param right_hand_side: column vector
+    :param solver: see SobolevSystemSolver
+    :param tolerance: relative residual tolerance, used only by the iterative solver
+    :return: solution, a column vector of the same dtype as the system matrix
+    """
+    precision = system_matrix.dtype
+    if solver == SobolevSystemSolver.DENSE:
+        return np.linalg.solve(system_matrix.toarray(), right_hand_side)
+    elif solver == SobolevSystemSolver.SPARSE_DIRECT:
+        solution = scipy.sparse.linalg.spsolve(system_matrix.tocsc(), right_hand_side[:, 0])
+    elif solver == SobolevSystemSolver.CONJUGATE_GRADIENT:
+        # iterate in double precision, single precision stalls above the usual tolerances
+        system_matrix = system_matrix.astype(np.float64)
+        right_hand_side = right_hand_side[:, 0].astype(np.float64)
+        maximum_iteration_count = 10 * system_matrix.shape[0]
+        try:
+            solution, info = scipy.sparse.linalg.cg(system_matrix, right_hand_side, rtol=tolerance, atol=0.0,
+                                                    maxiter=maximum_iteration_count)
+        except TypeError:
+            # scipy versions before 1.12 call the relative tolerance "tol"
+            solution, info = scipy.sparse.linalg.cg(system_matrix, right_hand_side, tol=tolerance, atol=0.0,
+                                                    maxiter=maximum_iteration_count)
+        if info != 0:
+            raise RuntimeError("Conjugate gradient solve of the Sobolev system did not converge "
+                               "within {:d} iterations".format(info))
+    else:
+        raise ValueError("Unsupported solver: " + str(solver))
+    return solution.astype(precision).reshape(-1, 1)
+
+
+def compute_sobolev_kernel_u_matrices(size=7, strength=0.1, precision=np.float32,
+                                      alternative_laplacian_method=False, use_size_as_rank=False,
+                                      solver=SobolevSystemSolver.DENSE):
+    """
+    Compute the U matrices of the Tucker decomposition of the 3D Sobolev kernel from scratch (bypassing all caches).
+    See generate_1d_sobolev_kernel for parameters.
+    :return: list with the U matrices for the x, y, and z direction
+    """
     s_cubed = size ** 3
     # For documentation / reference only
     # laplacian_3d_operator = np.array([[[0, 0, 0],
@@ -221,23 +324,20 @@ def generate_1d_sobolev_kernel(size=7, strength=0.1, precision=np.float32,
 
     # (Id - l*delta)S = v
 
-    identity_matrix = np.identity(s_cubed, precision)
+    identity_matrix = scipy.sparse.identity(s_cubed, precision, format="csr")
     # stencil_laplacian_operator  = delta
     # Each row & represents one of the s*s*s voxels composing the Sobolev kernel.
     # Each column represents another voxel in the kernel.
     # Ordering is assumed to be by x, y, and then z axis, in that order.
-    if alternative_laplacian_method:
-        stencil_laplacian_operator = generate_7pt_stencil_finite_difference_laplacian_matrix(size, precision)
-    else:
-        stencil_laplacian_operator = generate_7pt_stencil_finite_difference_laplacian_matrix2(size, precision)
+    stencil_laplacian_operator = generate_sparse_7pt_stencil_finite_difference_laplacian_matrix(
+        size, precision, clip_at_block_boundaries=alternative_laplacian_method)
     # one_hot_vector = v
     one_hot_vector = np.zeros((s_cubed, 1), precision)
     one_hot_vector[s_cubed // 2] = 1.0
 
     # solve the system for S
-    sobolev_kernel_flat = np.linalg.solve((identity_matrix - strength * stencil_laplacian_operator),
-                                          one_hot_vector)
-    u, v, vh = np.linalg.svd(sobolev_kernel_flat)
+    system_matrix = identity_matrix - strength * stencil_laplacian_operator
+    sobolev_kernel_flat = solve_sobolev_system(system_matrix, one_hot_vector, solver)
     sobolev_kernel = sobolev_kernel_flat.reshape((size, size, size))
     sobolev_kernel_tensor = dtensor(sobolev_kernel)
 
@@ -245,6 +345,89 @@ def generate_1d_sobolev_kernel(size=7, strength=0.1, precision=np.float32,
         core, u_matrices = tucker.hooi(sobolev_kernel_tensor, size)
     else:
         core, u_matrices = tucker.hooi(sobolev_kernel_tensor)
+    return list(u_matrices)
+
+
+def get_sobolev_kernel_cache_key(size, strength, precision, alternative_laplacian_method, use_size_as_rank,
+                                 solver=SobolevSystemSolver.DENSE):
+    return int(size), float(strength), np.dtype(precision).name, bool(alternative_laplacian_method), \
+           bool(use_size_as_rank), int(solver)
+
+
+def get_sobolev_kernel_cache_path(cache_key, cache_directory):
+    size, strength, precision_name, alternative_laplacian_method, use_size_as_rank, solver = cache_key
+    filename = "sobolev_s{:d}_l{:s}_{:s}_alm{:d}_sar{:d}_{:s}.npz".format(
+        size, repr(strength), precision_name, alternative_laplacian_method, use_size_as_rank,
+        SobolevSystemSolver.names[solver])
+    return os.path.join(cache_directory, filename)
+
+
+def load_cached_u_matrices(path):
+    try:
+        with np.load(path) as archive:
+            return [archive["u0"], archive["u1"], archive["u2"]]
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def save_cached_u_matrices(path, u_matrices):
+    # write to a temporary file & then move it into place, so that concurrent runs never see a partial file
+    try:
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        file_descriptor, temporary_path = tempfile.mkstemp(suffix=".npz", dir=directory)
+        with os.fdopen(file_descriptor, "wb") as file:
+            np.savez(file, u0=u_matrices[0], u1=u_matrices[1], u2=u_matrices[2])
+        os.replace(temporary_path, path)
+    except OSError as error:
+        print_to_stderr("Could not save the Sobolev kernel to the cache at {:s}: {:s}".format(path, str(error)))
+
+
+def clear_sobolev_kernel_memo():
+    kernel_memo.clear()
+
+
+def generate_1d_sobolev_kernel(size=7, strength=0.1, precision=np.float32,
+                               alternative_laplacian_method=False, use_size_as_rank=False, return_u_matrices=False,
+                               use_cache=True, cache_directory=DEFAULT_KERNEL_CACHE_DIRECTORY,
+                               solver=SobolevSystemSolver.DENSE):
+    """
+    Generate the separable 1D approximation of the 3D Sobolev kernel. Computed kernels are memoized in-process and
+    stored on disk, so identical kernels are only ever computed once.
+    :param size: lateral size of the kernel
+    :param strength: strength (lambda) of the kernel
+    :param precision: numpy precision
+    :param alternative_laplacian_method: use the Laplacian restricted to the s x s x s block, see
+    generate_sparse_7pt_stencil_finite_difference_laplacian_matrix
+    :param use_size_as_rank: use size as the rank of the Tucker decomposition (instead of the full-rank HOSVD)
+    :param return_u_matrices: return the U matrices of the decomposition instead of the 1D kernel
+    :param use_cache: whether to look up / store the result in the caches
+    :param cache_directory: directory of the persistent on-disk cache. If None, only the in-process memo is used.
+    :param solver: how to solve the linear system for the 3D kernel, see SobolevSystemSolver. The sparse solvers
+    agree with the dense one up to floating-point error, but also work for large kernels (e.g. size 21).
+    :return: the 1D kernel or the U matrices for the x, y, and z direction
+    """
+    if use_cache:
+        cache_key = get_sobolev_kernel_cache_key(size, strength, precision, alternative_laplacian_method,
+                                                 use_size_as_rank, solver)
+        if cache_key in kernel_memo:
+            u_matrices = kernel_memo[cache_key]
+        else:
+            cache_path = None if cache_directory is None else get_sobolev_kernel_cache_path(cache_key,
+                                                                                           cache_directory)
+            u_matrices = None if cache_path is None else load_cached_u_matrices(cache_path)
+            if u_matrices is None:
+                u_matrices = compute_sobolev_kernel_u_matrices(size, strength, precision,
+                                                               alternative_laplacian_method, use_size_as_rank,
+                                                               solver)
+                if cache_path is not None:
+                    save_cached_u_matrices(cache_path, u_matrices)
+            kernel_memo[cache_key] = u_matrices
+        # callers get copies, so the cached matrices cannot be altered
+        u_matrices = [u_matrix.copy() for u_matrix in u_matrices]
+    else:
+        u_matrices = compute_sobolev_kernel_u_matrices(size, strength, precision, alternative_laplacian_method,
+                                                       use_size_as_rank, solver)
 
     if return_u_matrices:
         return u_matrices
@@ -261,7 +444,8 @@ def main():
     l = parameters.lambda_
     precision = parameters.precision
     u_matrices = generate_1d_sobolev_kernel(s, l, precision, parameters.alternative_laplacian_method,
-                                            parameters.use_s_as_rank, return_u_matrices=True)
+                                            parameters.use_s_as_rank, return_u_matrices=True,
+                                            solver=parameters.solver)
     [u1, u2, u3] = u_matrices
 
     # scipy.io.savemat("sob.mat", dict(sob=sobolev_kernel))
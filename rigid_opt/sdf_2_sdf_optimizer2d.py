@@ -13,6 +13,29 @@ from rigid_opt.sdf_2_sdf_visualizer import Sdf2SdfVisualizer
 from tsdf import generation as tsdf_gen
 
 
+def compute_normal_equations(canonical_field, live_field, live_gradient, twist, weights=None):
+    """
+    Set up the normal equations A * twist_star = b of the linearized SDF-2-SDF energy over all voxels at once, i.e.
+    A = sum(w * J^T * J) and b = sum(w * (canonical - live + J * twist) * J^T), where J is the gradient of the live
+    SDF w.r.t. the twist at each voxel and w is the weight of each voxel (1 if no weights are given).
+    :param canonical_field: canonical SDF field
+    :param live_field: live SDF field
+    :param live_gradient: gradient of the live field w.r.t. the twist, of shape live_field.shape + (3,)
+    :param twist: current twist vector, of shape (3, 1)
+    :param weights: optional per-voxel weights, of the same shape as the fields
+    :return: matrix A of shape (3, 3) and vector b of shape (3, 1)
+    """
+    jacobians = live_gradient.reshape(-1, 3).astype(np.float64)
+    residuals = (canonical_field - live_field).reshape(-1) + np.dot(jacobians, twist)[:, 0]
+    if weights is None:
+        weighted_jacobians = jacobians
+    else:
+        weighted_jacobians = jacobians * weights.reshape(-1, 1)
+    matrix_a = np.dot(weighted_jacobians.T, jacobians)
+    vector_b = np.dot(weighted_jacobians.T, residuals)[:, None]
+    return matrix_a, vector_b
+
+
 class Sdf2SdfOptimizer2d:
     """
 
@@ -59,6 +82,7 @@ class Sdf2SdfOptimizer2d:
                  voxel_size=0.004,
                  narrow_band_width_voxels=20.,
                  iteration=60,
+                 weighted_normal_equations=False
                  ):
         """
         Optimization algorithm
@@ -67,6 +91,8 @@ class Sdf2SdfOptimizer2d:
         :param iteration: total number of iterations
         :param voxel_size: voxel side length
         :param narrow_band_width_voxels:
+        :param weighted_normal_equations: whether to only let voxels reliable in both the canonical and the live
+        field (see eta) contribute to the normal equations. Otherwise, the weights only affect the reported energy.
         :return:
         """
 
@@ -82,9 +108,7 @@ class Sdf2SdfOptimizer2d:
         self.visualizer.generate_pre_optimization_visualizations(canonical_field, live_field)
 
         for iteration_count in range(iteration):
-            matrix_a = np.zeros((3, 3))
-            vector_b = np.zeros((3, 1))
-            canonical_weight = (canonical_field > -eta).astype(np.int)
+            canonical_weight = canonical_field > -eta
             live_field = data_to_use.generate_2d_live_field(narrow_band_width_voxels=narrow_band_width_voxels,
                                                             method=tsdf_gen.GenerationMethod.NONE,
                                                             twist=np.array([twist[0],
@@ -93,14 +117,11 @@ class Sdf2SdfOptimizer2d:
                                                                            [0.],
                                                                            twist[2],
                                                                            [0.]], dtype=np.float32))
-            live_weight = (live_field > -eta).astype(np.int)
+            live_weight = live_field > -eta
             live_gradient = calculate_gradient_wrt_twist(live_field, twist, array_offset=offset, voxel_size=voxel_size)
 
-            for i in range(live_field.shape[0]):
-                for j in range(live_field.shape[1]):
-                    matrix_a += np.dot(live_gradient[i, j][:, None], live_gradient[i, j][None, :])
-                    vector_b += (canonical_field[i, j] - live_field[i, j] +
-                                 np.dot(live_gradient[i, j][None, :], twist)) * live_gradient[i, j][:, None]
+            weights = np.logical_and(canonical_weight, live_weight) if weighted_normal_equations else None
+            matrix_a, vector_b = compute_normal_equations(canonical_field, live_field, live_gradient, twist, weights)
 
             energy = 0.5 * np.sum((canonical_field * canonical_weight - live_field * live_weight) ** 2)
             if self.verbosity_parameters.print_per_iteration_info:
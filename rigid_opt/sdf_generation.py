@@ -10,6 +10,7 @@ import cv2
 # local
 from tsdf import generation as tsdf_gen
 from math_utils.transformation import twist_vector_to_matrix3d
+from utils.image_cache import load_image
 
 
 class ImageBasedSingleFrameDataset:
@@ -29,7 +30,7 @@ class ImageBasedSingleFrameDataset:
         return live_field, canonical_field
 
     def generate_2d_canonical_field(self, narrow_band_width_voxels=20., method=tsdf_gen.GenerationMethod.NONE):
-        depth_image0 = cv2.imread(self.first_frame_path, -1)
+        depth_image0 = load_image(self.first_frame_path, -1)
         depth_image0 = cv2.cvtColor(depth_image0, cv2.COLOR_BGR2GRAY)
         depth_image0 = depth_image0.astype(float)  # cm
 
@@ -44,7 +45,7 @@ class ImageBasedSingleFrameDataset:
     def generate_2d_live_field(self, method=tsdf_gen.GenerationMethod.NONE,
                                narrow_band_width_voxels=20.,
                                twist=np.zeros((6, 1))):
-        depth_image1 = cv2.imread(self.second_frame_path, -1)
+        depth_image1 = load_image(self.second_frame_path, -1)
         depth_image1 = cv2.cvtColor(depth_image1, cv2.COLOR_BGR2GRAY)
         depth_image1 = depth_image1.astype(float)  # cm
 
@@ -11,27 +11,35 @@ from math_utils.transformation import twist_vector_to_matrix2d
 
 
 def calculate_gradient_wrt_twist(live_field, twist, array_offset, voxel_size=0.004):
-    gradient_field = np.zeros((live_field.shape[0], live_field.shape[1], 3), dtype=np.float32)
+    """
+    Compute the gradient of the live SDF with respect to the 2D twist (x translation, z translation, rotation) at
+    every voxel at once.
+    :param live_field: 2D live SDF field
+    :param twist: twist vector of shape (3, 1)
+    :param array_offset: offset of the field in voxels, x and z components are used
+    :param voxel_size: voxel side length
+    :return: gradient field of shape (height, width, 3), i.e. the per-voxel Jacobians of the SDF w.r.t. the twist
+    """
     sdf_gradient_first_term = np.gradient(live_field)
     twist_matrix_homo_inv = twist_vector_to_matrix2d(-twist)
 
-    y_voxel = 0.0
-    w_voxel = 1.0
-
-    for y_field in range(live_field.shape[0]):
-        for x_field in range(live_field.shape[1]):
-            x_voxel = (x_field + array_offset[0]) * voxel_size
-            z_voxel = (y_field + array_offset[2]) * voxel_size  # acts as "Z" coordinate
-
-            point = np.array([[x_voxel, z_voxel, w_voxel]], dtype=np.float32).T
-            trans = np.dot(twist_matrix_homo_inv, point)
-
-            sdf_gradient_second_term = np.array([[1, 0, trans[1]],
-                                                 [0, 1, -trans[0]]])
-            gradient_field[y_field, x_field] = np.dot(np.array([sdf_gradient_first_term[1][y_field, x_field],
-                                                                sdf_gradient_first_term[0][y_field, x_field]]),
-                                                      sdf_gradient_second_term)
+    y_field, x_field = np.indices(live_field.shape)
+    x_voxel = ((x_field + array_offset[0]) * voxel_size).astype(np.float32)
+    z_voxel = ((y_field + array_offset[2]) * voxel_size).astype(np.float32)  # acts as "Z" coordinate
+
+    # transformed voxel coordinates (only the first two rows of the homogeneous transform matter)
+    trans_x = twist_matrix_homo_inv[0, 0] * x_voxel + twist_matrix_homo_inv[0, 1] * z_voxel + \
+        twist_matrix_homo_inv[0, 2]
+    trans_z = twist_matrix_homo_inv[1, 0] * x_voxel + twist_matrix_homo_inv[1, 1] * z_voxel + \
+        twist_matrix_homo_inv[1, 2]
+
+    # [sdf_x, sdf_z] . [[1, 0, trans_z], [0, 1, -trans_x]]
+    sdf_gradient_x = sdf_gradient_first_term[1]
+    sdf_gradient_z = sdf_gradient_first_term[0]
+    gradient_field = np.empty((live_field.shape[0], live_field.shape[1], 3), dtype=np.float32)
+    gradient_field[..., 0] = sdf_gradient_x
+    gradient_field[..., 1] = sdf_gradient_z
+    gradient_field[..., 2] = sdf_gradient_x * trans_z - sdf_gradient_z * trans_x
     gradient_field /= voxel_size
 
-
-    return gradient_field
\ No newline at end of file
+    return gradient_field
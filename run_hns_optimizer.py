@@ -64,7 +64,8 @@ def main():
             save_final_fields=True,
             save_warp_field_progression=True,
             save_data_gradients=True,
-            save_tikhonov_gradients=False
+            save_tikhonov_gradients=False,
+            render_queue_size=16
         )
     )
     warp_field = optimizer.optimize(canonical_field, live_field)
@@ -58,7 +58,8 @@ def main():
     parser.add_argument("-f", "--frames", type=str,
                         default="/media/algomorph/Data/Reconstruction/real_data/KillingFusion Snoopy/frames",
                         help="Path to the depth frames. Frame image files should have names "
-                             "that follow depth_{:0>6d}.png pattern, i.e. depth_000000.png")
+                             "that follow depth_{:0>6d}.png pattern, i.e. depth_000000.png. In multiple_tests mode,"
+                             " this can also be a depth stack file (see experiment/depth_stack.py).")
     parser.add_argument("-cfi", "--canonical_frame_index", type=int, default=-1,
                         help="Use in single_test mode only. Instead of a predefined dataset, use this index for the"
                              " canonical frame in the folder specified by the --frames/-f argument. Live frame is"
@@ -74,10 +75,12 @@ def main():
                         help="input cases file path for multiple_tests_mode")
     parser.add_argument("-oc", "--optimizer_choice", type=str, default="CPP",
                         help="optimizer choice (currently, multiple_tests mode only!), "
-                             "must be in {CPP, PYTHON_DIRECT, PYTHON_VECTORIZED}")
+                             "must be in {CPP, PYTHON_DIRECT, PYTHON_VECTORIZED, PYTHON_VECTORIZED_ACTIVE_SET}")
     parser.add_argument("-di", "--depth_interpolation_method", type=str, default="NONE",
                         help="Depth image interpolation method to use when generating SDF. "
                              "Can be one of: {NONE, BILINEAR_IMAGE_SPACE, BILINEAR_TSDF_SPACE}")
+    parser.add_argument("-w", "--worker_count", type=int, default=1,
+                        help="(multiple_tests mode only) number of worker processes to run test cases in")
     parser.add_argument("--draw_initial_tsdfs_and_exit",
                         action='store_true',
                         help="(single_test mode only), exits after drawing and saving the initial TSDF")
@@ -125,7 +128,7 @@ def main():
                                depth_interpolation_method=depth_interpolation_method,
                                out_path=arguments.output_path, input_case_file=arguments.case_file_path,
                                calibration_path=arguments.calibration, frame_path=arguments.frames,
-                               z_offset=arguments.z_offset)
+                               z_offset=arguments.z_offset, worker_count=arguments.worker_count)
 
     return EXIT_CODE_SUCCESS
 
@@ -0,0 +1,65 @@
+#  ================================================================
+#  Created by agent on 10/18/26.
+#  Copyright (c) 2026 agent
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#  ================================================================
+# stdlib
+from unittest import TestCase
+import os
+import tempfile
+# libraries
+import numpy as np
+import pandas as pd
+
+# test targets
+from experiment.convergence_log import ConvergenceStatusLogWriter, load_convergence_status_log, \
+    CONVERGENCE_STATUS_LOG_COLUMNS, CONVERGENCE_STATUS_LOG_FILENAME, OUTCOMES
+
+
+class ConvergenceLogTest(TestCase):
+    def test_convergence_log01(self):
+        # converged, not converged, diverged, converged
+        log = [[0, 1, 220, 12, 0.04, 3, 5, False, True, False],
+               [5, 6, 301, 100, 0.25, 64, 70, True, False, False],
+               [10, 11, 250, 7, 12.5, 80, 2, False, False, True],
+               [15, 16, 399, 12, 0.03, 1, 127, False, True, False]]
+        with tempfile.TemporaryDirectory() as out_directory:
+            writer = ConvergenceStatusLogWriter(out_directory, sync_every_n_entries=3)
+            for entry in log:
+                writer.append(entry)
+            self.assertEqual(writer.entry_count, 4)
+            self.assertEqual(writer.outcome_counts, {"CONVERGED": 2, "DIVERGED": 1, "NOT CONVERGED": 1})
+            self.assertEqual(list(writer.outcome_counts.keys()), list(OUTCOMES))
+            self.assertEqual(writer.iteration_count_histogram[12], 2)
+            self.assertEqual(writer.iteration_count_histogram.sum(), 4)
+            self.assertTrue(writer.get_summary().startswith("4 cases: 2 CONVERGED, 1 DIVERGED, 1 NOT CONVERGED"))
+            writer.close()
+
+            # same format as the log recorded with pandas
+            log_path = os.path.join(out_directory, CONVERGENCE_STATUS_LOG_FILENAME)
+            with open(log_path, "r", newline="") as file:
+                self.assertEqual(file.read(), pd.DataFrame(log, columns=CONVERGENCE_STATUS_LOG_COLUMNS).to_csv())
+            bad_cases = pd.read_csv(os.path.join(out_directory, "bad_cases.csv"))
+            good_cases = pd.read_csv(os.path.join(out_directory, "good_cases.csv"))
+            self.assertEqual(len(pd.read_csv(os.path.join(out_directory, "cases.csv"))), 4)
+            self.assertTrue(np.array_equal(bad_cases.values, [[5, 6, 301, 64, 70]]))
+            self.assertTrue(np.array_equal(good_cases["canonical frame index"].values, [0, 10, 15]))
+
+            # resuming keeps the leading entries of the existing log
+            self.assertEqual(load_convergence_status_log(log_path, 2), log[:2])
+            writer = ConvergenceStatusLogWriter(out_directory, kept_entry_count=2)
+            writer.append(log[3])
+            writer.close()
+            self.assertEqual(load_convergence_status_log(log_path, 10), log[:2] + log[3:])
+            self.assertEqual(writer.outcome_counts, {"CONVERGED": 2, "DIVERGED": 0, "NOT CONVERGED": 1})
+            self.assertEqual(len(pd.read_csv(os.path.join(out_directory, "good_cases.csv"))), 2)
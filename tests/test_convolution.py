@@ -170,3 +170,18 @@ class ConvolutionTest(TestCase):
                                      [-0.13971105, -0.2855439]]], dtype=np.float32)
         mc.convolve_with_kernel_x(vector_field, kernel)
         self.assertTrue(np.allclose(vector_field, expected_output))
+
+    def test_convolution_methods01(self):
+        random_state = np.random.RandomState(seed=1)
+        vector_field = random_state.uniform(-1, 1, (24, 16, 2)).astype(np.float32)
+        vector_field[random_state.uniform(0, 1, vector_field.shape) < 0.3] = 0.0
+        for kernel in [mc.sobolev_kernel_1d, np.array([0.2, 0.5, 0.25, 0.05], dtype=np.float32),
+                       random_state.uniform(0, 1, 15)]:
+            expected_output = vector_field.copy()
+            mc.convolve_with_kernel_preserve_zeros(expected_output, kernel, method=mc.ConvolutionMethod.DIRECT)
+            output = vector_field.copy()
+            mc.convolve_with_kernel_preserve_zeros(output, kernel, method=mc.ConvolutionMethod.SEPARABLE)
+            self.assertTrue(np.array_equal(output, expected_output))
+            output = vector_field.copy()
+            mc.convolve_with_kernel_preserve_zeros(output, kernel, method=mc.ConvolutionMethod.FFT)
+            self.assertTrue(np.allclose(output, expected_output, atol=1e-5))
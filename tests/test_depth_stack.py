@@ -0,0 +1,87 @@
+#  ================================================================
+#  Created by agent on 10/18/26.
+#  Copyright (c) 2026 agent
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#  ================================================================
+# stdlib
+from unittest import TestCase
+import os
+import tempfile
+# libraries
+import numpy as np
+import cv2
+
+# test targets
+from experiment.depth_stack import convert_frames_to_depth_stack, is_depth_stack_file
+from experiment.dataset import MaskedImageBasedSingleFrameDataset, DepthStackSingleFrameDataset
+from tsdf.common import GenerationMethod
+
+CALIBRATION = """640 480
+700 700
+320 240
+
+640 480
+700 700
+320 240
+
+1 0 0 0
+0 1 0 0
+0 0 1 0
+
+affine 0.001 0.0
+"""
+
+
+class DepthStackTest(TestCase):
+    @staticmethod
+    def image_load_helper(filename):
+        path = os.path.join("tests/test_data", filename)
+        if not os.path.exists(path):
+            path = os.path.join("test_data", filename)
+        return cv2.imread(path, cv2.IMREAD_UNCHANGED)
+
+    def test_depth_stack01(self):
+        depth_images = [self.image_load_helper("zigzag1_depth_00064.png"),
+                        self.image_load_helper("zigzag2_depth_00108.png")]
+        mask = np.full(depth_images[0].shape, 255, dtype=np.uint8)
+        mask[:, :320] = 0
+        with tempfile.TemporaryDirectory() as directory:
+            frames_path = os.path.join(directory, "frames")
+            os.mkdir(frames_path)
+            for i_frame, depth_image in enumerate(depth_images):
+                cv2.imwrite(os.path.join(frames_path, "depth_{:0>6d}.png".format(i_frame)), depth_image)
+                cv2.imwrite(os.path.join(frames_path, "mask_{:0>6d}.png".format(i_frame)), mask)
+            calibration_path = os.path.join(directory, "calib.txt")
+            with open(calibration_path, "w") as calibration_file:
+                calibration_file.write(CALIBRATION)
+            stack_path = os.path.join(directory, "frames.dstk")
+
+            depth_stack = convert_frames_to_depth_stack(frames_path, calibration_path, stack_path)
+            self.assertTrue(is_depth_stack_file(stack_path))
+            self.assertFalse(is_depth_stack_file(calibration_path))
+            self.assertEqual(depth_stack.frame_count, 2)
+            self.assertTrue(depth_stack.has_masks)
+            self.assertTrue(np.array_equal(depth_stack.get_depth_row(1, 200), depth_images[1][200]))
+            self.assertTrue(depth_stack.is_row_empty(0, 200) == (np.sum(depth_images[0][200, 320:]) == 0))
+            self.assertEqual(depth_stack.depth_camera.depth_unit_ratio, 0.001)
+
+            for method in [GenerationMethod.NONE, GenerationMethod.BILINEAR_TSDF]:
+                # the canonical frame is processed identically by both datasets
+                expected_field = MaskedImageBasedSingleFrameDataset(
+                    calibration_path, os.path.join(frames_path, "depth_000000.png"),
+                    os.path.join(frames_path, "mask_000000.png"), os.path.join(frames_path, "depth_000001.png"),
+                    os.path.join(frames_path, "mask_000001.png"), 200, 32, [86, -16, 796]) \
+                    .generate_2d_sdf_fields(method)[1]
+                field = DepthStackSingleFrameDataset(depth_stack, 0, 1, 200, 32, [86, -16, 796]) \
+                    .generate_2d_sdf_fields(method)[1]
+                self.assertTrue(np.array_equal(field, expected_field))
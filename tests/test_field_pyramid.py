@@ -84,3 +84,48 @@ class FieldPyramidTest(TestCase):
         field = np.tile(tile, (2, 2))  # results in shape 16 x 16
         pyramid = ScalarFieldPyramid2d(field)
         self.assertEqual(len(pyramid.levels), 4)
+
+    def test_construct_generalized_pyramids(self):
+        field = np.arange(20 * 28, dtype=np.float32).reshape(20, 28)
+        with self.assertRaises(ValueError):
+            FieldPyramid(field, maximum_chunk_size=8)
+
+        # padding
+        pyramid = FieldPyramid(field, maximum_chunk_size=8, shape_policy=PyramidShapePolicy.PAD)
+        self.assertEqual(len(pyramid.levels), 4)
+        self.assertEqual(pyramid.levels[-1].shape, (24, 32))
+        self.assertEqual(pyramid.levels[0].shape, (3, 4))
+        self.assertTrue(np.array_equal(pyramid.levels[-1][:20, :28], field))
+        self.assertTrue(np.array_equal(pyramid.levels[-1][20:, :28], np.repeat(field[-1:], 4, axis=0)))
+        self.assertTrue(np.array_equal(pyramid.restore_source_shape(pyramid.levels[-1]), field))
+
+        # cropping, with the finest level sharing memory with the source field
+        pyramid = FieldPyramid(field, maximum_chunk_size=4, shape_policy=PyramidShapePolicy.CROP,
+                               share_finest_level=True)
+        self.assertEqual(pyramid.levels[-1].shape, (20, 28))
+        self.assertTrue(np.shares_memory(pyramid.levels[-1], field))
+        pyramid = FieldPyramid(field, maximum_chunk_size=8, shape_policy=PyramidShapePolicy.CROP)
+        self.assertEqual(pyramid.levels[-1].shape, (16, 24))
+        self.assertFalse(np.shares_memory(pyramid.levels[-1], field))
+        restored = pyramid.restore_source_shape(pyramid.levels[-1], fill_value=-1)
+        self.assertEqual(restored.shape, field.shape)
+        self.assertTrue(np.all(restored[16:] == -1))
+
+        # vector fields are downsampled per channel
+        vector_field = np.stack((field, -field), axis=-1)[:16, :24]
+        pyramid = FieldPyramid(vector_field, maximum_chunk_size=4, channel_dimension_count=1)
+        self.assertEqual(pyramid.levels[1].shape, (8, 12, 2))
+        self.assertTrue(np.array_equal(pyramid.levels[1][..., 0], FieldPyramid(field[:16, :24], 4).levels[1]))
+        self.assertTrue(np.array_equal(pyramid.levels[1][..., 1], -pyramid.levels[1][..., 0]))
+
+        # 3D volumes are downsampled by averaging over 2x2x2 blocks
+        volume = np.random.RandomState(0).uniform(-1.0, 1.0, (16, 8, 12)).astype(np.float32)
+        pyramid = FieldPyramid(volume, maximum_chunk_size=4, spatial_dimension_count=3)
+        self.assertEqual(pyramid.levels[0].shape, (4, 2, 3))
+        self.assertTrue(np.allclose(pyramid.levels[1][1, 2, 3], volume[2:4, 4:6, 6:8].mean()))
+
+    def test_scalar_pyramid_restrictions(self):
+        with self.assertRaises(ValueError):
+            ScalarFieldPyramid2d(np.zeros((24, 32), dtype=np.float32))
+        with self.assertRaises(ValueError):
+            ScalarFieldPyramid2d(np.zeros((8, 32), dtype=np.float32))
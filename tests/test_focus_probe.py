@@ -0,0 +1,85 @@
+#  ================================================================
+#  Created by agent on 10/18/26.
+#  Copyright (c) 2026 agent
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#  ================================================================
+# stdlib
+from unittest import TestCase, mock
+from contextlib import redirect_stdout
+import io
+import sys
+# libraries
+import numpy as np
+
+# test targets
+from nonrigid_opt.focus_probe import FocusVoxelProbe
+from nonrigid_opt import focus_probe
+from utils.printing import BOLD_GREEN
+
+
+class FocusProbeTest(TestCase):
+    def test_focus_probe01(self):
+        warped_live_field = np.array([[1., 1., 0.49],
+                                      [1., 0.46, 0.4],
+                                      [0.5, 0.1, -0.3]], dtype=np.float32)
+        canonical_field = np.array([[1., 1., 0.5],
+                                    [1., 0.45, 0.3],
+                                    [0.4, 0.05, -0.4]], dtype=np.float32)
+        warp_field = np.zeros((3, 3, 2), dtype=np.float32)
+        warp_field[1, 1] = [0.25, -0.5]
+        stream = io.StringIO()
+        probe = FocusVoxelProbe(1, 1, stream=stream)
+        self.assertTrue(probe.voxel_is_within(warped_live_field))
+        self.assertFalse(FocusVoxelProbe(3, 1).voxel_is_within(warped_live_field))
+
+        for i_iteration in range(2):
+            probe.record_gradients(warped_live_field, canonical_field, warp_field, np.array([0.5, 0.25]),
+                                   np.array([0.1, 0.2]))
+            probe.record_sobolev_gradient(-warp_field)
+            probe.record_warp(warped_live_field, canonical_field, warp_field)
+        self.assertEqual(probe.iteration_count, 2)
+        # output is buffered until flushed
+        self.assertEqual(stream.getvalue(), "")
+        output = probe.get_output()
+        self.assertEqual(len(output.splitlines()), 2)
+        self.assertTrue(output.startswith("[Iteration 0] Point: 1,1"))
+        self.assertIn("[Iteration 1] Point: 1,1", output)
+        self.assertIn("Warp length: ", output)
+        self.assertEqual(output.count(" H1 grad: " + BOLD_GREEN + "[0.250000 -0.500000"), 2)
+        probe.flush()
+        self.assertEqual(stream.getvalue(), output)
+        self.assertEqual(probe.get_output(), "")
+
+        # the detailed output goes to the probe as well, the (process-wide) standard output is never swapped out,
+        # so that output of other threads doesn't end up in the probe
+        detailed_probe = FocusVoxelProbe(1, 1, detailed=True, stream=stream)
+        standard_output = io.StringIO()
+        printing_outputs = []
+
+        def get_and_print_interpolation_data(*args, **kwargs):
+            printing_outputs.append(sys.stdout)
+            return original_get_and_print_interpolation_data(*args, **kwargs)
+
+        original_get_and_print_interpolation_data = focus_probe.get_and_print_interpolation_data
+        with redirect_stdout(standard_output), \
+                mock.patch.object(focus_probe, "get_and_print_interpolation_data", get_and_print_interpolation_data):
+            detailed_probe.record_gradients(warped_live_field, canonical_field, warp_field, np.array([0.5, 0.25]),
+                                            np.array([0.1, 0.2]))
+            detailed_probe.record_warp(warped_live_field, canonical_field, warp_field)
+        self.assertEqual(printing_outputs, [standard_output])
+        self.assertEqual(standard_output.getvalue(), "")
+        detailed_output = detailed_probe.get_output()
+        self.assertIn("Live - canonical", detailed_output)
+        self.assertIn("[Grad data", detailed_output)
+        self.assertIn("[Warp data", detailed_output)
+        self.assertIn("[Interpolation data]", detailed_output)
@@ -60,3 +60,54 @@ class HNSOptimizerTest(TestCase):
         final_live_resampled = resampling.resample_field(live_field, warp_field_out)
         self.assertTrue(np.allclose(warp_field_out, warp_field, atol=10e-6))
         self.assertTrue(np.allclose(final_live_resampled, final_live_field, atol=10e-6))
+
+    def test_batch_operation(self):
+        optimizer = hnso.HierarchicalNonrigidSLAMOptimizer2d(
+            rate=0.2,
+            data_term_amplifier=1.0,
+            maximum_warp_update_threshold=0.001,
+            maximum_iteration_count=100,
+            tikhonov_term_enabled=True,
+            kernel=None,
+            verbosity_parameters=hnso.HierarchicalNonrigidSLAMOptimizer2d.VerbosityParameters(
+                print_max_warp_update=False
+            ))
+        # pairs converge after different iteration counts at each level
+        live_fields = np.stack((live_field, canonical_field, np.roll(live_field, 1, axis=1)))
+        canonical_fields = np.stack((canonical_field, canonical_field, canonical_field))
+        warp_fields_out = optimizer.optimize_batch(canonical_fields, live_fields)
+        self.assertEqual(warp_fields_out.shape, live_fields.shape + (2,))
+        for canonical, live, warp_field_out in zip(canonical_fields, live_fields, warp_fields_out):
+            self.assertTrue(np.array_equal(warp_field_out, optimizer.optimize(canonical, live)))
+
+    def test_level_parameters_and_early_termination(self):
+        # bilinear upsampling preserves constant warps, scaling them to the finer voxel size
+        warp_fields = np.full((1, 2, 3, 2), 0.5, dtype=np.float32)
+        upsampled = hnso.upsample_warp_fields(warp_fields, np.empty((1, 4, 6, 2), dtype=np.float32),
+                                              method=hnso.WarpUpsamplingMethod.BILINEAR)
+        self.assertTrue(np.allclose(upsampled, 1.0))
+
+        def make_optimizer(**kwargs):
+            return hnso.HierarchicalNonrigidSLAMOptimizer2d(
+                rate=0.2, data_term_amplifier=1.0, tikhonov_term_enabled=True, kernel=None,
+                verbosity_parameters=hnso.HierarchicalNonrigidSLAMOptimizer2d.VerbosityParameters(), **kwargs)
+
+        optimizer = make_optimizer(maximum_warp_update_threshold=0.001, maximum_iteration_count=100)
+        optimizer.optimize(canonical_field, live_field)
+        full_iteration_counts = optimizer.iteration_counts
+        level_count = full_iteration_counts.shape[0]
+
+        # per-level iteration budgets
+        optimizer = make_optimizer(maximum_warp_update_threshold=[0.001] * level_count,
+                                   maximum_iteration_count=[100] * (level_count - 1) + [5])
+        optimizer.optimize(canonical_field, live_field)
+        self.assertTrue(np.array_equal(optimizer.iteration_counts[:-1], full_iteration_counts[:-1]))
+        self.assertLessEqual(optimizer.iteration_counts[-1, 0], 5)
+        with self.assertRaises(ValueError):
+            make_optimizer(maximum_iteration_count=[100, 100] * level_count).optimize(canonical_field, live_field)
+
+        optimizer = make_optimizer(maximum_warp_update_threshold=0.001, maximum_iteration_count=100,
+                                   warp_upsampling_method=hnso.WarpUpsamplingMethod.BILINEAR,
+                                   stagnation_window=5, stagnation_threshold=0.001)
+        optimizer.optimize(canonical_field, live_field)
+        self.assertLess(optimizer.iteration_counts.sum(), full_iteration_counts.sum())
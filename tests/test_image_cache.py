@@ -0,0 +1,67 @@
+#  ================================================================
+#  Created by agent on 10/18/26.
+#  Copyright (c) 2026 agent
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#  ================================================================
+# stdlib
+from unittest import TestCase
+import os
+import tempfile
+# libraries
+import numpy as np
+import cv2
+
+# test targets
+from utils.image_cache import ImageCache
+
+
+class ImageCacheTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.paths = []
+        for i_image in range(3):
+            path = os.path.join(self.directory.name, "depth_{:0>6d}.png".format(i_image))
+            cv2.imwrite(path, np.full((4, 8), i_image, dtype=np.uint16))
+            self.paths.append(path)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_image_cache01(self):
+        image_size = 4 * 8 * 2
+        cache = ImageCache(memory_budget=2 * image_size)
+        image0 = cache.load(self.paths[0])
+        self.assertEqual(image0.dtype, np.uint16)
+        self.assertFalse(image0.flags.writeable)
+        self.assertIs(cache.load(self.paths[0]), image0)
+        image1 = cache.load(self.paths[1])
+        cache.load(self.paths[0])
+        # least recently used image (1) is evicted to stay within budget
+        cache.load(self.paths[2])
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.memory_usage, 2 * image_size)
+        self.assertIs(cache.load(self.paths[0]), image0)
+        self.assertIsNot(cache.load(self.paths[1]), image1)
+
+    def test_image_cache02(self):
+        cache = ImageCache()
+        image0 = cache.load(self.paths[0])
+        cv2.imwrite(self.paths[0], np.full((4, 8), 7, dtype=np.uint16))
+        stat = os.stat(self.paths[0])
+        os.utime(self.paths[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000))
+        # file changed, image gets reloaded
+        image0_changed = cache.load(self.paths[0])
+        self.assertTrue(np.all(image0 == 0))
+        self.assertTrue(np.all(image0_changed == 7))
+        self.assertEqual(len(cache), 1)
+        self.assertIsNone(cache.load(os.path.join(self.directory.name, "missing.png")))
@@ -0,0 +1,60 @@
+#  ================================================================
+#  Created by agent on 10/18/26.
+#  Copyright (c) 2026 agent
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#  ================================================================
+# stdlib
+from unittest import TestCase
+# libraries
+import numpy as np
+import scipy.ndimage
+
+# test targets
+from nonrigid_opt.narrow_band import NarrowBandActiveSet, compute_gradient_at, compute_laplacian_at
+from math_utils.convolution import convolve_with_kernel_preserve_zeros, convolve_with_kernel_preserve_zeros_at
+from utils.tsdf_set_routines import set_zeros_for_values_outside_narrow_band_union
+
+
+class NarrowBandTest(TestCase):
+    def test_narrow_band_active_set01(self):
+        np.random.seed(42)
+        field_size = 16
+        canonical_field = np.ones((field_size, field_size), dtype=np.float32)
+        canonical_field[:, 6:10] = np.linspace(0.9, -0.9, 4, dtype=np.float32)
+        canonical_field[:, 10:] = -1.0
+        live_field = np.roll(canonical_field, 2, axis=1)
+        active_set = NarrowBandActiveSet(live_field, canonical_field)
+        self.assertEqual(len(active_set), field_size * 6)
+
+        # all evaluations within the band match the whole-field versions
+        vector_field = np.random.normal(size=(field_size, field_size, 2)).astype(np.float32)
+        set_zeros_for_values_outside_narrow_band_union(live_field, canonical_field, vector_field)
+        gradient_y, gradient_x = np.gradient(live_field)
+        band_gradient_y, band_gradient_x = compute_gradient_at(live_field, *active_set.coordinates)
+        self.assertTrue(np.array_equal(band_gradient_y, active_set.gather(gradient_y)))
+        self.assertTrue(np.array_equal(band_gradient_x, active_set.gather(gradient_x)))
+        laplacian = np.stack((scipy.ndimage.laplace(vector_field[:, :, 0]),
+                              scipy.ndimage.laplace(vector_field[:, :, 1])), axis=2)
+        self.assertTrue(np.array_equal(compute_laplacian_at(vector_field, *active_set.coordinates),
+                                       active_set.gather(laplacian)))
+        kernel = np.array([0.06742075, 0.99544406, 0.06742075], dtype=np.float32)
+        convolved_field = convolve_with_kernel_preserve_zeros(vector_field.copy(), kernel)
+        convolve_with_kernel_preserve_zeros_at(vector_field, kernel, *active_set.coordinates,
+                                               np.zeros_like(vector_field))
+        self.assertTrue(np.array_equal(vector_field, convolved_field))
+
+        # voxels truncated in both fields drop out of the band
+        live_field[:, 11] = -1.0
+        removed_y, removed_x = active_set.update(live_field, canonical_field)
+        self.assertTrue(np.all(removed_x == 11))
+        self.assertEqual(len(active_set), field_size * 5)
@@ -0,0 +1,94 @@
+#  ================================================================
+#  Created by agent on 10/18/26.
+#  Copyright (c) 2026 agent
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#  ================================================================
+# stdlib
+from unittest import TestCase
+import os
+import tempfile
+# libraries
+import numpy as np
+
+# test targets
+from utils.optimization_trace import OptimizationTraceWriter, OptimizationTraceReader
+from utils.point2d import Point2d
+from nonrigid_opt import hns_optimizer2d as hnso
+from tests.hnso_fixtures import live_field, canonical_field, warp_field
+
+
+class OptimizationTraceTest(TestCase):
+    def test_optimization_trace01(self):
+        for compressed in (True, False):
+            with tempfile.TemporaryDirectory() as trace_path:
+                writer = OptimizationTraceWriter(trace_path, chunk_size=4, compressed=compressed, field_stride=2)
+                # two runs of 6 iterations, with fields of a different size in the second run
+                for run_index, field_size in ((0, 8), (1, 16)):
+                    field = np.zeros((field_size, field_size, 2), dtype=np.float32)
+                    for iteration_number in range(6):
+                        field[:] = iteration_number
+                        writer.record(run_index, iteration_number, 0.5 ** iteration_number, Point2d(1, 2),
+                                      data_energy=10.0 - iteration_number, warp_field=field)
+                self.assertEqual(writer.buffered_record_count, 2)
+                writer.close()
+
+                reader = OptimizationTraceReader(trace_path, memory_map=not compressed)
+                self.assertEqual(len(reader), 12)
+                self.assertTrue(np.array_equal(reader.read("run_index"), [0] * 6 + [1] * 6))
+                self.assertTrue(np.allclose(reader.read("max_warp", 2, 9), 0.5 ** np.array([2, 3, 4, 5, 0, 1, 2])))
+                self.assertTrue(np.all(np.isnan(reader.read("smoothing_energy"))))
+                self.assertTrue(np.array_equal(reader.read("max_warp_y", 10), [2, 2]))
+                start, stop = reader.find_run(1)
+                self.assertEqual((start, stop), (6, 12))
+                warp_fields = reader.read("warp_field", start + 1, stop)
+                self.assertEqual(warp_fields.shape, (5, 8, 8, 2))
+                self.assertTrue(np.array_equal(warp_fields[:, 0, 0, 0], [1, 2, 3, 4, 5]))
+                # fields of different sizes can't be read as a single array
+                with self.assertRaises(ValueError):
+                    reader.read("warp_field")
+                with self.assertRaises(KeyError):
+                    reader.read("gradient_field", 0, 4)
+
+                # appending to the existing trace
+                writer = OptimizationTraceWriter(trace_path, chunk_size=4, compressed=compressed)
+                writer.record(0, 0, 1.0)
+                writer.flush()
+                reader.refresh()
+                self.assertEqual(len(reader), 13)
+                self.assertEqual(reader.find_run(0), (12, 13))
+                self.assertFalse(any(name.endswith(".tmp") for name in os.listdir(trace_path)))
+
+    def test_optimization_trace02(self):
+        with tempfile.TemporaryDirectory() as trace_path:
+            writer = OptimizationTraceWriter(trace_path, field_stride=1)
+            optimizer = hnso.HierarchicalNonrigidSLAMOptimizer2d(
+                rate=0.2,
+                data_term_amplifier=1.0,
+                maximum_warp_update_threshold=0.001,
+                maximum_iteration_count=100,
+                tikhonov_term_enabled=False,
+                kernel=None,
+                trace_writer=writer)
+            warp_field_out = optimizer.optimize(canonical_field, live_field)
+            # tracing doesn't affect the results
+            self.assertTrue(np.allclose(warp_field_out, warp_field))
+
+            reader = OptimizationTraceReader(trace_path)
+            self.assertEqual(len(reader), optimizer.iteration_counts.sum())
+            start, stop = reader.find_run(len(optimizer.iteration_counts) - 1)
+            self.assertEqual(stop - start, optimizer.iteration_counts[-1, 0])
+            warp_fields = reader.read("warp_field", start, stop)
+            self.assertTrue(np.allclose(warp_fields[-1], warp_field))
+            self.assertTrue(np.all(reader.read("data_energy") > 0))
+            max_warp_x = reader.read("max_warp_x")
+            self.assertTrue(np.all((max_warp_x >= 0) & (max_warp_x < live_field.shape[1])))
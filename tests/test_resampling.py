@@ -16,6 +16,7 @@
 from unittest import TestCase
 import numpy as np
 from utils import field_resampling as ipt
+from utils import sampling
 import tests.hnso_fixtures as fixtures
 
 import level_set_fusion_optimization as cpp_extension
@@ -273,3 +274,62 @@ class InterpolationTest(TestCase):
         resampled_field = ipt.resample_field_replacement(scalar_field, warp_field, 0.0)
         print(repr(resampled_field))
         self.assertTrue(np.allclose(resampled_field, fixtures.fB_resampled_with_wfB_replacement))
+
+    def test_resample_field_replacement02(self):
+        # replacement that is not representable in the type of the field is interpolated at its own precision
+        warp_field = fixtures.warp_field_B_16x16.copy()
+        warp_field[0, 0] = (-0.5, -0.5)
+        warp_field[15, 15] = (0.5, 0.25)
+        warp_field[7, 0] = (-0.75, 0.0)
+        scalar_field = fixtures.field_B_16x16.astype(np.float32)
+        replacement = 0.1
+        resampled_field = ipt.resample_field_replacement(scalar_field, warp_field, replacement)
+        expected_field = np.ones_like(scalar_field)
+        for y in range(scalar_field.shape[0]):
+            for x in range(scalar_field.shape[1]):
+                expected_field[y, x] = sampling.bilinear_sample_at_replacement(
+                    scalar_field, x + warp_field[y, x, 0], y + warp_field[y, x, 1], replacement=replacement)
+        self.assertEqual(resampled_field.dtype, np.float32)
+        self.assertTrue(np.array_equal(resampled_field, expected_field))
+
+    def test_bilinear_warp_sampler01(self):
+        # vectorized sampler should match per-voxel sampling, including locations partially or fully out-of-bounds
+        warp_field = fixtures.warp_field_B_16x16.copy()
+        warp_field[0, 0] = (-0.5, -0.5)
+        warp_field[15, 15] = (0.5, 0.25)
+        warp_field[7, 0] = (-3.0, 0.0)
+        scalar_field = fixtures.field_B_16x16
+        sampler = sampling.BilinearWarpSampler(warp_field)
+        for replacement in (1.0, 0.0):
+            resampled_field = sampler.sample(scalar_field, replacement=replacement)
+            for y in range(scalar_field.shape[0]):
+                for x in range(scalar_field.shape[1]):
+                    expected_value = sampling.bilinear_sample_at_replacement(
+                        scalar_field, x + warp_field[y, x, 0], y + warp_field[y, x, 1], replacement=replacement)
+                    self.assertAlmostEqual(resampled_field[y, x], expected_value)
+
+    def test_bilinear_warp_sampler02(self):
+        # sampler updated with new warps should produce the same results as one constructed from them
+        warp_field = fixtures.warp_field_B_16x16
+        scalar_field = fixtures.field_B_16x16
+        fields = np.stack((scalar_field, scalar_field * 0.5))
+        sampler = sampling.BilinearWarpSampler(np.zeros_like(warp_field))
+        self.assertTrue(np.array_equal(sampler.sample(scalar_field), scalar_field))
+        sampler.update(warp_field)
+        expected_sampler = sampling.BilinearWarpSampler(warp_field)
+        self.assertTrue(np.array_equal(sampler.sample(scalar_field), expected_sampler.sample(scalar_field)))
+        resampled_fields = np.empty_like(fields)
+        sampler.sample_stack(fields, (1.0, 0.0), out=resampled_fields)
+        self.assertTrue(np.array_equal(resampled_fields,
+                                       expected_sampler.sample_stack(fields, (1.0, 0.0)).astype(np.float32)))
+
+    def test_resample_fields01(self):
+        warp_field = fixtures.warp_field_B_16x16
+        scalar_field = fixtures.field_B_16x16
+        fields = np.stack((scalar_field, scalar_field * 0.5, scalar_field))
+        resampled_fields = ipt.resample_fields(fields, warp_field, (0.0, 0.0, 1.0))
+        self.assertEqual(resampled_fields.shape, fields.shape)
+        self.assertTrue(np.allclose(resampled_fields[0], fixtures.fB_resampled_with_wfB_replacement))
+        self.assertTrue(np.allclose(resampled_fields[1],
+                                    ipt.resample_field_replacement(scalar_field * 0.5, warp_field, 0.0)))
+        self.assertTrue(np.allclose(resampled_fields[2], ipt.resample_field(scalar_field, warp_field)))
@@ -0,0 +1,65 @@
+#  ================================================================
+#  Created by agent on 10/18/26.
+#  Copyright (c) 2026 agent
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#  ================================================================
+# stdlib
+from unittest import TestCase
+import os
+import tempfile
+# libraries
+import numpy as np
+import cv2
+
+# test targets
+from experiment import experiment_shared_routines as shared
+
+
+class RowEmptinessIndexTest(TestCase):
+    def test_row_emptiness_index01(self):
+        with tempfile.TemporaryDirectory() as directory:
+            frame_path_format_string = os.path.join(directory, "depth_{:0>6d}.png")
+            mask_path_format_string = os.path.join(directory, "mask_{:0>6d}.png")
+            for frame_index in range(3):
+                image = np.zeros((12, 5), dtype=np.uint16)
+                image[frame_index:frame_index + 8] = 1000
+                mask = np.full((12, 5), 255, dtype=np.uint8)
+                mask[6] = 0
+                cv2.imwrite(frame_path_format_string.format(frame_index), image)
+                cv2.imwrite(mask_path_format_string.format(frame_index), mask)
+
+            index_path = os.path.join(directory, shared.NON_EMPTY_ROW_INDEX_FILENAME)
+
+            def build_index():
+                return shared.build_non_empty_row_index(3, frame_path_format_string, mask_path_format_string, True)
+
+            non_empty_rows = shared.load_or_build_non_empty_row_index(index_path, 3, True, build_index)
+            self.assertEqual(non_empty_rows.shape, (3, 12))
+            self.assertTrue(os.path.exists(index_path))
+            for frame_index in range(3):
+                for ix_row in range(12):
+                    self.assertEqual(non_empty_rows[frame_index, ix_row],
+                                     not shared.is_image_row_empty(frame_path_format_string.format(frame_index),
+                                                                   mask_path_format_string.format(frame_index),
+                                                                   ix_row, True))
+
+            # persisted index is reused as long as it matches the dataset
+            self.assertTrue(np.array_equal(shared.load_non_empty_row_index(index_path, 3, True), non_empty_rows))
+            self.assertIsNone(shared.load_non_empty_row_index(index_path, 4, True))
+            self.assertIsNone(shared.load_non_empty_row_index(index_path, 3, False))
+
+            # rows 2-8 except 6 are non-empty in both frames 1 & 2
+            self.assertEqual(shared.sample_non_empty_row(non_empty_rows, (1, 2), (0, 12), 4), 4)
+            for _ in range(20):
+                self.assertIn(shared.sample_non_empty_row(non_empty_rows, (1, 2), (0, 12), 6), [2, 3, 4, 5, 7, 8])
+            self.assertIsNone(shared.sample_non_empty_row(non_empty_rows, (0, 2), (9, 12)))
@@ -58,3 +58,27 @@ class MyTestCase(TestCase):
         twist = optimizer.optimize(data_to_use, narrow_band_width_voxels=narrow_band_width_voxels, iteration=iteration)
 
         self.assertTrue(np.allclose(expected_twist, twist, atol=10e-6))
+
+    def test_compute_normal_equations01(self):
+        random_state = np.random.RandomState(0)
+        canonical_field = random_state.uniform(-1.0, 1.0, (8, 6)).astype(np.float32)
+        live_field = random_state.uniform(-1.0, 1.0, (8, 6)).astype(np.float32)
+        live_gradient = random_state.uniform(-10.0, 10.0, (8, 6, 3)).astype(np.float32)
+        twist = np.array([[0.01], [-0.02], [0.1]])
+        weights = random_state.uniform(0.0, 1.0, (8, 6)) > 0.5
+
+        expected_matrix_a = np.zeros((3, 3))
+        expected_vector_b = np.zeros((3, 1))
+        for y_field in range(live_field.shape[0]):
+            for x_field in range(live_field.shape[1]):
+                if not weights[y_field, x_field]:
+                    continue
+                jacobian = live_gradient[y_field, x_field][None, :].astype(np.float64)
+                expected_matrix_a += np.dot(jacobian.T, jacobian)
+                expected_vector_b += (canonical_field[y_field, x_field] - live_field[y_field, x_field] +
+                                      np.dot(jacobian, twist)) * jacobian.T
+
+        matrix_a, vector_b = sdf2sdfo.compute_normal_equations(canonical_field, live_field, live_gradient, twist,
+                                                               weights)
+        self.assertTrue(np.allclose(matrix_a, expected_matrix_a))
+        self.assertTrue(np.allclose(vector_b, expected_vector_b))
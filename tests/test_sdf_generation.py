@@ -4,9 +4,92 @@ import numpy as np
 import math
 from calib.camera import DepthCamera
 from tsdf import generation as tsdf_gen
+from tsdf.common import GenerationMethod, compute_tsdf_value
+import utils.sampling as sampling
 from math_utils.transformation import twist_vector_to_matrix3d
 
 
+def generate_2d_tsdf_field_per_voxel(depth_image, camera, image_y_coordinate, camera_extrinsic_matrix, field_size,
+                                     voxel_size, array_offset, narrow_band_width_voxels, generation_method):
+    # reference (non-vectorized) implementation of the 2D non-EWA generators, computing each voxel separately
+    field = np.ones((field_size, field_size), dtype=np.float32)
+    projection_matrix = camera.intrinsics.intrinsic_matrix
+    depth_ratio = camera.depth_unit_ratio
+    narrow_band_half_width = narrow_band_width_voxels / 2 * voxel_size
+
+    for y_field in range(field_size):
+        for x_field in range(field_size):
+            x_voxel = (x_field + array_offset[0]) * voxel_size
+            z_voxel = (y_field + array_offset[2]) * voxel_size
+            point = np.array([[x_voxel, 0.0, z_voxel, 1.0]], dtype=np.float32).T
+            point_in_camera_space = camera_extrinsic_matrix.dot(point).flatten()
+            if point_in_camera_space[2] <= 0:
+                continue
+            image_x_coordinate = projection_matrix[0, 0] * point_in_camera_space[0] / point_in_camera_space[2] + \
+                projection_matrix[0, 2]
+
+            if generation_method == GenerationMethod.BILINEAR_TSDF:
+                ratios = sampling.get_bilinear_ratios(image_x_coordinate, image_y_coordinate)
+                base_x = math.floor(image_x_coordinate)
+                base_y = math.floor(image_y_coordinate)
+                values = []
+                for x_image, y_image in ((base_x, base_y), (base_x, base_y + 1), (base_x + 1, base_y),
+                                         (base_x + 1, base_y + 1)):
+                    if x_image < 0 or x_image >= depth_image.shape[1]:
+                        values.append(1.0)
+                        continue
+                    depth = depth_image[y_image, x_image] * depth_ratio
+                    values.append(compute_tsdf_value(depth - point_in_camera_space[2], narrow_band_half_width))
+                field[y_field, x_field] = sampling.interpolate_bilinearly(values, ratios)
+                continue
+
+            if generation_method == GenerationMethod.NONE:
+                image_x_coordinate = int(image_x_coordinate + 0.5)
+            if image_x_coordinate < 0 or image_x_coordinate >= depth_image.shape[1]:
+                continue
+            if generation_method == GenerationMethod.NONE:
+                depth = depth_image[image_y_coordinate, image_x_coordinate] * depth_ratio
+            else:
+                depth = sampling.bilinear_sample_at(depth_image, image_x_coordinate, image_y_coordinate) * depth_ratio
+            if depth <= 0.0:
+                continue
+            field[y_field, x_field] = compute_tsdf_value(depth - point_in_camera_space[2], narrow_band_half_width)
+
+    return field
+
+
+def generate_3d_tsdf_field_per_voxel(depth_image, camera, camera_extrinsic_matrix, field_size, voxel_size,
+                                     array_offset, narrow_band_width_voxels):
+    # reference (non-vectorized) implementation of the 3D generator, computing each voxel separately
+    field = np.ones((field_size, field_size, field_size), dtype=np.float32)
+    projection_matrix = camera.intrinsics.intrinsic_matrix
+    depth_ratio = camera.depth_unit_ratio
+    narrow_band_half_width = narrow_band_width_voxels / 2 * voxel_size
+
+    for x_field, y_field, z_field in np.ndindex(field_size, field_size, field_size):
+        x_voxel = (x_field + array_offset[0]) * voxel_size
+        y_voxel = (y_field + array_offset[1]) * voxel_size
+        z_voxel = (z_field + array_offset[2]) * voxel_size
+        point = np.array([[x_voxel, y_voxel, z_voxel, 1.0]], dtype=np.float32).T
+        point_in_camera_space = camera_extrinsic_matrix.dot(point).flatten()
+        if point_in_camera_space[2] <= 0:
+            continue
+        image_x_coordinate = int(projection_matrix[0, 0] * point_in_camera_space[0] / point_in_camera_space[2] +
+                                 projection_matrix[0, 2] + 0.5)
+        image_y_coordinate = int(projection_matrix[1, 1] * point_in_camera_space[1] / point_in_camera_space[2] +
+                                 projection_matrix[1, 2] + 0.5)
+        if image_x_coordinate < 0 or image_x_coordinate >= depth_image.shape[1] \
+                or image_y_coordinate < 0 or image_y_coordinate >= depth_image.shape[0]:
+            continue
+        depth = depth_image[image_y_coordinate, image_x_coordinate] * depth_ratio
+        if depth <= 0.0:
+            continue
+        field[x_field, y_field, z_field] = compute_tsdf_value(depth - point_in_camera_space[2],
+                                                              narrow_band_half_width)
+
+    return field
+
+
 class MyTestCase(TestCase):
 
     def test_sdf_generation01(self):
@@ -280,3 +363,119 @@ class MyTestCase(TestCase):
                                                                  array_offset=offset,
                                                                  narrow_band_width_voxels=narrow_band_width_voxels)
         self.assertTrue(np.allclose(expected_field, field))
+
+    def test_sdf_generation11(self):
+        # bilinear interpolation methods on a constant depth image
+        depth_image = np.ones((3, 3))
+        image_pixel_row = 1
+        offset = np.array([-1, -1, 1])
+        field_size = 3
+        narrow_band_width_voxels = 1
+
+        intrinsic_matrix = np.array([[1, 0, 1],  # FX = 1 CX = 1
+                                     [0, 1, 1],  # FY = 1 CY = 1
+                                     [0, 0, 1]], dtype=np.float32)
+
+        depth_camera = DepthCamera(intrinsics=DepthCamera.Intrinsics(resolution=(3, 3),
+                                                                     intrinsic_matrix=intrinsic_matrix),
+                                   depth_unit_ratio=1)
+
+        expected_field = np.array([[0, 0, 0],
+                                   [-1, -1, -1],
+                                   [-1, -1, -1]])
+        for generation_method in (GenerationMethod.BILINEAR_IMAGE, GenerationMethod.BILINEAR_TSDF):
+            field = tsdf_gen.generate_2d_tsdf_field_from_depth_image(depth_image, depth_camera, image_pixel_row,
+                                                                     field_size=field_size,
+                                                                     default_value=-999,
+                                                                     voxel_size=1,
+                                                                     array_offset=offset,
+                                                                     narrow_band_width_voxels=narrow_band_width_voxels,
+                                                                     generation_method=generation_method)
+            self.assertTrue(np.allclose(expected_field, field))
+
+    def test_sdf_generation12(self):
+        # vectorized generators produce exactly the same fields as the per-voxel computation
+        random_state = np.random.RandomState(0)
+        depth_image = (random_state.rand(480, 640) * 3000 + 200).astype(np.uint16)
+        depth_image[random_state.rand(480, 640) < 0.05] = 0
+        image_pixel_row = 223
+        field_size = 64
+        offset = np.array([-32, -32, 100])
+        intrinsic_matrix = np.array([[525.3, 0, 319.7],
+                                     [0, 525.1, 239.4],
+                                     [0, 0, 1]], dtype=np.float32)
+        depth_camera = DepthCamera(intrinsics=DepthCamera.Intrinsics(resolution=(480, 640),
+                                                                     intrinsic_matrix=intrinsic_matrix),
+                                   depth_unit_ratio=0.00125)
+        twist3d = np.array([[0.013], [-0.021], [0.008], [0.05], [-0.03], [0.11]])
+        camera_extrinsic_matrix = twist_vector_to_matrix3d(twist3d).astype(np.float32)
+
+        for generation_method in (GenerationMethod.NONE, GenerationMethod.BILINEAR_IMAGE,
+                                  GenerationMethod.BILINEAR_TSDF):
+            expected_field = generate_2d_tsdf_field_per_voxel(depth_image, depth_camera, image_pixel_row,
+                                                              camera_extrinsic_matrix, field_size, 0.004, offset, 20,
+                                                              generation_method)
+            field = tsdf_gen.generate_2d_tsdf_field_from_depth_image(depth_image, depth_camera, image_pixel_row,
+                                                                     camera_extrinsic_matrix=camera_extrinsic_matrix,
+                                                                     field_size=field_size, default_value=1,
+                                                                     voxel_size=0.004, array_offset=offset,
+                                                                     narrow_band_width_voxels=20,
+                                                                     generation_method=generation_method)
+            # some voxels are within the narrow band
+            self.assertTrue(np.any(np.abs(expected_field) < 1.0))
+            self.assertTrue(np.array_equal(expected_field, field))
+
+    def test_sdf_generation_3d01(self):
+        depth_image = np.ones((3, 3))
+        offset = np.array([-1, -1, 1])
+        field_size = 3
+        narrow_band_width_voxels = 1
+
+        intrinsic_matrix = np.array([[1, 0, 1],  # FX = 1 CX = 1
+                                     [0, 1, 1],  # FY = 1 CY = 1
+                                     [0, 0, 1]], dtype=np.float32)
+
+        depth_camera = DepthCamera(intrinsics=DepthCamera.Intrinsics(resolution=(3, 3),
+                                                                     intrinsic_matrix=intrinsic_matrix),
+                                   depth_unit_ratio=1)
+
+        # every y-slice should look like the 2D field (indexed as [z, x]) for the same constant depth image
+        expected_slice = np.array([[0, 0, 0],
+                                   [-1, -1, -1],
+                                   [-1, -1, -1]])
+        for maximum_chunk_voxel_count in (1, 9, 27):
+            field = tsdf_gen.generate_3d_tsdf_field_from_depth_image(
+                depth_image, depth_camera, field_size=field_size, default_value=-999, voxel_size=1,
+                array_offset=offset, narrow_band_width_voxels=narrow_band_width_voxels,
+                maximum_chunk_voxel_count=maximum_chunk_voxel_count)
+            for y_field in range(field_size):
+                self.assertTrue(np.allclose(expected_slice.T, field[:, y_field, :]))
+
+    def test_sdf_generation_3d02(self):
+        # vectorized generator produces exactly the same fields as the per-voxel computation, regardless of chunking
+        random_state = np.random.RandomState(0)
+        depth_image = (random_state.rand(120, 160) * 80 + 760).astype(np.uint16)
+        depth_image[random_state.rand(120, 160) < 0.05] = 0
+        field_size = 24
+        offset = np.array([-12, -12, 240])
+        intrinsic_matrix = np.array([[128.0, 0, 79.5],
+                                     [0, 128.0, 59.5],
+                                     [0, 0, 1]], dtype=np.float32)
+        depth_camera = DepthCamera(intrinsics=DepthCamera.Intrinsics(resolution=(120, 160),
+                                                                     intrinsic_matrix=intrinsic_matrix),
+                                   depth_unit_ratio=0.00125)
+        # camera rotated by 90 degrees around its optical axis: many voxels project to exactly half a pixel, where
+        # rounding depends on the precision of the projection
+        twist3d = np.array([[0.002], [0.0], [0.004], [0.0], [0.0], [math.pi / 2]])
+        camera_extrinsic_matrix = twist_vector_to_matrix3d(twist3d).astype(np.float32)
+
+        expected_field = generate_3d_tsdf_field_per_voxel(depth_image, depth_camera, camera_extrinsic_matrix,
+                                                          field_size, 0.004, offset, 20)
+        # some voxels are within the narrow band
+        self.assertTrue(np.any(np.abs(expected_field) < 1.0))
+        for maximum_chunk_voxel_count in (1, 1000, field_size ** 2 * 5, 2 ** 21):
+            field = tsdf_gen.generate_3d_tsdf_field_from_depth_image(
+                depth_image, depth_camera, camera_extrinsic_matrix=camera_extrinsic_matrix, field_size=field_size,
+                default_value=1, voxel_size=0.004, array_offset=offset, narrow_band_width_voxels=20,
+                maximum_chunk_voxel_count=maximum_chunk_voxel_count)
+            self.assertTrue(np.array_equal(expected_field, field))
@@ -15,6 +15,8 @@
 #  ================================================================
 # stlib
 from unittest import TestCase
+from contextlib import redirect_stdout
+import io
 # libraries
 import numpy as np
 
@@ -25,9 +27,10 @@ import utils.sampling as sampling
 from nonrigid_opt.slavcheva_visualizer import SlavchevaVisualizer
 from nonrigid_opt.smoothing_term import SmoothingTermMethod
 from nonrigid_opt.sobolev_filter import generate_1d_sobolev_kernel
+from nonrigid_opt.focus_probe import FocusVoxelProbe
 
 
-def make_optimizer(compute_method, field_size, max_iterations=1):
+def make_optimizer(compute_method, field_size, max_iterations=1, probes=None):
     view_scaling_factor = 1024 // field_size
     optimizer = SlavchevaOptimizer2d(out_path="output/test_non_rigid_out",
                                      field_size=field_size,
@@ -51,6 +54,7 @@ def make_optimizer(compute_method, field_size, max_iterations=1):
                                      max_iterations=max_iterations,
 
                                      sobolev_kernel=generate_1d_sobolev_kernel(size=3, strength=0.1),
+                                     probes=probes,
                                      visualization_settings=SlavchevaVisualizer.Settings(
                                          enable_component_fields=True,
                                          view_scaling_factor=view_scaling_factor))
@@ -103,6 +107,10 @@ class TestNonRigidOptimization(TestCase):
         live_field = live_field_template.copy()
         optimizer.optimize(live_field, canonical_field)
         self.assertTrue(np.allclose(live_field, expected_live_field_out))
+        optimizer = make_optimizer(ComputeMethod.VECTORIZED_ACTIVE_SET, field_size, 1)
+        live_field = live_field_template.copy()
+        optimizer.optimize(live_field, canonical_field)
+        self.assertTrue(np.allclose(live_field, expected_live_field_out))
 
     def test_nonrigid_optimization02(self):
         sampling.set_focus_coordinates(0, 0)
@@ -128,3 +136,40 @@ class TestNonRigidOptimization(TestCase):
         optimizer = make_optimizer(ComputeMethod.VECTORIZED, field_size, 2)
         optimizer.optimize(live_field, canonical_field)
         self.assertTrue(np.allclose(live_field, expected_live_field_out))
+        live_field = live_field_template.copy()
+        optimizer = make_optimizer(ComputeMethod.VECTORIZED_ACTIVE_SET, field_size, 2)
+        optimizer.optimize(live_field, canonical_field)
+        self.assertTrue(np.allclose(live_field, expected_live_field_out))
+        # the second pair is already aligned, so it drops out of the batch after the first iteration
+        live_fields = np.stack((live_field_template, canonical_field))
+        canonical_fields = np.stack((canonical_field, canonical_field))
+        optimizer = make_optimizer(ComputeMethod.VECTORIZED, field_size, 2)
+        optimizer.optimize_batch(live_fields, canonical_fields)
+        self.assertTrue(np.allclose(live_fields[0], expected_live_field_out))
+        self.assertTrue(np.array_equal(live_fields[1], canonical_field))
+
+    def test_nonrigid_optimization03(self):
+        # focus voxel output (including the Sobolev-smoothed gradient & the interpolation data) only goes to the probe
+        field_size = 4
+        live_field_template = np.array([[1., 1., 0.49999955, 0.42499956],
+                                        [1., 0.44999936, 0.34999937, 0.32499936],
+                                        [1., 0.35000065, 0.25000066, 0.22500065],
+                                        [1., 0.20000044, 0.15000044, 0.07500044]], dtype=np.float32)
+        canonical_field = np.array([[1.0000000e+00, 1.0000000e+00, 3.7499955e-01, 2.4999955e-01],
+                                    [1.0000000e+00, 3.2499936e-01, 1.9999936e-01, 1.4999935e-01],
+                                    [1.0000000e+00, 1.7500064e-01, 1.0000064e-01, 5.0000645e-02],
+                                    [1.0000000e+00, 7.5000443e-02, 4.4107438e-07, -9.9999562e-02]], dtype=np.float32)
+        for compute_method in (ComputeMethod.DIRECT, ComputeMethod.VECTORIZED, ComputeMethod.VECTORIZED_ACTIVE_SET):
+            sampling.set_focus_coordinates(1, 1)
+            probe_stream = io.StringIO()
+            optimizer = make_optimizer(compute_method, field_size, 2,
+                                       probes=[FocusVoxelProbe(1, 1, detailed=True, stream=probe_stream)])
+            standard_output = io.StringIO()
+            with redirect_stdout(standard_output):
+                optimizer.optimize(live_field_template.copy(), canonical_field)
+            probe_output = probe_stream.getvalue()
+            self.assertEqual(probe_output.count(" H1 grad: "), 2)
+            self.assertEqual(probe_output.count("[Interpolation data]"), 2)
+            self.assertNotIn(" H1 grad: ", standard_output.getvalue())
+            self.assertNotIn("[Interpolation data]", standard_output.getvalue())
+            self.assertEqual(standard_output.getvalue().count(" done]"), 2)
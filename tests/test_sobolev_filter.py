@@ -0,0 +1,69 @@
+#  ================================================================
+#  Created by agent on 10/18/26.
+#  Copyright (c) 2026 agent
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#  ================================================================
+# stdlib
+from unittest import TestCase
+import os
+import tempfile
+# libraries
+import numpy as np
+
+# test targets
+from nonrigid_opt import sobolev_filter as sf
+
+
+class SobolevFilterTest(TestCase):
+    def test_sparse_laplacian01(self):
+        for size in [2, 3, 4]:
+            self.assertTrue(np.array_equal(
+                sf.generate_sparse_7pt_stencil_finite_difference_laplacian_matrix(size, np.float32).toarray(),
+                sf.generate_7pt_stencil_finite_difference_laplacian_matrix(size, np.float32)))
+            self.assertTrue(np.array_equal(
+                sf.generate_sparse_7pt_stencil_finite_difference_laplacian_matrix(
+                    size, np.float32, clip_at_block_boundaries=False).toarray(),
+                sf.generate_7pt_stencil_finite_difference_laplacian_matrix2(size, np.float32)))
+
+    def test_sobolev_kernel_cache01(self):
+        expected_kernel = np.array([0.06742075, 0.99544406, 0.06742075], dtype=np.float32)
+        with tempfile.TemporaryDirectory() as directory:
+            sf.clear_sobolev_kernel_memo()
+            kernel = sf.generate_1d_sobolev_kernel(size=3, strength=0.1, cache_directory=directory)
+            self.assertTrue(np.allclose(kernel, expected_kernel, atol=1e-6))
+            self.assertEqual(len(os.listdir(directory)), 1)
+            # memoized result is returned as a copy
+            kernel[:] = 0.0
+            self.assertTrue(np.array_equal(sf.generate_1d_sobolev_kernel(size=3, strength=0.1,
+                                                                         cache_directory=directory),
+                                           sf.generate_1d_sobolev_kernel(size=3, strength=0.1, use_cache=False)))
+            # fresh process: result gets loaded from disk
+            sf.clear_sobolev_kernel_memo()
+            u_matrices = sf.generate_1d_sobolev_kernel(size=3, strength=0.1, cache_directory=directory,
+                                                       return_u_matrices=True)
+            self.assertEqual(u_matrices[1].dtype, np.float32)
+            self.assertTrue(np.allclose(-u_matrices[1][:, 0], expected_kernel, atol=1e-6))
+            sf.clear_sobolev_kernel_memo()
+
+    def test_sobolev_kernel_solvers01(self):
+        for alternative_laplacian_method in [False, True]:
+            expected_u_matrices = sf.generate_1d_sobolev_kernel(
+                size=5, strength=0.1, precision=np.float64, alternative_laplacian_method=alternative_laplacian_method,
+                return_u_matrices=True, use_cache=False, solver=sf.SobolevSystemSolver.DENSE)
+            for solver in [sf.SobolevSystemSolver.SPARSE_DIRECT, sf.SobolevSystemSolver.CONJUGATE_GRADIENT]:
+                u_matrices = sf.generate_1d_sobolev_kernel(
+                    size=5, strength=0.1, precision=np.float64,
+                    alternative_laplacian_method=alternative_laplacian_method, return_u_matrices=True,
+                    use_cache=False, solver=solver)
+                for u_matrix, expected_u_matrix in zip(u_matrices, expected_u_matrices):
+                    self.assertTrue(np.allclose(u_matrix[:, 0], expected_u_matrix[:, 0], atol=1e-9))
@@ -21,6 +21,102 @@ import tests.ewa_test_data as data
 import tsdf.ewa as ewa
 import os.path
 import cv2
+import math_utils.elliptical_gaussians as eg
+from tsdf.common import compute_tsdf_value
+from math_utils.transformation import twist_vector_to_matrix3d
+
+
+def compute_ewa_tsdf_value_per_voxel(depth_image, camera, voxel_camera, covariance_camera_space,
+                                     squared_radius_threshold, narrow_band_half_width, averaging_mode,
+                                     image_y_coordinate=None):
+    # reference (non-vectorized) implementation of EWA sampling for a single voxel, returns None if the voxel gets no
+    # value
+    camera_intrinsic_matrix = camera.intrinsics.intrinsic_matrix
+    ray_distance = np.linalg.norm(voxel_camera)
+    z_cam_squared = voxel_camera[2] ** 2
+    projection_jacobian = \
+        np.array([[1 / voxel_camera[2], 0, -voxel_camera[0] / z_cam_squared],
+                  [0, 1 / voxel_camera[2], -voxel_camera[1] / z_cam_squared],
+                  [voxel_camera[0] / ray_distance, voxel_camera[1] / ray_distance, voxel_camera[2] / ray_distance]])
+    remapped_covariance = projection_jacobian.dot(covariance_camera_space).dot(projection_jacobian.T)
+    image_space_scaling_matrix = camera_intrinsic_matrix[0:2, 0:2]
+    final_covariance = image_space_scaling_matrix.dot(remapped_covariance[0:2, 0:2]).dot(
+        image_space_scaling_matrix.T) + np.eye(2)
+    gaussian = eg.EllipticalGaussian(eg.ImplicitEllipse(Q=np.linalg.inv(final_covariance), F=squared_radius_threshold))
+
+    voxel_image = (camera_intrinsic_matrix.dot(voxel_camera) / voxel_camera[2])[:2]
+    if image_y_coordinate is not None:
+        voxel_image[1] = image_y_coordinate
+    voxel_image = voxel_image.reshape(-1, 1)
+    bounds_max = gaussian.ellipse.get_bounds()
+    if averaging_mode == ewa.EwaAveragingMode.TSDF_INCLUSIVE:
+        result = ewa.find_sampling_bounds_helper2(bounds_max, depth_image, voxel_image)
+    else:
+        result = ewa.find_sampling_bounds_helper(bounds_max, depth_image, voxel_image)
+    if result is None:
+        return None
+    (start_x, end_x, start_y, end_y) = result
+
+    weights_sum = 0.0
+    value_sum = 0.0
+    for y_sample in range(start_y, end_y):
+        for x_sample in range(start_x, end_x):
+            sample_centered = np.array([[x_sample], [y_sample]], dtype=np.float64) - voxel_image
+            dist_sq = gaussian.get_distance_from_center_squared(sample_centered)
+            if dist_sq > squared_radius_threshold:
+                continue
+            weight = gaussian.compute(dist_sq)
+            if y_sample < 0 or y_sample >= depth_image.shape[0] or x_sample < 0 or x_sample >= depth_image.shape[1]:
+                value_sum += weight * 1.0
+            else:
+                surface_depth = depth_image[y_sample, x_sample] * camera.depth_unit_ratio
+                if surface_depth <= 0.0:
+                    continue
+                if averaging_mode == ewa.EwaAveragingMode.DEPTH:
+                    value_sum += weight * surface_depth
+                else:
+                    value_sum += weight * compute_tsdf_value(surface_depth - voxel_camera[2], narrow_band_half_width)
+            weights_sum += weight
+
+    if averaging_mode == ewa.EwaAveragingMode.DEPTH:
+        if value_sum <= 0.0:
+            return None
+        return compute_tsdf_value(value_sum / weights_sum - voxel_camera[2], narrow_band_half_width)
+    if weights_sum == 0.0:
+        return None
+    return value_sum / weights_sum
+
+
+def generate_tsdf_ewa_per_voxel(depth_image, camera, camera_extrinsic_matrix, field_shape, voxel_size, array_offset,
+                                narrow_band_width_voxels, gaussian_covariance_scale, averaging_mode,
+                                image_y_coordinate=None):
+    # reference (non-vectorized) implementation of the EWA generators, computing each voxel separately. For 2D fields
+    # (when image_y_coordinate is set), field_shape is (field size, field size) and indices are [z, x]; for 3D fields
+    # indices are [x, y, z].
+    field = np.ones(field_shape, dtype=np.float32)
+    narrow_band_half_width = narrow_band_width_voxels / 2 * voxel_size
+    camera_rotation_matrix = camera_extrinsic_matrix[0:3, 0:3]
+    covariance_camera_space = camera_rotation_matrix.dot(np.eye(3) * (gaussian_covariance_scale * voxel_size)) \
+        .dot(camera_rotation_matrix.T)
+    squared_radius_threshold = 4.0 * gaussian_covariance_scale * voxel_size
+
+    for index in np.ndindex(*field_shape):
+        if image_y_coordinate is not None:
+            x_voxel = (index[1] + array_offset[0]) * voxel_size
+            y_voxel = 0
+            z_voxel = (index[0] + array_offset[2]) * voxel_size
+        else:
+            x_voxel, y_voxel, z_voxel = ((index[i] + array_offset[i]) * voxel_size for i in range(3))
+        voxel_world = np.array([[x_voxel, y_voxel, z_voxel, 1.0]], dtype=np.float32).T
+        voxel_camera = camera_extrinsic_matrix.dot(voxel_world).flatten()[:3]
+        if voxel_camera[2] <= 0:
+            continue
+        value = compute_ewa_tsdf_value_per_voxel(depth_image, camera, voxel_camera, covariance_camera_space,
+                                                 squared_radius_threshold, narrow_band_half_width, averaging_mode,
+                                                 image_y_coordinate)
+        if value is not None:
+            field[index] = value
+    return field
 
 
 class TsdfTest(TestCase):
@@ -204,3 +300,63 @@ class TsdfTest(TestCase):
                                            gaussian_covariance_scale=0.5)
 
         self.assertTrue(np.allclose(field, data.sdf_3d_slice02))
+
+    def test_3d_ewa_tsdf_generation3(self):
+        filename = "zigzag2_depth_00108.png"
+        depth_image = self.image_load_helper(filename)
+        array_offset = np.array([-46, -8, 105], dtype=np.int32)
+        field_shape = np.array([16, 1, 16], dtype=np.int32)
+        camera_intrinsic_matrix = np.array([[700., 0., 320.],
+                                            [0., 700., 240.],
+                                            [0., 0., 1.]])
+        camera = cam.DepthCamera(intrinsics=cam.Camera.Intrinsics((640, 480), intrinsic_matrix=camera_intrinsic_matrix),
+                                 depth_unit_ratio=0.001)
+
+        for maximum_chunk_voxel_count in [1, 7, 256]:
+            field = \
+                ewa.generate_tsdf_3d_ewa_image(depth_image, camera,
+                                               field_shape=field_shape,
+                                               array_offset=array_offset,
+                                               voxel_size=0.004,
+                                               gaussian_covariance_scale=0.5,
+                                               maximum_chunk_voxel_count=maximum_chunk_voxel_count)
+            self.assertTrue(np.allclose(field, data.sdf_3d_slice02))
+
+    def test_ewa_tsdf_generation_per_voxel01(self):
+        # batched generators produce exactly the same fields as the per-voxel computation
+        random_state = np.random.RandomState(0)
+        depth_image = (random_state.rand(48, 64) * 300 + 900).astype(np.uint16)
+        depth_image[random_state.rand(48, 64) < 0.05] = 0
+        intrinsic_matrix = np.array([[52.53, 0, 31.97],
+                                     [0, 52.51, 23.94],
+                                     [0, 0, 1]], dtype=np.float32)
+        camera = cam.DepthCamera(intrinsics=cam.Camera.Intrinsics((64, 48), intrinsic_matrix=intrinsic_matrix),
+                                 depth_unit_ratio=0.001)
+        twist3d = np.array([[0.013], [-0.021], [0.008], [0.05], [-0.03], [0.11]])
+        camera_extrinsic_matrix = twist_vector_to_matrix3d(twist3d).astype(np.float32)
+        array_offset = np.array([-8, -8, 90])
+
+        for averaging_mode, generator in ((ewa.EwaAveragingMode.DEPTH, ewa.generate_tsdf_2d_ewa_image),
+                                          (ewa.EwaAveragingMode.TSDF, ewa.generate_tsdf_2d_ewa_tsdf),
+                                          (ewa.EwaAveragingMode.TSDF_INCLUSIVE,
+                                           ewa.generate_tsdf_2d_ewa_tsdf_inclusive)):
+            expected_field = generate_tsdf_ewa_per_voxel(depth_image, camera, camera_extrinsic_matrix, (16, 16),
+                                                         0.01, array_offset, 20, 1.0, averaging_mode,
+                                                         image_y_coordinate=23)
+            field = generator(depth_image, camera, 23, camera_extrinsic_matrix=camera_extrinsic_matrix, field_size=16,
+                              voxel_size=0.01, array_offset=array_offset)
+            # some voxels are within the narrow band
+            self.assertTrue(np.any(np.abs(expected_field) < 1.0))
+            self.assertTrue(np.array_equal(expected_field, field))
+
+        field_shape = np.array([8, 8, 8])
+        expected_field = generate_tsdf_ewa_per_voxel(depth_image, camera, camera_extrinsic_matrix, tuple(field_shape),
+                                                     0.01, array_offset, 20, 1.0, ewa.EwaAveragingMode.DEPTH)
+        self.assertTrue(np.any(np.abs(expected_field) < 1.0))
+        for maximum_chunk_voxel_count in [1, 100, 2 ** 18]:
+            field = ewa.generate_tsdf_3d_ewa_image(depth_image, camera,
+                                                   camera_extrinsic_matrix=camera_extrinsic_matrix,
+                                                   field_shape=field_shape, voxel_size=0.01,
+                                                   array_offset=array_offset,
+                                                   maximum_chunk_voxel_count=maximum_chunk_voxel_count)
+            self.assertTrue(np.array_equal(expected_field, field))
@@ -0,0 +1,60 @@
+#  ================================================================
+#  Created by agent on 10/18/26.
+#  Copyright (c) 2026 agent
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#  ================================================================
+# stdlib
+from unittest import TestCase
+import threading
+# libraries
+import numpy as np
+import matplotlib.pyplot as plt
+
+# test targets
+from utils.visualization import VectorFieldRasterizer, make_3d_plots
+
+
+class VisualizationTest(TestCase):
+    def test_vector_field_rasterizer01(self):
+        rasterizer = VectorFieldRasterizer(image_size=(320, 240))
+        vector_field = np.zeros((8, 8, 2), dtype=np.float32)
+        empty_plot = rasterizer.render(vector_field, vectors_name="")
+        self.assertEqual(empty_plot.shape, (240, 320, 3))
+        self.assertEqual(empty_plot.dtype, np.uint8)
+        # only the axes & labels are drawn, in black
+        self.assertTrue(np.all(empty_plot.max(axis=2) == empty_plot.min(axis=2)))
+
+        # a single vector pointing right from the center of cell (4, 4), drawn in color
+        vector_field[4, 4] = (2.0, 0.0)
+        plot = rasterizer.render(vector_field, vectors_name="")
+        changed_rows, changed_columns = np.nonzero(np.any(plot != empty_plot, axis=2))
+        self.assertGreater(len(changed_rows), 0)
+        self.assertTrue(np.any(plot.max(axis=2) != plot.min(axis=2)))
+        self.assertLessEqual(changed_rows.max() - changed_rows.min(), 10)
+        # 2 cells long, each cell is (240 - 110) / 8 pixels wide
+        self.assertTrue(30 <= changed_columns.max() - changed_columns.min() <= 34)
+
+    def test_make_3d_plots01(self):
+        # plots are rendered from visualization worker threads, hence must not go through pyplot
+        canonical_field = np.linspace(-1.0, 1.0, 128 * 128, dtype=np.float32).reshape(128, 128)
+        live_field = canonical_field.T.copy()
+        figure_count = len(plt.get_fignums())
+        plots = []
+        worker = threading.Thread(target=lambda: plots.append(make_3d_plots(canonical_field, live_field)))
+        worker.start()
+        worker.join()
+        self.assertEqual(len(plots), 1)
+        self.assertEqual(plots[0].shape, (720, 1230, 3))
+        self.assertEqual(plots[0].dtype, np.uint8)
+        self.assertGreater(plots[0].std(), 0.0)
+        self.assertEqual(len(plt.get_fignums()), figure_count)
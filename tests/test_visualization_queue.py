@@ -0,0 +1,112 @@
+#  ================================================================
+#  Created by agent on 10/18/26.
+#  Copyright (c) 2026 agent
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#  ================================================================
+# stdlib
+from unittest import TestCase
+import threading
+# libraries
+import numpy as np
+
+# test targets
+from utils.visualization_queue import VisualizationQueue, FullQueuePolicy, VisualizationSchedule, \
+    VisualizationScheduleMode, write_frame
+
+
+class FrameRecorder:
+    def __init__(self):
+        self.frames = []
+
+    def write(self, frame):
+        self.frames.append(frame)
+
+
+class VisualizationQueueTest(TestCase):
+    def test_visualization_queue01(self):
+        # tasks are executed in order, on snapshots of the submitted arrays
+        recorder = FrameRecorder()
+        visualization_queue = VisualizationQueue(maximum_size=2)
+        field = np.zeros((4, 4), dtype=np.float32)
+        for iteration_number in range(5):
+            field += 1.0
+            visualization_queue.submit(write_frame, recorder, np.sum, field)
+        visualization_queue.close()
+        self.assertFalse(visualization_queue.asynchronous)
+        self.assertEqual(recorder.frames, [16.0, 32.0, 48.0, 64.0, 80.0])
+
+        # synchronous operation
+        visualization_queue = VisualizationQueue(maximum_size=0)
+        visualization_queue.submit(write_frame, recorder, np.sum, field)
+        self.assertEqual(recorder.frames[-1], 80.0)
+
+    def test_visualization_queue02(self):
+        for policy, expected_frames in ((FullQueuePolicy.DROP_NEWEST, [0, 1, 2]),
+                                        (FullQueuePolicy.DROP_OLDEST, [0, 3, 4])):
+            recorder = FrameRecorder()
+            worker_released = threading.Event()
+            visualization_queue = VisualizationQueue(maximum_size=2, full_queue_policy=policy)
+            worker_started = threading.Event()
+
+            def render_first_frame():
+                worker_started.set()
+                worker_released.wait()
+                return 0
+
+            # keep the worker busy with the first frame while the rest are submitted
+            visualization_queue.submit(write_frame, recorder, render_first_frame)
+            worker_started.wait()
+            accepted = [visualization_queue.submit(write_frame, recorder, int, frame) for frame in range(1, 5)]
+            worker_released.set()
+            visualization_queue.close()
+            self.assertEqual(recorder.frames, expected_frames)
+            self.assertEqual(visualization_queue.dropped_task_count, 2)
+            if policy == FullQueuePolicy.DROP_NEWEST:
+                self.assertEqual(accepted, [True, True, False, False])
+
+    def test_visualization_queue03(self):
+        # errors raised by tasks are reported upon flush
+        visualization_queue = VisualizationQueue(maximum_size=2)
+        visualization_queue.submit(write_frame, FrameRecorder(), np.reshape, np.zeros(4), (3, 3))
+        with self.assertRaises(ValueError):
+            visualization_queue.flush()
+        visualization_queue.close()
+
+    def test_visualization_schedule01(self):
+        def visualize_runs(schedule, energies_by_run):
+            recorder = FrameRecorder()
+            visualization_queue = VisualizationQueue(maximum_size=2, schedule=schedule)
+            field = np.zeros(1)
+
+            def render(index, iteration_field):
+                return index, int(iteration_field[0])
+
+            for run_index, energies in enumerate(energies_by_run):
+                for iteration_number, energy in enumerate(energies):
+                    field[0] = iteration_number
+                    visualization_queue.submit_iteration(run_index, iteration_number, energy, write_frame, recorder,
+                                                         render, run_index, field)
+            visualization_queue.close()
+            return recorder.frames
+
+        frames = visualize_runs(VisualizationSchedule(VisualizationScheduleMode.EVERY_NTH_ITERATION, period=3),
+                                [[None] * 10])
+        self.assertEqual(frames, [(0, 0), (0, 3), (0, 6), (0, 9)])
+        # the last iterations of each run are only known once the run ends
+        frames = visualize_runs(VisualizationSchedule(VisualizationScheduleMode.FIRST_AND_LAST_ITERATIONS,
+                                                      frame_count=2), [[None] * 6, [None] * 3])
+        self.assertEqual(frames, [(0, 0), (0, 1), (0, 4), (0, 5), (1, 0), (1, 1), (1, 2)])
+        frames = visualize_runs(VisualizationSchedule(VisualizationScheduleMode.ON_ENERGY_CHANGE,
+                                                      minimum_relative_energy_change=0.1),
+                                [[10.0, 9.5, 8.9, 8.8, 5.0]])
+        self.assertEqual(frames, [(0, 0), (0, 2), (0, 4)])
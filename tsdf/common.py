@@ -14,6 +14,9 @@
 #  limitations under the License.
 #  ================================================================
 
+import numpy as np
+
+
 class GenerationMethod:
     NONE = 0
     BILINEAR_IMAGE = 1
@@ -40,3 +43,58 @@ def compute_tsdf_value(signed_distance, narrow_band_half_width):
     else:
         tsdf_value = signed_distance / narrow_band_half_width
     return tsdf_value
+
+
+def compute_tsdf_values(signed_distances, narrow_band_half_width):
+    """
+    Vectorized version of compute_tsdf_value: compute TSDF values as narrow band width fractions based on provided
+    SDF array and narrow band half-width
+    :param signed_distances: array of signed distances in metric units
+    :param narrow_band_half_width: half-width of the narrow band in metric units
+    :return: array of resulting TSDF values
+    """
+    return np.where(signed_distances < -narrow_band_half_width, -1.0,
+                    np.where(signed_distances > narrow_band_half_width, 1.0,
+                             signed_distances / narrow_band_half_width))
+
+
+def get_scalar_arithmetic_dtype(dtype, operand):
+    """
+    Get the data type numpy uses for arithmetic between a scalar of the given data type and the operand. Vectorized
+    generators cast their arrays to this type to reproduce the precision of the per-voxel computations, since, unlike
+    scalars, arrays keep their lower precision when combined with python scalars.
+    :param dtype: data type of the scalar, e.g. of the projected voxel coordinates
+    :param operand: python or numpy scalar, e.g. the depth unit ratio
+    :return: data type of the result
+    """
+    return (np.dtype(dtype).type(0) * operand).dtype
+
+
+def transform_voxels_to_camera_space(x_voxels, y_voxels, z_voxels, camera_extrinsic_matrix):
+    """
+    Transform a batch of voxel centers, given in metric world coordinates, to camera space with one matrix product
+    :param x_voxels: array of voxel x coordinates
+    :param y_voxels: array of voxel y coordinates (or a scalar)
+    :param z_voxels: array of voxel z coordinates
+    :param camera_extrinsic_matrix: matrix representing transformation of the camera (incl. rotation and translation)
+    :return: 4 x N array of homogeneous camera-space coordinates, where N is the number of voxels
+    """
+    x_voxels, y_voxels, z_voxels = np.broadcast_arrays(x_voxels, y_voxels, z_voxels)
+    points = np.empty((4, x_voxels.size), dtype=np.float32)
+    points[0] = x_voxels.ravel()
+    points[1] = y_voxels.ravel()
+    points[2] = z_voxels.ravel()
+    points[3] = 1.0
+    return camera_extrinsic_matrix.dot(points)
+
+
+def compute_2d_voxel_camera_space_points(camera_extrinsic_matrix, field_size, voxel_size, array_offset):
+    """
+    Compute camera-space coordinates of all voxels in the 2D field (the field's x axis corresponds to world x, its y
+    axis to world z, and the field lies in the world y=0 plane)
+    :return: 4 x (field_size * field_size) array of homogeneous camera-space coordinates, voxels in row-major order
+    """
+    y_field, x_field = np.indices((field_size, field_size))
+    x_voxels = (x_field + array_offset[0]) * voxel_size
+    z_voxels = (y_field + array_offset[2]) * voxel_size  # acts as "Z" coordinate
+    return transform_voxels_to_camera_space(x_voxels, 0.0, z_voxels, camera_extrinsic_matrix)
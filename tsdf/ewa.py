@@ -19,12 +19,14 @@
 
 import numpy as np
 import math
-import math_utils.elliptical_gaussians as eg
 import tsdf.common as common
 from tsdf.common import GenerationMethod
 
-# C++ extension
-import level_set_fusion_optimization as cpp_extension
+# C++ extension (optional: the pure-Python generators below do not need it)
+try:
+    import level_set_fusion_optimization as cpp_extension
+except ImportError:
+    cpp_extension = None
 
 
 def find_sampling_bounds_helper(bounds_max, depth_image, voxel_image):
@@ -54,13 +56,222 @@ def find_sampling_bounds_helper2(bounds_max, depth_image, voxel_image):
     return start_x, end_x, start_y, end_y
 
 
+class EwaAveragingMode:
+    DEPTH = 0  # average depth values, then compute TSDF from the average
+    TSDF = 1  # average TSDF values computed from each depth sample
+    TSDF_INCLUSIVE = 2  # same as TSDF, but samples outside of the image count as TSDF value 1.0
+
+
+def compute_voxel_sampling_ellipses(voxels_camera, covariance_camera_space, camera_intrinsic_matrix,
+                                    squared_radius_threshold):
+    """
+    For a batch of voxels, project the (spherical) voxel gaussians onto the image plane and convolve them with a
+    circular unit-variance 2D gaussian. Vectorized counterpart of the per-voxel projection Jacobian,
+    covariance remapping, inversion, and ImplicitEllipse.get_bounds steps.
+    :param voxels_camera: 3 x N array with camera-space voxel coordinates (all voxels should be in front of the camera)
+    :param covariance_camera_space: 3x3 covariance of voxel gaussians in camera space
+    :param camera_intrinsic_matrix: 3x3 camera intrinsic matrix
+    :param squared_radius_threshold: squared (Mahalanobis) radius of the sampling ellipse
+    :return: conic (inverse covariance) matrices, N x 2 x 2; voxel image coordinates, 2 x N;
+    sampling ellipse bounds (half-extents along x and y), 2 x N
+    """
+    # the per-voxel Jacobian entries were computed from scalar voxel coordinates (in higher precision than the voxel
+    # coordinate arrays), while the image-space projection was computed in the precision of the arrays
+    x_camera, y_camera, z_camera = \
+        voxels_camera.astype(common.get_scalar_arithmetic_dtype(voxels_camera.dtype, 1))
+    # squared distance along optical axis from camera to voxel
+    z_cam_squared = z_camera ** 2
+
+    # only the first two rows of the projection Jacobian contribute to the 2x2 image-space covariance
+    voxel_count = voxels_camera.shape[1]
+    projection_jacobians = np.zeros((voxel_count, 2, 3))
+    projection_jacobians[:, 0, 0] = 1 / z_camera
+    projection_jacobians[:, 0, 2] = -x_camera / z_cam_squared
+    projection_jacobians[:, 1, 1] = 1 / z_camera
+    projection_jacobians[:, 1, 2] = -y_camera / z_cam_squared
+
+    remapped_covariances = projection_jacobians @ covariance_camera_space @ projection_jacobians.transpose(0, 2, 1)
+    image_space_scaling_matrix = camera_intrinsic_matrix[0:2, 0:2]
+    final_covariances = image_space_scaling_matrix @ remapped_covariances @ image_space_scaling_matrix.T + np.eye(2)
+    conic_matrices = np.linalg.inv(final_covariances)
+
+    voxels_image = (camera_intrinsic_matrix.dot(voxels_camera) / voxels_camera[2])[:2]
+
+    # see ImplicitEllipse.get_bounds
+    a = conic_matrices[:, 0, 0]
+    b = conic_matrices[:, 0, 1] * 2
+    c = conic_matrices[:, 1, 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        b_squared = b ** 2
+        axis_aligned = np.abs(b) < 10e-6
+        max_x = np.sqrt(squared_radius_threshold / np.where(axis_aligned, a, c - b_squared / (4 * a)))
+        max_y = np.sqrt(squared_radius_threshold / np.where(axis_aligned, c, a - b_squared / (4 * c)))
+    return conic_matrices, voxels_image, np.stack((max_x, max_y))
+
+
+def compute_ewa_sampling_windows(bounds_max, depth_image, voxels_image, clip_to_image=True):
+    """
+    Vectorized version of find_sampling_bounds_helper (clip_to_image=True) and find_sampling_bounds_helper2
+    (clip_to_image=False).
+    :return: start_x, end_x, start_y, end_y arrays of sampling window bounds and a mask of voxels whose sampling window
+    overlaps the image
+    """
+    with np.errstate(invalid='ignore'):
+        has_window = np.all(np.isfinite(bounds_max), axis=0)
+        bounds_max = np.where(has_window, bounds_max, 0.0)
+    # conversion to integer truncates toward zero, same as int()
+    start_x = (voxels_image[0] - bounds_max[0]).astype(np.int64)
+    end_x = np.ceil(voxels_image[0] + bounds_max[0] + 1).astype(np.int64)
+    start_y = (voxels_image[1] - bounds_max[1]).astype(np.int64)
+    end_y = np.ceil(voxels_image[1] + bounds_max[1] + 1).astype(np.int64)
+
+    has_window &= np.logical_not((end_y <= 0) | (start_y > depth_image.shape[0]) |
+                                 (end_x <= 0) | (start_x > depth_image.shape[1]))
+    if clip_to_image:
+        start_y = np.maximum(0, start_y)
+        end_y = np.minimum(depth_image.shape[0], end_y)
+        start_x = np.maximum(0, start_x)
+        end_x = np.minimum(depth_image.shape[1], end_x)
+    return start_x, end_x, start_y, end_y, has_window
+
+
+def accumulate_ewa_samples(depth_image, depth_ratio, voxels_image, z_camera, conic_matrices,
+                           start_x, end_x, start_y, end_y, squared_radius_threshold, narrow_band_half_width,
+                           averaging_mode):
+    """
+    Compute Gaussian-weighted averages over the sampling windows of a batch of voxels. Windows are padded to the largest
+    window in the batch and all samples are processed at once.
+    :return: array of resulting TSDF values and mask of voxels that received a value
+    """
+    window_widths = np.maximum(end_x - start_x, 0)
+    window_heights = np.maximum(end_y - start_y, 0)
+    voxel_count = len(z_camera)
+    padded_width = int(window_widths.max()) if voxel_count > 0 else 0
+    padded_height = int(window_heights.max()) if voxel_count > 0 else 0
+    if padded_width == 0 or padded_height == 0:
+        return np.zeros(voxel_count), np.zeros(voxel_count, dtype=bool)
+
+    x_offsets = np.arange(padded_width).reshape(1, 1, -1)
+    y_offsets = np.arange(padded_height).reshape(1, -1, 1)
+    x_samples = start_x.reshape(-1, 1, 1) + x_offsets
+    y_samples = start_y.reshape(-1, 1, 1) + y_offsets
+    in_window = (x_offsets < window_widths.reshape(-1, 1, 1)) & (y_offsets < window_heights.reshape(-1, 1, 1))
+
+    x_centered = x_samples - voxels_image[0].reshape(-1, 1, 1)
+    y_centered = y_samples - voxels_image[1].reshape(-1, 1, 1)
+    q00, q01, q10, q11 = (conic_matrices[:, i_row, i_column].reshape(-1, 1, 1)
+                          for i_row, i_column in ((0, 0), (0, 1), (1, 0), (1, 1)))
+    distances_squared = x_centered * (q00 * x_centered + q01 * y_centered) + \
+                        y_centered * (q10 * x_centered + q11 * y_centered)
+    in_window &= np.logical_not(distances_squared > squared_radius_threshold)
+    weights = np.exp((-1 / 2) * distances_squared)
+
+    in_image = (x_samples >= 0) & (x_samples < depth_image.shape[1]) & \
+               (y_samples >= 0) & (y_samples < depth_image.shape[0])
+    surface_depths = depth_image[np.clip(y_samples, 0, depth_image.shape[0] - 1),
+                                 np.clip(x_samples, 0, depth_image.shape[1] - 1)]
+    surface_depths = surface_depths.astype(common.get_scalar_arithmetic_dtype(depth_image.dtype, depth_ratio)) * \
+                     depth_ratio
+    used = in_window & in_image & np.logical_not(surface_depths <= 0.0)
+
+    if averaging_mode == EwaAveragingMode.DEPTH:
+        depth_sums = np.sum(np.where(used, weights * surface_depths, 0.0), axis=(1, 2))
+        weight_sums = np.sum(np.where(used, weights, 0.0), axis=(1, 2))
+        has_value = np.logical_not(depth_sums <= 0.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            final_depths = depth_sums / weight_sums
+        # signed distance from surface to voxel along camera axis
+        return common.compute_tsdf_values(final_depths - z_camera, narrow_band_half_width), has_value
+    else:
+        # signed distance from surface to voxel along camera axis
+        tsdf_values = common.compute_tsdf_values(surface_depths - z_camera.reshape(-1, 1, 1), narrow_band_half_width)
+        if averaging_mode == EwaAveragingMode.TSDF_INCLUSIVE:
+            outside = in_window & np.logical_not(in_image)
+            tsdf_values = np.where(outside, 1.0, tsdf_values)
+            used |= outside
+        tsdf_sums = np.sum(np.where(used, weights * tsdf_values, 0.0), axis=(1, 2))
+        weight_sums = np.sum(np.where(used, weights, 0.0), axis=(1, 2))
+        has_value = weight_sums != 0.0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return tsdf_sums / weight_sums, has_value
+
+
+def compute_ewa_tsdf_values(depth_image, camera, voxels_camera, camera_extrinsic_matrix, voxel_size,
+                            narrow_band_width_voxels, gaussian_covariance_scale, averaging_mode,
+                            image_y_coordinate=None, maximum_chunk_sample_count=2 ** 22):
+    """
+    Array-batched EWA sampling for a set of voxels
+    :param voxels_camera: 3 x N array with camera-space voxel coordinates
+    :param image_y_coordinate: if not None, image y coordinate of every voxel is fixed to this value (as for 2D TSDFs
+    generated from a single image row)
+    :param maximum_chunk_sample_count: upper bound on the number of (padded) image samples processed at once
+    :return: array of N TSDF values and mask of voxels that received a value
+    """
+    camera_intrinsic_matrix = camera.intrinsics.intrinsic_matrix
+    narrow_band_half_width = narrow_band_width_voxels / 2 * voxel_size  # in metric units
+
+    camera_rotation_matrix = camera_extrinsic_matrix[0:3, 0:3]
+    covariance_voxel_sphere_world_space = np.eye(3) * (gaussian_covariance_scale * voxel_size)
+    covariance_camera_space = camera_rotation_matrix.dot(covariance_voxel_sphere_world_space) \
+        .dot(camera_rotation_matrix.T)
+
+    squared_radius_threshold = 4.0 * gaussian_covariance_scale * voxel_size
+
+    voxel_count = voxels_camera.shape[1]
+    tsdf_values = np.zeros(voxel_count)
+    has_value = np.zeros(voxel_count, dtype=bool)
+
+    in_front = np.flatnonzero(voxels_camera[2] > 0)
+    if len(in_front) == 0:
+        return tsdf_values, has_value
+    z_camera = voxels_camera[2, in_front]
+    conic_matrices, voxels_image, bounds_max = \
+        compute_voxel_sampling_ellipses(voxels_camera[:, in_front], covariance_camera_space,
+                                        camera_intrinsic_matrix, squared_radius_threshold)
+    if image_y_coordinate is not None:
+        voxels_image[1] = image_y_coordinate
+
+    start_x, end_x, start_y, end_y, has_window = \
+        compute_ewa_sampling_windows(bounds_max, depth_image, voxels_image,
+                                     clip_to_image=averaging_mode != EwaAveragingMode.TSDF_INCLUSIVE)
+    sampled = np.flatnonzero(has_window)
+
+    # group voxels with similar window sizes into chunks to limit both the padding and the chunk memory footprint
+    window_widths = np.maximum(end_x[sampled] - start_x[sampled], 1)
+    window_heights = np.maximum(end_y[sampled] - start_y[sampled], 1)
+    order = np.argsort(window_widths * window_heights, kind='stable')
+    sampled = sampled[order]
+    window_widths = window_widths[order]
+    window_heights = window_heights[order]
+
+    chunk_start = 0
+    while chunk_start < len(sampled):
+        chunk_end = chunk_start + max(1, maximum_chunk_sample_count //
+                                      int(window_widths[chunk_start] * window_heights[chunk_start]))
+        padded_area = int(window_widths[chunk_start:chunk_end].max() * window_heights[chunk_start:chunk_end].max())
+        while (chunk_end - chunk_start) * padded_area > maximum_chunk_sample_count and chunk_end - chunk_start > 1:
+            chunk_end = chunk_start + max(1, maximum_chunk_sample_count // padded_area)
+            padded_area = int(window_widths[chunk_start:chunk_end].max() *
+                              window_heights[chunk_start:chunk_end].max())
+        chunk = sampled[chunk_start:chunk_end]
+        chunk_values, chunk_has_value = \
+            accumulate_ewa_samples(depth_image, camera.depth_unit_ratio, voxels_image[:, chunk], z_camera[chunk],
+                                   conic_matrices[chunk], start_x[chunk], end_x[chunk], start_y[chunk], end_y[chunk],
+                                   squared_radius_threshold, narrow_band_half_width, averaging_mode)
+        tsdf_values[in_front[chunk]] = chunk_values
+        has_value[in_front[chunk]] = chunk_has_value
+        chunk_start = chunk_end
+
+    return tsdf_values, has_value
+
+
 def generate_tsdf_3d_ewa_image(depth_image, camera,
                                camera_extrinsic_matrix=np.eye(4, dtype=np.float32),
                                field_shape=np.array([128, 128, 128]), default_value=1,
                                voxel_size=0.004,
                                array_offset=np.array([-64, -64, 64]),
                                narrow_band_width_voxels=20, back_cutoff_voxels=np.inf,
-                               gaussian_covariance_scale=1.0):
+                               gaussian_covariance_scale=1.0, maximum_chunk_voxel_count=2 ** 18):
     """
     Generate 3D TSDF field based on elliptical Gaussian averages (EWA) of depth values from the provided image.
     Elliptical Gaussian filters are projected from spherical 3D Gaussian functions onto the depth image and convolved
@@ -79,6 +290,7 @@ def generate_tsdf_3d_ewa_image(depth_image, camera,
     :param narrow_band_width_voxels: span (in voxels) where signed distance is between -1 and 1
     :param back_cutoff_voxels: where to truncate the negative voxel values (currently not supported!)
     :param gaussian_covariance_scale: scale of elliptical gaussians (relative to voxel size)
+    :param maximum_chunk_voxel_count: upper bound on the number of voxels processed in one batch
     :return: resulting 3D TSDF
     """
     # TODO: use back_cutoff_voxels for additional limit on
@@ -92,91 +304,20 @@ def generate_tsdf_3d_ewa_image(depth_image, camera,
         field = np.ndarray(field_shape, dtype=np.float32)
         field.fill(default_value)
 
-    camera_intrinsic_matrix = camera.intrinsics.intrinsic_matrix
-    depth_ratio = camera.depth_unit_ratio
-    narrow_band_half_width = narrow_band_width_voxels / 2 * voxel_size  # in metric units
-
-    w_voxel = 1.0
-
-    camera_rotation_matrix = camera_extrinsic_matrix[0:3, 0:3]
-    covariance_voxel_sphere_world_space = np.eye(3) * (gaussian_covariance_scale * voxel_size)
-    covariance_camera_space = camera_rotation_matrix.dot(covariance_voxel_sphere_world_space) \
-        .dot(camera_rotation_matrix.T)
-
-    image_space_scaling_matrix = camera.intrinsics.intrinsic_matrix[0:2, 0:2]
-
-    squared_radius_threshold = 4.0 * gaussian_covariance_scale * voxel_size
-
-    for x_field in range(field_shape[2]):
-        for y_field in range(field_shape[1]):
-            for z_field in range(field_shape[0]):
-
-                x_voxel = (x_field + array_offset[0]) * voxel_size
-                y_voxel = (y_field + array_offset[1]) * voxel_size
-                z_voxel = (z_field + array_offset[2]) * voxel_size
-
-                voxel_world = np.array([[x_voxel, y_voxel, z_voxel, w_voxel]], dtype=np.float32).T
-                voxel_camera = camera_extrinsic_matrix.dot(voxel_world).flatten()[:3]
-
-                if voxel_camera[2] <= 0:
-                    continue
-
-                # distance along ray from camera to voxel center
-                ray_distance = np.linalg.norm(voxel_camera)
-                # squared distance along optical axis from camera to voxel
-                z_cam_squared = voxel_camera[2] ** 2
-                inv_z_cam = 1 / voxel_camera[2]
-
-                projection_jacobian = \
-                    np.array([[inv_z_cam, 0, -voxel_camera[0] / z_cam_squared],
-                              [0, inv_z_cam, -voxel_camera[1] / z_cam_squared],
-                              [voxel_camera[0] / ray_distance, voxel_camera[1] / ray_distance,
-                               voxel_camera[2] / ray_distance]])
-
-                remapped_covariance = projection_jacobian.dot(covariance_camera_space) \
-                    .dot(projection_jacobian.T)
-
-                final_covariance = image_space_scaling_matrix.dot(remapped_covariance[0:2, 0:2]).dot(
-                    image_space_scaling_matrix.T) + np.eye(2)
-                Q = np.linalg.inv(final_covariance)
-                gaussian = eg.EllipticalGaussian(eg.ImplicitEllipse(Q=Q, F=squared_radius_threshold))
-
-                voxel_image = (camera_intrinsic_matrix.dot(voxel_camera) / voxel_camera[2])[:2]
-                voxel_image = voxel_image.reshape(-1, 1)
-
-                bounds_max = gaussian.ellipse.get_bounds()
-
-                result = find_sampling_bounds_helper(bounds_max, depth_image, voxel_image)
-                if result is None:
-                    continue
-                else:
-                    (start_x, end_x, start_y, end_y) = result
-
-                weights_sum = 0.0
-                depth_sum = 0
-
-                for y_sample in range(start_y, end_y):
-                    for x_sample in range(start_x, end_x):
-                        sample_centered = np.array([[x_sample],
-                                                    [y_sample]], dtype=np.float64) - voxel_image
-
-                        dist_sq = gaussian.get_distance_from_center_squared(sample_centered)
-                        if dist_sq > squared_radius_threshold:
-                            continue
-                        weight = gaussian.compute(dist_sq)
-
-                        surface_depth = depth_image[y_sample, x_sample] * depth_ratio
-                        if surface_depth <= 0.0:
-                            continue
-                        depth_sum += weight * surface_depth
-                        weights_sum += weight
-
-                if depth_sum <= 0.0:
-                    continue
-                final_depth = depth_sum / weights_sum
-
-                signed_distance = final_depth - voxel_camera[2]
-                field[x_field, y_field, z_field] = common.compute_tsdf_value(signed_distance, narrow_band_half_width)
+    # process the field in slabs along the x axis to keep the memory footprint of the batched computation bounded
+    slab_thickness = max(1, maximum_chunk_voxel_count // int(field_shape[1] * field_shape[2]))
+    y_field, z_field = np.indices((field_shape[1], field_shape[2]))
+    y_voxels = (y_field + array_offset[1]) * voxel_size
+    z_voxels = (z_field + array_offset[2]) * voxel_size
+    for x_slab_start in range(0, field_shape[0], slab_thickness):
+        x_slab_end = min(x_slab_start + slab_thickness, field_shape[0])
+        x_voxels = (np.arange(x_slab_start, x_slab_end).reshape(-1, 1, 1) + array_offset[0]) * voxel_size
+        voxels_camera = common.transform_voxels_to_camera_space(x_voxels, y_voxels, z_voxels,
+                                                                camera_extrinsic_matrix)[:3]
+        tsdf_values, has_value = \
+            compute_ewa_tsdf_values(depth_image, camera, voxels_camera, camera_extrinsic_matrix, voxel_size,
+                                    narrow_band_width_voxels, gaussian_covariance_scale, EwaAveragingMode.DEPTH)
+        field[x_slab_start:x_slab_end].reshape(-1)[has_value] = tsdf_values[has_value]
 
     return field
 
@@ -326,91 +467,13 @@ def generate_tsdf_2d_ewa_image(depth_image, camera, image_y_coordinate,
         field = np.ndarray((field_size, field_size), dtype=np.float32)
         field.fill(default_value)
 
-    camera_intrinsic_matrix = camera.intrinsics.intrinsic_matrix
-    depth_ratio = camera.depth_unit_ratio
-    narrow_band_half_width = narrow_band_width_voxels / 2 * voxel_size  # in metric units
-
-    w_voxel = 1.0
-    y_voxel = 0
-
-    camera_rotation_matrix = camera_extrinsic_matrix[0:3, 0:3]
-    covariance_voxel_sphere_world_space = np.eye(3) * (gaussian_covariance_scale * voxel_size)
-    covariance_camera_space = camera_rotation_matrix.dot(covariance_voxel_sphere_world_space) \
-        .dot(camera_rotation_matrix.T)
-    image_space_scaling_matrix = camera_intrinsic_matrix[0:2, 0:2].copy()
-
-    squared_radius_threshold = 4.0 * gaussian_covariance_scale * voxel_size
-
-    for y_field in range(field_size):
-        for x_field in range(field_size):
-
-            x_voxel = (x_field + array_offset[0]) * voxel_size
-            z_voxel = (y_field + array_offset[2]) * voxel_size
-            voxel_world = np.array([[x_voxel, y_voxel, z_voxel, w_voxel]], dtype=np.float32).T
-            voxel_camera = camera_extrinsic_matrix.dot(voxel_world).flatten()[:3]
-
-            if voxel_camera[2] <= 0:
-                continue
-
-            # distance along ray from camera to voxel
-            ray_distance = np.linalg.norm(voxel_camera)
-            # squared distance along optical axis from camera to voxel
-            z_cam_squared = voxel_camera[2] ** 2
-
-            projection_jacobian = \
-                np.array([[1 / voxel_camera[2], 0, -voxel_camera[0] / z_cam_squared],
-                          [0, 1 / voxel_camera[2], -voxel_camera[1] / z_cam_squared],
-                          [voxel_camera[0] / ray_distance, voxel_camera[1] / ray_distance,
-                           voxel_camera[2] / ray_distance]])
-
-            remapped_covariance = projection_jacobian.dot(covariance_camera_space) \
-                .dot(projection_jacobian.T)
-
-            final_covariance = image_space_scaling_matrix.dot(remapped_covariance[0:2, 0:2]).dot(
-                image_space_scaling_matrix.T) + np.eye(2)
-            Q = np.linalg.inv(final_covariance)
-            gaussian = eg.EllipticalGaussian(eg.ImplicitEllipse(Q=Q, F=squared_radius_threshold))
-
-            voxel_image = (camera_intrinsic_matrix.dot(voxel_camera) / voxel_camera[2])[:2]
-            voxel_image[1] = image_y_coordinate
-            voxel_image = voxel_image.reshape(-1, 1)
-
-            bounds_max = gaussian.ellipse.get_bounds()
-
-            result = find_sampling_bounds_helper(bounds_max, depth_image, voxel_image)
-            if result is None:
-                continue
-            else:
-                (start_x, end_x, start_y, end_y) = result
-
-            weights_sum = 0.0
-            depth_sum = 0.0
-
-            for y_sample in range(start_y, end_y):
-                for x_sample in range(start_x, end_x):
-                    sample_centered = np.array([[x_sample],
-                                                [y_sample]], dtype=np.float64) - voxel_image
-
-                    dist_sq = gaussian.get_distance_from_center_squared(sample_centered)
-                    if dist_sq > squared_radius_threshold:
-                        continue
-                    weight = gaussian.compute(dist_sq)
-
-                    surface_depth = depth_image[y_sample, x_sample] * depth_ratio
-                    if surface_depth <= 0.0:
-                        continue
-
-                    depth_sum += weight * surface_depth
-                    weights_sum += weight
-
-            if depth_sum <= 0.0:
-                continue
-            final_depth = depth_sum / weights_sum
-
-            # signed distance from surface to voxel along camera axis
-            signed_distance = final_depth - voxel_camera[2]
-
-            field[y_field, x_field] = common.compute_tsdf_value(signed_distance, narrow_band_half_width)
+    voxels_camera = common.compute_2d_voxel_camera_space_points(camera_extrinsic_matrix, field_size, voxel_size,
+                                                                array_offset)[:3]
+    tsdf_values, has_value = \
+        compute_ewa_tsdf_values(depth_image, camera, voxels_camera, camera_extrinsic_matrix, voxel_size,
+                                narrow_band_width_voxels, gaussian_covariance_scale, EwaAveragingMode.DEPTH,
+                                image_y_coordinate=image_y_coordinate)
+    field.reshape(-1)[has_value] = tsdf_values[has_value]
 
     return field
 
@@ -455,89 +518,13 @@ def generate_tsdf_2d_ewa_tsdf(depth_image, camera, image_y_coordinate,
         field = np.ndarray((field_size, field_size), dtype=np.float32)
         field.fill(default_value)
 
-    camera_intrinsic_matrix = camera.intrinsics.intrinsic_matrix
-    depth_ratio = camera.depth_unit_ratio
-    narrow_band_half_width = narrow_band_width_voxels / 2 * voxel_size  # in metric units
-
-    w_voxel = 1.0
-    y_voxel = 0
-
-    camera_rotation_matrix = camera_extrinsic_matrix[0:3, 0:3]
-    covariance_voxel_sphere_world_space = np.eye(3) * (gaussian_covariance_scale * voxel_size)
-    covariance_camera_space = camera_rotation_matrix.dot(covariance_voxel_sphere_world_space) \
-        .dot(camera_rotation_matrix.T)
-    image_space_scaling_matrix = camera_intrinsic_matrix[0:2, 0:2].copy()
-
-    squared_radius_threshold = 4.0 * gaussian_covariance_scale * voxel_size
-
-    for y_field in range(field_size):
-        for x_field in range(field_size):
-            x_voxel = (x_field + array_offset[0]) * voxel_size
-            z_voxel = (y_field + array_offset[2]) * voxel_size
-            voxel_world = np.array([[x_voxel, y_voxel, z_voxel, w_voxel]], dtype=np.float32).T
-            voxel_camera = camera_extrinsic_matrix.dot(voxel_world).flatten()[:3]
-
-            if voxel_camera[2] <= 0:
-                continue
-
-            # distance along ray from camera to voxel
-            ray_distance = np.linalg.norm(voxel_camera)
-            # squared distance along optical axis from camera to voxel
-            z_cam_squared = voxel_camera[2] ** 2
-
-            projection_jacobian = \
-                np.array([[1 / voxel_camera[2], 0, -voxel_camera[0] / z_cam_squared],
-                          [0, 1 / voxel_camera[2], -voxel_camera[1] / z_cam_squared],
-                          [voxel_camera[0] / ray_distance, voxel_camera[1] / ray_distance,
-                           voxel_camera[2] / ray_distance]])
-
-            remapped_covariance = projection_jacobian.dot(covariance_camera_space) \
-                .dot(projection_jacobian.T)
-
-            final_covariance = image_space_scaling_matrix.dot(remapped_covariance[0:2, 0:2]).dot(
-                image_space_scaling_matrix.T) + np.eye(2)
-            Q = np.linalg.inv(final_covariance)
-            gaussian = eg.EllipticalGaussian(eg.ImplicitEllipse(Q=Q, F=squared_radius_threshold))
-
-            voxel_image = (camera_intrinsic_matrix.dot(voxel_camera) / voxel_camera[2])[:2]
-            voxel_image[1] = image_y_coordinate
-            voxel_image = voxel_image.reshape(-1, 1)
-
-            bounds_max = gaussian.ellipse.get_bounds()
-
-            result = find_sampling_bounds_helper(bounds_max, depth_image, voxel_image)
-            if result is None:
-                continue
-            else:
-                (start_x, end_x, start_y, end_y) = result
-
-            weights_sum = 0.0
-            tsdf_sum = 0.0
-
-            for y_sample in range(start_y, end_y):
-                for x_sample in range(start_x, end_x):
-                    sample_centered = np.array([[x_sample],
-                                                [y_sample]], dtype=np.float64) - voxel_image
-
-                    dist_sq = gaussian.get_distance_from_center_squared(sample_centered)
-                    if dist_sq > squared_radius_threshold:
-                        continue
-                    weight = gaussian.compute(dist_sq)
-
-                    surface_depth = depth_image[y_sample, x_sample] * depth_ratio
-                    if surface_depth <= 0.0:
-                        continue
-                    # signed distance from surface to voxel along camera axis
-                    signed_distance = surface_depth - voxel_camera[2]
-                    tsdf_value = common.compute_tsdf_value(signed_distance, narrow_band_half_width)
-
-                    tsdf_sum += weight * tsdf_value
-                    weights_sum += weight
-
-            if weights_sum == 0.0:
-                continue
-
-            field[y_field, x_field] = tsdf_sum / weights_sum
+    voxels_camera = common.compute_2d_voxel_camera_space_points(camera_extrinsic_matrix, field_size, voxel_size,
+                                                                array_offset)[:3]
+    tsdf_values, has_value = \
+        compute_ewa_tsdf_values(depth_image, camera, voxels_camera, camera_extrinsic_matrix, voxel_size,
+                                narrow_band_width_voxels, gaussian_covariance_scale, EwaAveragingMode.TSDF,
+                                image_y_coordinate=image_y_coordinate)
+    field.reshape(-1)[has_value] = tsdf_values[has_value]
 
     return field
 
@@ -584,94 +571,13 @@ def generate_tsdf_2d_ewa_tsdf_inclusive(depth_image, camera, image_y_coordinate,
         field = np.ndarray((field_size, field_size), dtype=np.float32)
         field.fill(default_value)
 
-    camera_intrinsic_matrix = camera.intrinsics.intrinsic_matrix
-    depth_ratio = camera.depth_unit_ratio
-    narrow_band_half_width = narrow_band_width_voxels / 2 * voxel_size  # in metric units
-
-    w_voxel = 1.0
-    y_voxel = 0
-
-    camera_rotation_matrix = camera_extrinsic_matrix[0:3, 0:3]
-    covariance_voxel_sphere_world_space = np.eye(3) * (gaussian_covariance_scale * voxel_size)
-    covariance_camera_space = camera_rotation_matrix.dot(covariance_voxel_sphere_world_space) \
-        .dot(camera_rotation_matrix.T)
-    image_space_scaling_matrix = camera_intrinsic_matrix[0:2, 0:2].copy()
-
-    squared_radius_threshold = 4.0 * gaussian_covariance_scale * voxel_size
-
-    for y_field in range(field_size):
-        for x_field in range(field_size):
-            x_voxel = (x_field + array_offset[0]) * voxel_size
-            z_voxel = (y_field + array_offset[2]) * voxel_size
-            voxel_world = np.array([[x_voxel, y_voxel, z_voxel, w_voxel]], dtype=np.float32).T
-            voxel_camera = camera_extrinsic_matrix.dot(voxel_world).flatten()[:3]
-
-            if voxel_camera[2] <= 0:
-                continue
-
-            # distance along ray from camera to voxel
-            ray_distance = np.linalg.norm(voxel_camera)
-            # squared distance along optical axis from camera to voxel
-            z_cam_squared = voxel_camera[2] ** 2
-
-            projection_jacobian = \
-                np.array([[1 / voxel_camera[2], 0, -voxel_camera[0] / z_cam_squared],
-                          [0, 1 / voxel_camera[2], -voxel_camera[1] / z_cam_squared],
-                          [voxel_camera[0] / ray_distance, voxel_camera[1] / ray_distance,
-                           voxel_camera[2] / ray_distance]])
-
-            remapped_covariance = projection_jacobian.dot(covariance_camera_space) \
-                .dot(projection_jacobian.T)
-
-            final_covariance = image_space_scaling_matrix.dot(remapped_covariance[0:2, 0:2]).dot(
-                image_space_scaling_matrix.T) + np.eye(2)
-            Q = np.linalg.inv(final_covariance)
-            gaussian = eg.EllipticalGaussian(eg.ImplicitEllipse(Q=Q, F=squared_radius_threshold))
-
-            voxel_image = (camera_intrinsic_matrix.dot(voxel_camera) / voxel_camera[2])[:2]
-            voxel_image[1] = image_y_coordinate
-            voxel_image = voxel_image.reshape(-1, 1)
-
-            bounds_max = gaussian.ellipse.get_bounds()
-
-            result = find_sampling_bounds_helper2(bounds_max, depth_image, voxel_image)
-            if result is None:
-                continue
-            else:
-                (start_x, end_x, start_y, end_y) = result
-
-            weights_sum = 0.0
-            tsdf_sum = 0.0
-
-            for y_sample in range(start_y, end_y):
-                for x_sample in range(start_x, end_x):
-                    sample_centered = np.array([[x_sample],
-                                                [y_sample]], dtype=np.float64) - voxel_image
-
-                    dist_sq = gaussian.get_distance_from_center_squared(sample_centered)
-                    if dist_sq > squared_radius_threshold:
-                        continue
-
-                    weight = gaussian.compute(dist_sq)
-
-                    if y_sample < 0 or y_sample >= depth_image.shape[0] \
-                            or x_sample < 0 or x_sample >= depth_image.shape[1]:
-                        tsdf_sum += weight * 1.0
-                    else:
-                        surface_depth = depth_image[y_sample, x_sample] * depth_ratio
-                        if surface_depth <= 0.0:
-                            continue
-                        # signed distance from surface to voxel along camera axis
-                        signed_distance = surface_depth - voxel_camera[2]
-                        tsdf_value = common.compute_tsdf_value(signed_distance, narrow_band_half_width)
-
-                        tsdf_sum += weight * tsdf_value
-                    weights_sum += weight
-
-            if weights_sum == 0.0:
-                continue
-
-            field[y_field, x_field] = tsdf_sum / weights_sum
+    voxels_camera = common.compute_2d_voxel_camera_space_points(camera_extrinsic_matrix, field_size, voxel_size,
+                                                                array_offset)[:3]
+    tsdf_values, has_value = \
+        compute_ewa_tsdf_values(depth_image, camera, voxels_camera, camera_extrinsic_matrix, voxel_size,
+                                narrow_band_width_voxels, gaussian_covariance_scale, EwaAveragingMode.TSDF_INCLUSIVE,
+                                image_y_coordinate=image_y_coordinate)
+    field.reshape(-1)[has_value] = tsdf_values[has_value]
 
     return field
 
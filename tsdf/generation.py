@@ -11,7 +11,7 @@ import numpy as np
 from utils.point2d import Point2d
 import utils.sampling as sampling
 import tsdf.ewa as ewa
-
+import tsdf.common as common
 from tsdf.common import GenerationMethod
 
 IGNORE_OPENCV = False
@@ -39,42 +39,34 @@ def generate_2d_tsdf_field_from_depth_image_bilinear_tsdf_space(depth_image, cam
     depth_ratio = camera.depth_unit_ratio
     narrow_band_half_width = narrow_band_width_voxels / 2 * voxel_size  # in metric units
 
-    y_voxel = 0.0
-    w_voxel = 1.0
-
-    for y_field in range(field_size):
-        for x_field in range(field_size):
-            x_voxel = (x_field + array_offset[0]) * voxel_size
-            z_voxel = (y_field + array_offset[2]) * voxel_size  # acts as "Z" coordinate
-
-            point = np.array([[x_voxel, y_voxel, z_voxel, w_voxel]], dtype=np.float32).T
-            point_in_camera_space = camera_extrinsic_matrix.dot(point).flatten()
-
-            if point_in_camera_space[2] <= 0:
-                continue
-
-            image_x_coordinate = projection_matrix[0, 0] * point_in_camera_space[0] / point_in_camera_space[2] + \
-                                 projection_matrix[0, 2]
-
-            ratios = sampling.get_bilinear_ratios(image_x_coordinate, image_y_coordinate)
-            base_x = math.floor(image_x_coordinate)
-            base_y = math.floor(image_y_coordinate)
-            points = [(base_x, base_y), (base_x, base_y + 1), (base_x + 1, base_y), (base_x + 1, base_y + 1)]
-            values = []
-            for x_image, y_image in points:
-                if x_image < 0 or x_image >= depth_image.shape[1]:
-                    values.append(1.0)
-                    continue
-                depth = depth_image[y_image, x_image] * depth_ratio
-
-                signed_distance_to_voxel_along_camera_ray = depth - point_in_camera_space[2]
-                if signed_distance_to_voxel_along_camera_ray < -narrow_band_half_width:
-                    values.append(-1.0)
-                elif signed_distance_to_voxel_along_camera_ray > narrow_band_half_width:
-                    values.append(1.0)
-                else:
-                    values.append(signed_distance_to_voxel_along_camera_ray / narrow_band_half_width)
-            field[y_field, x_field] = sampling.interpolate_bilinearly(values, ratios)
+    points_in_camera_space = common.compute_2d_voxel_camera_space_points(camera_extrinsic_matrix, field_size,
+                                                                         voxel_size, array_offset)
+    voxel_indices = np.flatnonzero(points_in_camera_space[2] > 0)
+    # projection is computed in the precision of the points & intrinsics, as in the per-voxel version
+    x_camera = points_in_camera_space[0, voxel_indices].astype(
+        common.get_scalar_arithmetic_dtype(points_in_camera_space.dtype, projection_matrix[0, 0]))
+    z_camera = points_in_camera_space[2, voxel_indices]
+
+    image_x_coordinates = projection_matrix[0, 0] * x_camera / z_camera + projection_matrix[0, 2]
+
+    base_x = np.floor(image_x_coordinates).astype(np.int64)
+    base_y = np.full_like(base_x, math.floor(image_y_coordinate))
+    ratios_x = image_x_coordinates - base_x
+    ratios_y = image_y_coordinate - math.floor(image_y_coordinate)
+
+    depth_dtype = common.get_scalar_arithmetic_dtype(depth_image.dtype, depth_ratio)
+    values = []
+    for x_image, y_image in ((base_x, base_y), (base_x, base_y + 1), (base_x + 1, base_y), (base_x + 1, base_y + 1)):
+        in_bounds = (x_image >= 0) & (x_image < depth_image.shape[1]) & \
+                    (y_image >= 0) & (y_image < depth_image.shape[0])
+        sample_values = np.ones(voxel_indices.shape, dtype=np.float64)
+        depth = depth_image[y_image[in_bounds], x_image[in_bounds]].astype(depth_dtype) * depth_ratio
+        signed_distance_to_voxel_along_camera_ray = depth - z_camera[in_bounds]
+        sample_values[in_bounds] = common.compute_tsdf_values(signed_distance_to_voxel_along_camera_ray,
+                                                              narrow_band_half_width)
+        values.append(sample_values)
+
+    field.reshape(-1)[voxel_indices] = sampling.interpolate_bilinearly_vectorized(values, ratios_x, ratios_y)
 
     return field
 
@@ -97,38 +89,36 @@ def generate_2d_tsdf_field_from_depth_image_bilinear_image_space(depth_image, ca
     depth_ratio = camera.depth_unit_ratio
     narrow_band_half_width = narrow_band_width_voxels / 2 * voxel_size  # in metric units
 
-    y_voxel = 0.0
-    w_voxel = 1.0
-
-    for y_field in range(field_size):
-        for x_field in range(field_size):
-            x_voxel = (x_field + array_offset[0]) * voxel_size
-            z_voxel = (y_field + array_offset[2]) * voxel_size  # acts as "Z" coordinate
-
-            point = np.array([[x_voxel, y_voxel, z_voxel, w_voxel]], dtype=np.float32).T
-            point_in_camera_space = camera_extrinsic_matrix.dot(point).flatten()
-
-            if point_in_camera_space[2] <= 0:
-                continue
-
-            image_x_coordinate = projection_matrix[0, 0] * point_in_camera_space[0] / point_in_camera_space[2] + \
-                                 projection_matrix[0, 2]
-
-            if image_x_coordinate < 0 or image_x_coordinate >= depth_image.shape[1]:
-                continue
-
-            depth = sampling.bilinear_sample_at(depth_image, image_x_coordinate, image_y_coordinate) * depth_ratio
-
-            if depth <= 0.0:
-                continue
-
-            signed_distance_to_voxel_along_camera_ray = depth - point_in_camera_space[2]
-            if signed_distance_to_voxel_along_camera_ray < -narrow_band_half_width:
-                field[y_field, x_field] = -1.0
-            elif signed_distance_to_voxel_along_camera_ray > narrow_band_half_width:
-                field[y_field, x_field] = 1.0
-            else:
-                field[y_field, x_field] = signed_distance_to_voxel_along_camera_ray / narrow_band_half_width
+    points_in_camera_space = common.compute_2d_voxel_camera_space_points(camera_extrinsic_matrix, field_size,
+                                                                         voxel_size, array_offset)
+    voxel_indices = np.flatnonzero(points_in_camera_space[2] > 0)
+    # projection is computed in the precision of the points & intrinsics, as in the per-voxel version
+    x_camera = points_in_camera_space[0, voxel_indices].astype(
+        common.get_scalar_arithmetic_dtype(points_in_camera_space.dtype, projection_matrix[0, 0]))
+    z_camera = points_in_camera_space[2, voxel_indices]
+
+    image_x_coordinates = projection_matrix[0, 0] * x_camera / z_camera + projection_matrix[0, 2]
+
+    in_image = (image_x_coordinates >= 0) & (image_x_coordinates < depth_image.shape[1])
+    voxel_indices = voxel_indices[in_image]
+    image_x_coordinates = image_x_coordinates[in_image]
+    z_camera = z_camera[in_image]
+
+    base_x = np.floor(image_x_coordinates).astype(np.int64)
+    base_y = np.full_like(base_x, math.floor(image_y_coordinate))
+    ratios_x = image_x_coordinates - base_x
+    ratios_y = image_y_coordinate - math.floor(image_y_coordinate)
+    values = [sampling.sample_at_coordinates(depth_image, base_x, base_y),
+              sampling.sample_at_coordinates(depth_image, base_x, base_y + 1),
+              sampling.sample_at_coordinates(depth_image, base_x + 1, base_y),
+              sampling.sample_at_coordinates(depth_image, base_x + 1, base_y + 1)]
+    depth = sampling.interpolate_bilinearly_vectorized(values, ratios_x, ratios_y) * depth_ratio
+
+    # NaN depth values are not skipped, same as in the per-voxel comparison "depth <= 0.0"
+    has_depth = np.logical_not(depth <= 0.0)
+    signed_distance_to_voxel_along_camera_ray = depth[has_depth] - z_camera[has_depth]
+    field.reshape(-1)[voxel_indices[has_depth]] = \
+        common.compute_tsdf_values(signed_distance_to_voxel_along_camera_ray, narrow_band_half_width)
 
     return field
 
@@ -171,48 +161,36 @@ def generate_2d_tsdf_field_from_depth_image_no_interpolation(depth_image, camera
     depth_ratio = camera.depth_unit_ratio
     narrow_band_half_width = narrow_band_width_voxels / 2 * voxel_size  # in metric units
 
-    y_voxel = 0.0
-    w_voxel = 1.0
-
-    for y_field in range(field_size):
-        for x_field in range(field_size):
-            x_voxel = (x_field + array_offset[0]) * voxel_size
-            z_voxel = (y_field + array_offset[2]) * voxel_size  # acts as "Z" coordinate
-
-            point = np.array([[x_voxel, y_voxel, z_voxel, w_voxel]], dtype=np.float32).T
-
-            point_in_camera_space = camera_extrinsic_matrix.dot(point).flatten()
-
-            if point_in_camera_space[2] <= 0:
-                continue
-
-            image_x_coordinate = int(
-                projection_matrix[0, 0] * point_in_camera_space[0] / point_in_camera_space[2]
-                + projection_matrix[0, 2] + 0.5)
-
-            if depth_image.ndim > 1:
-                if image_x_coordinate < 0 or image_x_coordinate >= depth_image.shape[1]:
-                    continue
-
-                depth = depth_image[image_y_coordinate, image_x_coordinate] * depth_ratio
-
-            else:
-                if image_x_coordinate < 0 or image_x_coordinate >= depth_image.shape[0]:
-                    continue
-
-                depth = depth_image[image_x_coordinate] * depth_ratio
-
-            if depth <= 0.0:
-                continue
+    points_in_camera_space = common.compute_2d_voxel_camera_space_points(camera_extrinsic_matrix, field_size,
+                                                                         voxel_size, array_offset)
+    voxel_indices = np.flatnonzero(points_in_camera_space[2] > 0)
+    # projection is computed in the precision of the points & intrinsics, as in the per-voxel version
+    x_camera = points_in_camera_space[0, voxel_indices].astype(
+        common.get_scalar_arithmetic_dtype(points_in_camera_space.dtype, projection_matrix[0, 0]))
+    z_camera = points_in_camera_space[2, voxel_indices]
+
+    image_x_coordinates = projection_matrix[0, 0] * x_camera / z_camera + projection_matrix[0, 2]
+    # rounding offset is added in the precision of python scalar arithmetic, conversion to integer truncates toward
+    # zero, same as int()
+    image_x_coordinates = (image_x_coordinates.astype(common.get_scalar_arithmetic_dtype(image_x_coordinates.dtype,
+                                                                                         0.5)) + 0.5).astype(np.int64)
+
+    if depth_image.ndim > 1:
+        depth_row = depth_image[image_y_coordinate]
+    else:
+        depth_row = depth_image
 
-            signed_distance_to_voxel_along_camera_ray = depth - point_in_camera_space[2]
+    in_image = (image_x_coordinates >= 0) & (image_x_coordinates < depth_row.shape[0])
+    voxel_indices = voxel_indices[in_image]
+    z_camera = z_camera[in_image]
+    depth = depth_row[image_x_coordinates[in_image]].astype(
+        common.get_scalar_arithmetic_dtype(depth_row.dtype, depth_ratio)) * depth_ratio
 
-            if signed_distance_to_voxel_along_camera_ray < -narrow_band_half_width:
-                field[y_field, x_field] = -1.0
-            elif signed_distance_to_voxel_along_camera_ray > narrow_band_half_width:
-                field[y_field, x_field] = 1.0
-            else:
-                field[y_field, x_field] = signed_distance_to_voxel_along_camera_ray / narrow_band_half_width
+    # NaN depth values are not skipped, same as in the per-voxel comparison "depth <= 0.0"
+    has_depth = np.logical_not(depth <= 0.0)
+    signed_distance_to_voxel_along_camera_ray = depth[has_depth] - z_camera[has_depth]
+    field.reshape(-1)[voxel_indices[has_depth]] = \
+        common.compute_tsdf_values(signed_distance_to_voxel_along_camera_ray, narrow_band_half_width)
 
     return field
 
@@ -365,9 +343,13 @@ def generate_3d_tsdf_field_from_depth_image(depth_image, camera,
                                             camera_extrinsic_matrix=np.eye(4, dtype=np.float32),
                                             field_size=128, default_value=1, voxel_size=0.004,
                                             array_offset=np.array([-64, -64, 64]),
-                                            narrow_band_width_voxels=20, back_cutoff_voxels=np.inf):
+                                            narrow_band_width_voxels=20, back_cutoff_voxels=np.inf,
+                                            maximum_chunk_voxel_count=2 ** 21):
     """
-    Assumes camera is at array_offset voxels relative to sdf grid
+    Assumes camera is at array_offset voxels relative to sdf grid. The field is processed in slabs of consecutive
+    x-coordinates, each holding at most maximum_chunk_voxel_count voxels (but at least one slab), which caps the memory
+    used by intermediate per-voxel arrays regardless of the field size.
+    The resulting field is indexed as field[x, y, z], same as in tsdf.ewa.generate_tsdf_3d_ewa_image.
     :param narrow_band_width_voxels:
     :param array_offset:
     :param camera_extrinsic_matrix: matrix representing transformation of the camera (incl. rotation and translation)
@@ -380,8 +362,7 @@ def generate_3d_tsdf_field_from_depth_image(depth_image, camera,
     :type depth_image: np.ndarray
     :param camera:
     :type camera: calib.camera.DepthCamera
-    :param image_y_coordinate:
-    :type image_y_coordinate: int
+    :param maximum_chunk_voxel_count: upper bound on the number of voxels processed at once
     :return:
     """
     # TODO: use back_cutoff_voxels for additional limit on
@@ -400,46 +381,46 @@ def generate_3d_tsdf_field_from_depth_image(depth_image, camera,
     depth_ratio = camera.depth_unit_ratio
     narrow_band_half_width = narrow_band_width_voxels / 2 * voxel_size  # in metric units
 
-    w_voxel = 1.0
-
-    for z_field in range(field_size):
-        for y_field in range(field_size):
-            for x_field in range(field_size):
-
-                x_voxel = (x_field + array_offset[0]) * voxel_size
-                y_voxel = (y_field + array_offset[1]) * voxel_size
-                z_voxel = (z_field + array_offset[2]) * voxel_size
-
-                point = np.array([[x_voxel, y_voxel, z_voxel, w_voxel]], dtype=np.float32).T
-                point_in_camera_space = camera_extrinsic_matrix.dot(point).flatten()
-
-                if point_in_camera_space[2] <= 0:
-                    continue
-
-                image_x_coordinate = int(
-                    projection_matrix[0, 0] * point_in_camera_space[0] / point_in_camera_space[2]
-                    + projection_matrix[0, 2] + 0.5)
-                image_y_coordinate = int(
-                    projection_matrix[1, 1] * point_in_camera_space[1] / point_in_camera_space[2]
-                    + projection_matrix[1, 2] + 0.5
-                )
-
-                if image_x_coordinate < 0 or image_x_coordinate >= depth_image.shape[1] \
-                        or image_y_coordinate < 0 or image_y_coordinate >= depth_image.shape[0]:
-                    continue
-
-                depth = depth_image[image_y_coordinate, image_x_coordinate] * depth_ratio
-
-                if depth <= 0.0:
-                    continue
-
-                signed_distance_to_voxel_along_camera_ray = depth - point_in_camera_space[2]
-
-                if signed_distance_to_voxel_along_camera_ray < -narrow_band_half_width:
-                    field[y_field, x_field] = -1.0
-                elif signed_distance_to_voxel_along_camera_ray > narrow_band_half_width:
-                    field[y_field, x_field] = 1.0
-                else:
-                    field[y_field, x_field] = signed_distance_to_voxel_along_camera_ray / narrow_band_half_width
+    slab_voxel_count = field_size * field_size
+    slabs_per_chunk = max(1, maximum_chunk_voxel_count // slab_voxel_count)
+
+    y_field, z_field = np.indices((field_size, field_size))
+    y_voxels = (y_field + array_offset[1]) * voxel_size
+    z_voxels = (z_field + array_offset[2]) * voxel_size
+
+    for chunk_start in range(0, field_size, slabs_per_chunk):
+        chunk_end = min(chunk_start + slabs_per_chunk, field_size)
+        x_voxels = ((np.arange(chunk_start, chunk_end) + array_offset[0]) * voxel_size).reshape(-1, 1, 1)
+
+        points_in_camera_space = common.transform_voxels_to_camera_space(x_voxels, y_voxels, z_voxels,
+                                                                         camera_extrinsic_matrix)
+        voxel_indices = np.flatnonzero(points_in_camera_space[2] > 0)
+        # projection is computed in the precision of the points & intrinsics, as in the per-voxel version
+        camera_dtype = common.get_scalar_arithmetic_dtype(points_in_camera_space.dtype, projection_matrix[0, 0])
+        x_camera = points_in_camera_space[0, voxel_indices].astype(camera_dtype)
+        y_camera = points_in_camera_space[1, voxel_indices].astype(camera_dtype)
+        z_camera = points_in_camera_space[2, voxel_indices]
+        del points_in_camera_space
+
+        image_x_coordinates = projection_matrix[0, 0] * x_camera / z_camera + projection_matrix[0, 2]
+        image_y_coordinates = projection_matrix[1, 1] * y_camera / z_camera + projection_matrix[1, 2]
+        # rounding offset is added in the precision of python scalar arithmetic, conversion to integer truncates
+        # toward zero, same as int()
+        rounding_dtype = common.get_scalar_arithmetic_dtype(image_x_coordinates.dtype, 0.5)
+        image_x_coordinates = (image_x_coordinates.astype(rounding_dtype) + 0.5).astype(np.int64)
+        image_y_coordinates = (image_y_coordinates.astype(rounding_dtype) + 0.5).astype(np.int64)
+
+        in_image = (image_x_coordinates >= 0) & (image_x_coordinates < depth_image.shape[1]) & \
+                   (image_y_coordinates >= 0) & (image_y_coordinates < depth_image.shape[0])
+        voxel_indices = voxel_indices[in_image]
+        z_camera = z_camera[in_image]
+        depth = depth_image[image_y_coordinates[in_image], image_x_coordinates[in_image]].astype(
+            common.get_scalar_arithmetic_dtype(depth_image.dtype, depth_ratio)) * depth_ratio
+
+        # NaN depth values are not skipped, same as in the per-voxel comparison "depth <= 0.0"
+        has_depth = np.logical_not(depth <= 0.0)
+        signed_distance_to_voxel_along_camera_ray = depth[has_depth] - z_camera[has_depth]
+        field[chunk_start:chunk_end].reshape(-1)[voxel_indices[has_depth]] = \
+            common.compute_tsdf_values(signed_distance_to_voxel_along_camera_ray, narrow_band_half_width)
 
     return field
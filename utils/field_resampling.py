@@ -22,23 +22,23 @@ from utils.tsdf_set_routines import value_outside_narrow_band
 from utils.printing import BOLD_YELLOW, BOLD_GREEN, RESET
 
 
-def print_interpolation_data(metainfo, original_live_sdf, new_value):
+def print_interpolation_data(metainfo, original_live_sdf, new_value, file=None):
     value00, value01, value10, value11, ratios, inverse_ratios = \
         metainfo.value00, metainfo.value01, metainfo.value10, metainfo.value11, metainfo.ratios, metainfo.inverse_ratios
     print("[Interpolation data] ", BOLD_YELLOW,
           "{:+03.3f}*{:03.3f}, {:+03.3f}*{:03.3f}".format(value00, inverse_ratios.y * inverse_ratios.x,
                                                           value10, inverse_ratios.y * ratios.x, ),
           RESET, " original value: ", BOLD_GREEN,
-          original_live_sdf, RESET, sep='')
+          original_live_sdf, RESET, sep='', file=file)
     print("                     ", BOLD_YELLOW,
           "{:+03.3f}*{:03.3f}, {:+03.3f}*{:03.3f}".format(value01, ratios.y * inverse_ratios.x,
                                                           value11, ratios.y * ratios.x),
           RESET, " final value: ", BOLD_GREEN,
-          new_value, RESET, sep='')
+          new_value, RESET, sep='', file=file)
 
 
 def get_and_print_interpolation_data(canonical_field, warped_live_field, warp_field, x, y, band_union_only=False,
-                                     known_values_only=False, substitute_original=False):
+                                     known_values_only=False, substitute_original=False, file=None):
     # TODO: use in interpolation function (don't forget the component fields and the updates) to avoid DRY violation
     original_live_sdf = warped_live_field[y, x]
     original_live_sdf = warped_live_field[y, x]
@@ -61,7 +61,7 @@ def get_and_print_interpolation_data(canonical_field, warped_live_field, warp_fi
     if 1.0 - abs(new_value) < 1e-6:
         new_value = np.sign(new_value)
 
-    print_interpolation_data(metainfo, original_live_sdf, new_value)
+    print_interpolation_data(metainfo, original_live_sdf, new_value, file=file)
 
 
 def resample_field(field, vector_field):
@@ -76,13 +76,8 @@ def resample_field(field, vector_field):
     :param vector_field: 2d vector field to use for bilinear lookups
     :return: the resulting scalar field
     """
-    resampled_field = np.ones_like(field)
-    for y in range(field.shape[0]):
-        for x in range(field.shape[1]):
-            warped_location = Point2d(x, y) + Point2d(coordinates=vector_field[y, x])
-            new_value = sampling.bilinear_sample_at(field, point=warped_location)
-            resampled_field[y, x] = new_value
-    return resampled_field
+    sampler = sampling.BilinearWarpSampler(vector_field)
+    return sampler.sample(field, replacement=1.0, out=np.empty_like(field))
 
 
 def resample_field_replacement(field, warp_field, replacement):
@@ -97,56 +92,67 @@ def resample_field_replacement(field, warp_field, replacement):
     :param vector_field: 2d vector field to use for bilinear lookups
     :return: the resulting scalar field
     """
-    resampled_field = np.ones_like(field)
-    for y in range(field.shape[0]):
-        for x in range(field.shape[1]):
-            warped_location = Point2d(x, y) + Point2d(coordinates=warp_field[y, x])
-            new_value = sampling.bilinear_sample_at_replacement(field,
-                                                                point=warped_location,
-                                                                replacement=replacement)
-            resampled_field[y, x] = new_value
-    return resampled_field
+    sampler = sampling.BilinearWarpSampler(warp_field)
+    return sampler.sample(field, replacement=replacement, out=np.empty_like(field))
+
+
+def resample_fields(fields, warp_field, replacements):
+    """
+    - Accepts a stack of scalar fields and a single vector field, all of the same dimensions & size.
+    - For each location of the vector field, performs a bilinear lookup in every one of the scalar fields. The
+    lookup locations and interpolation weights are computed only once and shared by all the fields.
+    - If a vector is pointing outside of the bounds of the input fields, uses the replacement value corresponding to
+    each field during the interpolation process for any "out-of-bounds" spots.
+    :param fields: array of shape (field_count, height, width) or a sequence of 2d scalar fields to resample
+    :param warp_field: 2d vector field to use for bilinear lookups
+    :param replacements: sequence of replacement values, one for each scalar field
+    :return: the resulting stack of scalar fields, of shape (field_count, height, width)
+    """
+    fields = np.asarray(fields)
+    sampler = sampling.BilinearWarpSampler(warp_field)
+    return sampler.sample_stack(fields, replacements, out=np.empty_like(fields))
 
 
 def resample_warped_live(canonical_field, warped_live_field, warp_field, gradient_field, band_union_only=False,
                          known_values_only=False, substitute_original=False,
-                         data_gradient_field=None, smoothing_gradient_field=None):
-    field_size = warp_field.shape[0]
-    new_warped_live_field = np.ones_like(warped_live_field)
-    for y in range(field_size):
-        for x in range(field_size):
-            original_live_sdf = warped_live_field[y, x]
-            if band_union_only:
-                canonical_sdf = canonical_field[y, x]
-                if value_outside_narrow_band(original_live_sdf) and value_outside_narrow_band(canonical_sdf):
-                    new_warped_live_field[y, x] = original_live_sdf
-                    continue
-            if known_values_only:
-                if original_live_sdf == 1.0:
-                    new_warped_live_field[y, x] = original_live_sdf
-                    continue
-
-            warped_location = Point2d(x, y) + Point2d(coordinates=warp_field[y, x])
+                         data_gradient_field=None, smoothing_gradient_field=None, print_focus_coord_info=False):
+    """
+    Resample the warped live field using the given warp field, for all voxels at once.
+    - Voxels excluded by the band_union_only (both live & canonical values are truncated) or known_values_only
+    (live value is 1.0) options retain their original live value.
+    - If substitute_original is set, the original live value at each voxel is used for any "out-of-bounds" spots during
+    its bilinear lookup, otherwise "1" is used.
+    - Where the interpolated value falls within 1e-6 of +/-1, it is snapped to +/-1 and the warp, gradient,
+    and (if provided) data & smoothing gradient vectors at that voxel are set to zero in-place.
+    - If print_focus_coord_info is set, the interpolation data at the focus voxel (see utils.sampling) is printed
+    (optimizers report it via FocusVoxelProbe instead).
+    :return: the new warped live field
+    """
+    if print_focus_coord_info:
+        focus_x, focus_y = sampling.get_focus_coordinates()
+        if 0 <= focus_x < warped_live_field.shape[1] and 0 <= focus_y < warped_live_field.shape[0]:
+            # print before warps get zeroed, so that the focus voxel output matches the per-voxel procedure
+            get_and_print_interpolation_data(canonical_field, warped_live_field, warp_field, focus_x, focus_y,
+                                             band_union_only, known_values_only, substitute_original)
+
+    resampled_mask = np.ones(warped_live_field.shape, dtype=bool)
+    if band_union_only:
+        resampled_mask &= np.logical_not(np.logical_and(np.abs(warped_live_field) == 1.0,
+                                                        np.abs(canonical_field) == 1.0))
+    if known_values_only:
+        resampled_mask &= warped_live_field != 1.0
 
-            if substitute_original:
-                new_value, metainfo = sampling.bilinear_sample_at_replacement_metainfo(warped_live_field,
-                                                                                       point=warped_location,
-                                                                                       replacement=original_live_sdf)
-            else:
-                new_value, metainfo = sampling.bilinear_sample_at_metainfo(warped_live_field, point=warped_location)
+    replacement = warped_live_field if substitute_original else 1.0
+    new_values = sampling.BilinearWarpSampler(warp_field).sample(warped_live_field, replacement=replacement)
 
-            if 1.0 - abs(new_value) < 1e-6:
-                new_value = np.sign(new_value)
-                warp_field[y, x] = 0.0
-                gradient_field[y, x] = 0.0
-                if data_gradient_field is not None:
-                    data_gradient_field[y, x] = 0.0
-                if smoothing_gradient_field is not None:
-                    smoothing_gradient_field[y, x] = 0.0
+    truncated_mask = np.logical_and(resampled_mask, 1.0 - np.abs(new_values) < 1e-6)
+    new_values[truncated_mask] = np.sign(new_values[truncated_mask])
+    for vector_field in (warp_field, gradient_field, data_gradient_field, smoothing_gradient_field):
+        if vector_field is not None:
+            vector_field[truncated_mask] = 0.0
 
-            if sampling.focus_coordinates_match(x, y):
-                print_interpolation_data(metainfo, original_live_sdf, new_value)
-            new_warped_live_field[y, x] = new_value
+    new_warped_live_field = warped_live_field.copy()
+    new_warped_live_field[resampled_mask] = new_values[resampled_mask]
     return new_warped_live_field
 
 
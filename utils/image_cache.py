@@ -0,0 +1,95 @@
+#  ================================================================
+#  Created by agent on 10/18/26.
+#  Copyright (c) 2026 agent
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#  ================================================================
+
+# LRU cache of decoded (depth & mask) images, shared by the experiment routines and datasets
+
+# stdlib
+import os
+from collections import OrderedDict
+# libraries
+import cv2
+
+DEFAULT_MEMORY_BUDGET = 512 * 1024 * 1024  # in bytes
+
+
+class ImageCache:
+    """
+    Least-recently-used cache of decoded images, keyed by path & decoding flags. Entries are invalidated whenever the
+    modification time of the file changes. Returned images are read-only: copy them before modifying.
+    """
+
+    def __init__(self, memory_budget=DEFAULT_MEMORY_BUDGET):
+        """
+        :param memory_budget: maximum total size, in bytes, of the cached images
+        """
+        self.memory_budget = memory_budget
+        self.memory_usage = 0
+        self.__entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __evict(self, key):
+        _, image = self.__entries.pop(key)
+        self.memory_usage -= image.nbytes
+
+    def load(self, path, flags=cv2.IMREAD_UNCHANGED):
+        """
+        Get the decoded image at the specified path, decoding it only if it is not already cached or if the file
+        has changed since it was cached.
+        :param path: path to the image file
+        :param flags: decoding flags for cv2.imread
+        :return: read-only image (or None if the image cannot be read)
+        """
+        try:
+            modification_time = os.stat(path).st_mtime_ns
+        except OSError:
+            return cv2.imread(path, flags)
+        key = (os.path.abspath(path), flags)
+        if key in self.__entries:
+            cached_modification_time, image = self.__entries[key]
+            if cached_modification_time == modification_time:
+                self.__entries.move_to_end(key)
+                return image
+            self.__evict(key)
+
+        image = cv2.imread(path, flags)
+        if image is None or image.nbytes > self.memory_budget:
+            return image
+        image.flags.writeable = False
+        self.__entries[key] = (modification_time, image)
+        self.memory_usage += image.nbytes
+        while self.memory_usage > self.memory_budget:
+            self.__evict(next(iter(self.__entries)))
+        return image
+
+    def clear(self):
+        self.__entries.clear()
+        self.memory_usage = 0
+
+
+# cache shared by everything within a single process
+shared_image_cache = ImageCache()
+
+
+def load_image(path, flags=cv2.IMREAD_UNCHANGED):
+    """
+    Load an image via the shared cache, see ImageCache.load
+    :param path: path to the image file
+    :param flags: decoding flags for cv2.imread
+    :return: read-only image (or None if the image cannot be read)
+    """
+    return shared_image_cache.load(path, flags)
@@ -0,0 +1,265 @@
+#  ================================================================
+#  Created by agent on 10/18/26.
+#  Copyright (c) 2026 agent
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#  ================================================================
+
+# Compact binary traces of the per-iteration state of optimizations, for analysis without re-running them
+
+# stdlib
+import os
+import re
+import shutil
+# libraries
+import numpy as np
+
+# A trace is a directory of chunks, each holding consecutive records (one per iteration) as a set of arrays with the
+# record count as the first dimension. Chunks are never modified once written, so a trace can be appended to by
+# further optimizations and read while it is being written. The chunk name encodes the range of records within it:
+# chunk_<index of the first record>_<record count>.npz for compressed chunks (numpy.savez_compressed), and a
+# directory of .npy files with the same name minus the extension for uncompressed (memory-mappable) chunks.
+_CHUNK_NAME_PATTERN = re.compile(r"^chunk_(\d{10})_(\d{6})(\.npz)?$")
+
+# per-record scalars, always present
+SCALAR_DTYPES = (
+    # index of the optimization run (e.g. hierarchy level) the iteration belongs to
+    ("run_index", np.int32),
+    ("iteration_number", np.int32),
+    # energies that aren't computed by the optimizer are NaN
+    ("data_energy", np.float64),
+    ("smoothing_energy", np.float64),
+    ("level_set_energy", np.float64),
+    ("max_warp", np.float64),
+    # location of the maximum warp, -1 if unknown
+    ("max_warp_x", np.int32),
+    ("max_warp_y", np.int32)
+)
+# optional per-record fields
+FIELD_NAMES = ("warp_field", "gradient_field")
+
+
+def _format_chunk_name(first_record_index, record_count):
+    return "chunk_{:010d}_{:06d}".format(first_record_index, record_count)
+
+
+def _find_chunks(path):
+    """
+    :return: list of (first record index, record count, chunk path) tuples of all chunks in the trace, in order
+    """
+    chunks = []
+    for name in os.listdir(path):
+        match = _CHUNK_NAME_PATTERN.match(name)
+        if match is not None:
+            chunks.append((int(match.group(1)), int(match.group(2)), os.path.join(path, name)))
+    chunks.sort()
+    return chunks
+
+
+class OptimizationTraceWriter:
+    """
+    Writes per-iteration records of optimizations (energies, maximum warp and its location, and, optionally, decimated
+    warp & gradient fields) to a trace (see OptimizationTraceReader) in chunks of a fixed number of records. Records
+    are buffered in memory until a chunk is full or the writer is flushed (optimizers flush their trace writer at the
+    end of each optimization). Writing to an existing trace appends to it.
+    """
+
+    def __init__(self, path, chunk_size=100, compressed=True, field_stride=None, field_dtype=None):
+        """
+        :param path: path to the trace directory, created if it doesn't exist
+        :param chunk_size: maximum number of records in each chunk
+        :param compressed: whether to compress the chunks, uncompressed chunks can be memory-mapped by the reader
+        :param field_stride: stride at which voxels of warp & gradient fields are recorded along each spatial
+        dimension, e.g. 1 to record the full fields or 4 to record every 4th voxel in each row & column. If None,
+        fields are not recorded.
+        :param field_dtype: data type to store the fields as (e.g. np.float16), if None, fields keep their data type
+        """
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be positive, got {:d}".format(chunk_size))
+        self.path = path
+        self.chunk_size = chunk_size
+        self.compressed = compressed
+        self.field_stride = field_stride
+        self.field_dtype = field_dtype
+        if not os.path.exists(path):
+            os.makedirs(path)
+        chunks = _find_chunks(path)
+        # total number of records in the trace, including the ones still buffered
+        self.record_count = chunks[-1][0] + chunks[-1][1] if len(chunks) > 0 else 0
+        self.__scalars = {name: [] for name, dtype in SCALAR_DTYPES}
+        self.__fields = {}
+        # shapes & data types of the buffered fields, chunks only hold fields of a single layout
+        self.__field_layout = None
+
+    @property
+    def buffered_record_count(self):
+        return len(self.__scalars["run_index"])
+
+    def record(self, run_index, iteration_number, max_warp, max_warp_location=None, data_energy=np.nan,
+               smoothing_energy=np.nan, level_set_energy=np.nan, warp_field=None, gradient_field=None):
+        """
+        Record a single iteration. Fields are copied (decimated), so they may be modified in-place afterward.
+        :param run_index: index of the optimization run (e.g. hierarchy level) within the trace
+        :param iteration_number: index of the iteration within the run
+        :param max_warp: maximum warp (or warp update) length
+        :param max_warp_location: location of the maximum warp (anything with x & y attributes), None if unknown
+        :param warp_field: warp field of shape (height, width, 2), ignored if fields aren't recorded
+        :param gradient_field: gradient field of shape (height, width, 2), ignored if fields aren't recorded
+        """
+        fields = {}
+        if self.field_stride is not None:
+            for name, field in zip(FIELD_NAMES, (warp_field, gradient_field)):
+                if field is not None:
+                    decimated = field[::self.field_stride, ::self.field_stride]
+                    fields[name] = decimated.astype(self.field_dtype if self.field_dtype is not None
+                                                    else decimated.dtype)
+        field_layout = {name: (field.shape, field.dtype) for name, field in fields.items()}
+        if self.buffered_record_count > 0 and field_layout != self.__field_layout:
+            self.flush()
+        self.__field_layout = field_layout
+
+        if max_warp_location is None:
+            max_warp_x, max_warp_y = -1, -1
+        else:
+            max_warp_x, max_warp_y = max_warp_location.x, max_warp_location.y
+        for (name, dtype), value in zip(SCALAR_DTYPES, (run_index, iteration_number, data_energy, smoothing_energy,
+                                                        level_set_energy, max_warp, max_warp_x, max_warp_y)):
+            self.__scalars[name].append(value)
+        for name, field in fields.items():
+            self.__fields.setdefault(name, []).append(field)
+        self.record_count += 1
+
+        if self.buffered_record_count >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write all buffered records out as a chunk
+        """
+        record_count = self.buffered_record_count
+        if record_count == 0:
+            return
+        arrays = {name: np.array(self.__scalars[name], dtype=dtype) for name, dtype in SCALAR_DTYPES}
+        for name, fields in self.__fields.items():
+            arrays[name] = np.stack(fields)
+        chunk_name = _format_chunk_name(self.record_count - record_count, record_count)
+        # write under a temporary name first, so that readers never see partially-written chunks
+        temporary_path = os.path.join(self.path, "." + chunk_name + ".tmp")
+        if self.compressed:
+            with open(temporary_path, "wb") as file:
+                np.savez_compressed(file, **arrays)
+            os.replace(temporary_path, os.path.join(self.path, chunk_name + ".npz"))
+        else:
+            if os.path.exists(temporary_path):
+                shutil.rmtree(temporary_path)
+            os.makedirs(temporary_path)
+            for name, array in arrays.items():
+                np.save(os.path.join(temporary_path, name + ".npy"), array)
+            os.replace(temporary_path, os.path.join(self.path, chunk_name))
+
+        self.__scalars = {name: [] for name, dtype in SCALAR_DTYPES}
+        self.__fields = {}
+
+    def close(self):
+        self.flush()
+
+
+class OptimizationTraceReader:
+    """
+    Reads traces written by OptimizationTraceWriter. Records are addressed by their index within the whole trace,
+    and only the chunks overlapping the requested range of records are loaded.
+    """
+
+    def __init__(self, path, memory_map=False):
+        """
+        :param path: path to the trace directory
+        :param memory_map: memory-map arrays of uncompressed chunks instead of loading them (compressed chunks are
+        always loaded)
+        """
+        if not os.path.isdir(path):
+            raise ValueError("Trace directory {:s} does not exist".format(path))
+        self.path = path
+        self.memory_map = memory_map
+        self.__chunks = []
+        self.refresh()
+
+    def refresh(self):
+        """
+        Pick up chunks written since the reader was created (or last refreshed)
+        """
+        self.__chunks = _find_chunks(self.path)
+
+    def __len__(self):
+        if len(self.__chunks) == 0:
+            return 0
+        first_record_index, record_count, chunk_path = self.__chunks[-1]
+        return first_record_index + record_count
+
+    def __load_array(self, chunk_path, name):
+        if chunk_path.endswith(".npz"):
+            with np.load(chunk_path) as chunk:
+                if name not in chunk.files:
+                    raise KeyError("'{:s}' was not recorded in chunk {:s}".format(name, chunk_path))
+                return chunk[name]
+        array_path = os.path.join(chunk_path, name + ".npy")
+        if not os.path.exists(array_path):
+            raise KeyError("'{:s}' was not recorded in chunk {:s}".format(name, chunk_path))
+        return np.load(array_path, mmap_mode="r" if self.memory_map else None)
+
+    def read(self, name, start=0, stop=None):
+        """
+        Read values of one of the recorded quantities (see SCALAR_DTYPES & FIELD_NAMES) over a range of records.
+        :param name: name of the quantity, e.g. "data_energy" or "warp_field"
+        :param start: index of the first record in the range
+        :param stop: index of the record past the last one in the range, if None, the range ends with the last record
+        :return: array with the record as the first dimension. A view of the memory-mapped chunk if the range is within
+        a single uncompressed chunk and the reader memory-maps chunks.
+        """
+        record_count = len(self)
+        stop = record_count if stop is None else min(stop, record_count)
+        if not 0 <= start <= stop:
+            raise IndexError("invalid record range [{:d}, {:d}) for a trace of {:d} records"
+                             .format(start, stop, record_count))
+        parts = []
+        for first_record_index, chunk_record_count, chunk_path in self.__chunks:
+            chunk_start = max(start, first_record_index)
+            chunk_stop = min(stop, first_record_index + chunk_record_count)
+            if chunk_start < chunk_stop:
+                array = self.__load_array(chunk_path, name)
+                parts.append(array[chunk_start - first_record_index:chunk_stop - first_record_index])
+        if len(parts) == 0:
+            dtype = dict(SCALAR_DTYPES).get(name, np.float32)
+            return np.empty((0,), dtype=dtype)
+        if len(parts) == 1:
+            return parts[0]
+        if any(part.shape[1:] != parts[0].shape[1:] for part in parts):
+            raise ValueError("'{:s}' has different shapes within records [{:d}, {:d}), e.g. at different hierarchy "
+                             "levels; read the range of each run separately (see find_run)".format(name, start, stop))
+        return np.concatenate(parts)
+
+    def find_run(self, run_index):
+        """
+        :param run_index: index of the run, as recorded
+        :return: range (start, stop) of the records of the last run with the given index, (0, 0) if there is none
+        """
+        run_indices = self.read("run_index")
+        run_records = np.flatnonzero(run_indices == run_index)
+        if len(run_records) == 0:
+            return 0, 0
+        stop = run_records[-1] + 1
+        other_runs = np.flatnonzero(run_indices[:stop] != run_index)
+        start = other_runs[-1] + 1 if len(other_runs) > 0 else 0
+        # consecutive optimizations may record runs with the same index, the last one starts at its last iteration 0
+        run_starts = np.flatnonzero(self.read("iteration_number", start, stop) == 0)
+        if len(run_starts) > 0:
+            start += run_starts[-1]
+        return int(start), int(stop)
@@ -17,6 +17,7 @@
 # Classes for multi-level hierarchical field representations (and routines constructing them)
 # system
 import math
+from enum import Enum
 # libraries
 import numpy as np
 
@@ -25,32 +26,168 @@ def is_power_of_two(number):
     return math.log2(number) % 1 == 0.0
 
 
-class ScalarFieldPyramid2d:
-    def __init__(self, field, maximum_chunk_size=8):
-        # check that we can break this field down into tiles
-        if not is_power_of_two(field.shape[0]) or not is_power_of_two(field.shape[1]):
-            raise ValueError("The argument 'field' must be a 2D numpy array where each dimension is a power of two.")
+class PyramidShapePolicy(Enum):
+    # spatial dimensions of the field have to be divisible by the maximum chunk size
+    STRICT = 0
+    # spatial dimensions are padded at the end (bottom, right, back) up to a multiple of the maximum chunk size
+    PAD = 1
+    # spatial dimensions are cropped at the end down to a multiple of the maximum chunk size
+    CROP = 2
+
+
+class PyramidLevels:
+    """
+    Sequence of the levels of a pyramid, coarsest first. Each level is only computed when first accessed (along with
+    all the finer levels it is computed from).
+    """
+
+    def __init__(self, pyramid):
+        self.__pyramid = pyramid
+
+    def __len__(self):
+        return self.__pyramid.level_count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("pyramid level index out of range")
+        return self.__pyramid.get_level(index)
+
+
+class FieldPyramid:
+    """
+    Multi-level hierarchical representation of a scalar or vector field (or of a batch of such fields) with any number
+    of spatial dimensions. Each level is downsampled by a factor of two along every spatial dimension from the next
+    finer level, by averaging over 2x2 (2x2x2 in 3D) blocks of voxels. Levels are ordered from coarsest to finest.
+    """
 
+    def __init__(self, field, maximum_chunk_size=8, spatial_dimension_count=2, channel_dimension_count=0,
+                 shape_policy=PyramidShapePolicy.STRICT, padding_mode="edge", share_finest_level=False):
+        """
+        :param field: field of shape batch_shape + spatial_shape + channel_shape, e.g. (height, width) for a single 2D
+        scalar field, (height, width, 2) for a single 2D vector field, or (count, depth, height, width) for a batch
+        of 3D scalar fields
+        :param maximum_chunk_size: lateral size, in voxels, of the chunk of the finest level represented by a single
+        voxel in the coarsest level
+        :param spatial_dimension_count: number of spatial dimensions of the field
+        :param channel_dimension_count: number of trailing (non-spatial) dimensions of each voxel, e.g. 1 for vectors
+        :param shape_policy: how to handle spatial dimensions that are not divisible by the maximum chunk size
+        :type shape_policy: PyramidShapePolicy
+        :param padding_mode: mode of numpy.pad to use for padding with PyramidShapePolicy.PAD
+        :param share_finest_level: if True, the finest level is a view of the field whenever possible (no padding
+        required), otherwise it is always a copy
+        """
         if not is_power_of_two(maximum_chunk_size):
             raise ValueError("The argument 'maximum_chunk_size' must be an integer power of 2, i.e. 4, 8, 16, etc.")
+        spatial_start = field.ndim - channel_dimension_count - spatial_dimension_count
+        if spatial_start < 0:
+            raise ValueError("The field of shape {:s} does not have {:d} spatial and {:d} channel dimensions."
+                             .format(str(field.shape), spatial_dimension_count, channel_dimension_count))
+        self.spatial_axes = tuple(range(spatial_start, spatial_start + spatial_dimension_count))
+        self.source_shape = field.shape
+        self.maximum_chunk_size = maximum_chunk_size
+        self.shape_policy = shape_policy
 
-        power_of_two_largest_chunk = int(math.log2(maximum_chunk_size))
+        source_spatial_shape = tuple(field.shape[axis] for axis in self.spatial_axes)
+        if shape_policy == PyramidShapePolicy.STRICT:
+            if any(size % maximum_chunk_size != 0 for size in source_spatial_shape):
+                raise ValueError("Spatial dimensions of the field {:s} must be divisible by the maximum chunk size {:d}"
+                                 .format(str(field.shape), maximum_chunk_size))
+            spatial_shape = source_spatial_shape
+        elif shape_policy == PyramidShapePolicy.PAD:
+            spatial_shape = tuple(-(-size // maximum_chunk_size) * maximum_chunk_size for size in source_spatial_shape)
+        elif shape_policy == PyramidShapePolicy.CROP:
+            spatial_shape = tuple(size // maximum_chunk_size * maximum_chunk_size for size in source_spatial_shape)
+        else:
+            raise ValueError("Unsupported shape policy: " + str(shape_policy))
 
         # check that we can get a level with the maximum chunk size
-        max_level_count = min(int(math.log2(field.shape[0])), int(math.log2(field.shape[1])))
-        if max_level_count <= power_of_two_largest_chunk:
+        if min(spatial_shape) < 2 * maximum_chunk_size:
             raise ValueError("maximum chunk size {:d} is too large for a field of size {:s}"
                              .format(maximum_chunk_size, str(field.shape)))
 
-        level_count = power_of_two_largest_chunk + 1
-        last_level = field.copy()
-        levels = [last_level]
-        for i_level in range(1, level_count):
-            reshaped1 = last_level.reshape(last_level.shape[0] // 2, 2, last_level.shape[1] // 2, 2)
-            axmoved = np.moveaxis(reshaped1, [0, 1, 2, 3], [0, 2, 1, 3])
-            reshaped2 = axmoved.reshape(last_level.shape[0] // 2, last_level.shape[1] // 2, 4)
-            current_level = reshaped2.mean(axis=2)
-            levels.append(current_level)
-            last_level = current_level
-        levels.reverse()
-        self.levels = levels
+        if spatial_shape != source_spatial_shape:
+            finest_level = self.__fit_to_shape(field, spatial_shape, padding_mode)
+            # cropping alone produces a view
+            if not share_finest_level and np.shares_memory(finest_level, field):
+                finest_level = finest_level.copy()
+        else:
+            finest_level = field if share_finest_level else field.copy()
+
+        self.level_count = int(math.log2(maximum_chunk_size)) + 1
+        self.__levels = [None] * (self.level_count - 1) + [finest_level]
+        self.levels = PyramidLevels(self)
+
+    def __fit_to_shape(self, field, spatial_shape, padding_mode):
+        slices = [slice(None)] * field.ndim
+        pad_widths = [(0, 0)] * field.ndim
+        for axis, size in zip(self.spatial_axes, spatial_shape):
+            if size < field.shape[axis]:
+                slices[axis] = slice(0, size)
+            else:
+                pad_widths[axis] = (0, size - field.shape[axis])
+        field = field[tuple(slices)]
+        if any(pad_width != (0, 0) for pad_width in pad_widths):
+            field = np.pad(field, pad_widths, mode=padding_mode)
+        return field
+
+    def get_level(self, index):
+        """
+        :param index: index of the level, 0 being the coarsest one
+        :return: the level (computed on first access)
+        """
+        if self.__levels[index] is None:
+            self.__levels[index] = self.__downsample(self.get_level(index + 1))
+        return self.__levels[index]
+
+    def __downsample(self, level):
+        # split each spatial dimension into (size // 2, 2) & average over the resulting blocks
+        split_shape = list(level.shape[:self.spatial_axes[0]])
+        block_axes = []
+        for axis in self.spatial_axes:
+            split_shape += [level.shape[axis] // 2, 2]
+            block_axes.append(len(split_shape) - 1)
+        split_shape += level.shape[self.spatial_axes[-1] + 1:]
+        split = level.reshape(split_shape)
+        blocks_last = np.moveaxis(split, block_axes, list(range(-len(block_axes), 0)))
+        return blocks_last.reshape(blocks_last.shape[:-len(block_axes)] + (-1,)).mean(axis=-1)
+
+    def restore_source_shape(self, field, fill_value=0):
+        """
+        Bring a field with the spatial shape of the finest level back to the spatial shape of the source field,
+        i.e. crop away the padding or pad the cropped-away region with the fill value.
+        :param field: field with the same spatial axes as the source field and the spatial shape of the finest level,
+        possibly with different trailing (channel) dimensions
+        :param fill_value: value for voxels that were cropped away from the source field
+        :return: field with the spatial shape of the source field (a view of the input field if no filling is needed)
+        """
+        finest_level = self.__levels[-1]
+        slices = [slice(None)] * field.ndim
+        pad_widths = [(0, 0)] * field.ndim
+        for axis in self.spatial_axes:
+            source_size = self.source_shape[axis]
+            level_size = finest_level.shape[axis]
+            if source_size < level_size:
+                slices[axis] = slice(0, source_size)
+            else:
+                pad_widths[axis] = (0, source_size - level_size)
+        field = field[tuple(slices)]
+        if any(pad_width != (0, 0) for pad_width in pad_widths):
+            field = np.pad(field, pad_widths, mode="constant", constant_values=fill_value)
+        return field
+
+
+class ScalarFieldPyramid2d(FieldPyramid):
+    def __init__(self, field, maximum_chunk_size=8):
+        """
+        :param field: 2D scalar field, or a batch of such fields of equal size stacked along the first dimension, in
+        which case each level holds the corresponding batch of downsampled fields
+        :param maximum_chunk_size: lateral size, in pixels, of the chunk of the finest level represented by a single
+        pixel in the coarsest level
+        """
+        height, width = field.shape[-2:]
+        # check that we can break this field down into tiles
+        if not is_power_of_two(height) or not is_power_of_two(width):
+            raise ValueError("The argument 'field' must be a 2D numpy array where each dimension is a power of two.")
+        super().__init__(field, maximum_chunk_size)
@@ -73,6 +73,23 @@ def sample_at_replacement(field, replacement, x=0, y=0, point=None):
     return field[y, x]
 
 
+def sample_at_coordinates(field, x_coordinates, y_coordinates, replacement=1):
+    """
+    Vectorized version of sample_at_replacement: sample from a 2D scalar field at each of the given integer coordinates
+    :param field: field from which to sample
+    :type field: numpy.ndarray
+    :param x_coordinates: integer array of x coordinates for sampling locations
+    :param y_coordinates: integer array of y coordinates for sampling locations (of the same shape as x_coordinates)
+    :param replacement: value to use for each out-of-bounds location
+    :return: float64 array of values at the given coordinates, with the replacement for out-of-bounds coordinates
+    """
+    in_bounds = (x_coordinates >= 0) & (x_coordinates < field.shape[1]) & \
+                (y_coordinates >= 0) & (y_coordinates < field.shape[0])
+    values = np.full(np.shape(x_coordinates), replacement, dtype=np.float64)
+    values[in_bounds] = field[y_coordinates[in_bounds], x_coordinates[in_bounds]]
+    return values
+
+
 def focus_coordinates_match(x, y):
     return x == FOCUS_COORDINATES[0] and y == FOCUS_COORDINATES[1]
 
@@ -126,6 +143,22 @@ def interpolate_bilinearly(values, ratios):
     return interpolated_value
 
 
+def interpolate_bilinearly_vectorized(values, ratios_x, ratios_y):
+    """
+    Vectorized version of interpolate_bilinearly
+    :param values: iterable of 4 value arrays, representing discrete points, in the order {(00), (01), (10), (11)}
+    :param ratios_x: distances from points (00) to the sample points along the x axis
+    :param ratios_y: distances from points (00) to the sample points along the y axis
+    :return: array of interpolated values
+    """
+    value00, value01, value10, value11 = values
+    inverse_ratios_x = 1.0 - ratios_x
+    inverse_ratios_y = 1.0 - ratios_y
+    interpolated_value0 = value00 * inverse_ratios_y + value01 * ratios_y
+    interpolated_value1 = value10 * inverse_ratios_y + value11 * ratios_y
+    return interpolated_value0 * inverse_ratios_x + interpolated_value1 * ratios_x
+
+
 def get_bilinear_ratios(x, y):
     point = Point2d(x, y)
     base_point = Point2d(math.floor(x), math.floor(y))
@@ -304,3 +337,176 @@ def bilinear_sample_at_replacement_metainfo(field, x=0, y=0, point=None, replace
     metainfo = BilinearSamplingMetaInfo(value00, value01, value10, value11, ratios, inverse_ratios)
 
     return interpolated_value, metainfo
+
+
+class BilinearWarpSampler:
+    """
+    Vectorized counterpart of bilinear_sample_at / bilinear_sample_at_replacement for a whole 2D warp field.
+    Sampling locations (x + u, y + v), their floors, interpolation ratios, and the flat indices & in-bounds masks of
+    the four neighboring cells are computed once on construction. Any number of scalar fields of the same shape may
+    then be sampled at these locations by array gathering. Out-of-bounds cells follow the same rules as sample_at and
+    sample_at_replacement, i.e. the replacement value is used for each cell that falls outside the field.
+    All of these arrays (and the intermediate arrays used during sampling) are allocated once and reused when the
+    sampler is updated with new warps of the same shape, see update.
+    """
+    # neighbor cells in the order {00, 01, 10, 11}, where the first digit is the x offset and the second the y
+    NEIGHBOR_OFFSETS = ((0, 0), (0, 1), (1, 0), (1, 1))
+
+    def __init__(self, warp_field, coordinates=None):
+        """
+        :param warp_field: 2D vector field of shape (height, width, 2), with the x (u) component at index 0 and the
+        y (v) component at index 1 of the last dimension. Without coordinates, may also be a batch of such fields,
+        i.e. of shape (batch_size, height, width, 2), in which case each scalar field sampled needs to be a batch of
+        the same size, and every field in it is sampled at the locations given by the corresponding warp field.
+        :type warp_field: numpy.ndarray
+        :param coordinates: optional (y_coordinates, x_coordinates) tuple of 1D integer arrays. If provided, only the
+        warps at these locations are used, and sampling results are 1D arrays holding the values for these
+        locations, in the same order.
+        """
+        self.height, self.width = warp_field.shape[-3:-1]
+        # dimension count of the scalar fields that are sampled, i.e. 2 plus the batch dimension (if any)
+        self.source_dimension_count = warp_field.ndim - 1
+        if warp_field.ndim == 4 and coordinates is not None:
+            raise ValueError("Sampling at specific coordinates is not supported for batches of warp fields.")
+        self.coordinates = coordinates
+        if coordinates is None:
+            self.shape = warp_field.shape[:-1]
+            self.y_coordinates, self.x_coordinates = np.indices((self.height, self.width))
+        else:
+            self.y_coordinates, self.x_coordinates = coordinates
+            self.shape = self.y_coordinates.shape
+        if warp_field.ndim == 4:
+            # offsets of the fields within the flattened batch
+            self.batch_offsets = (np.arange(warp_field.shape[0]) * (self.height * self.width)).reshape(-1, 1, 1)
+        else:
+            self.batch_offsets = None
+
+        self.ratios_x = np.empty(self.shape, dtype=np.float64)
+        self.ratios_y = np.empty(self.shape, dtype=np.float64)
+        self.inverse_ratios_x = np.empty(self.shape, dtype=np.float64)
+        self.inverse_ratios_y = np.empty(self.shape, dtype=np.float64)
+        self.flat_indices = [np.empty(self.shape, dtype=np.int64) for _ in self.NEIGHBOR_OFFSETS]
+        self.in_bounds_masks = [np.empty(self.shape, dtype=np.bool_) for _ in self.NEIGHBOR_OFFSETS]
+        self.out_of_bounds_masks = [np.empty(self.shape, dtype=np.bool_) for _ in self.NEIGHBOR_OFFSETS]
+        # intermediate arrays, for location computations & for sampling (by source shape & type)
+        self.__location_buffers = [np.empty(self.shape, dtype=np.float64) for _ in range(2)]
+        self.__cell_buffers = [np.empty(self.shape, dtype=np.int64) for _ in range(4)]
+        self.__mask_buffer = np.empty(self.shape, dtype=np.bool_)
+        self.__sampling_buffers = {}
+
+        self.update(warp_field)
+
+    def update(self, warp_field):
+        """
+        Recompute the sampling locations for new warps
+        :param warp_field: warp field of the same shape as the one the sampler was constructed with
+        """
+        sample_x, sample_y = self.__location_buffers
+        base_x, base_y, cell_x, cell_y = self.__cell_buffers
+        warps = warp_field if self.coordinates is None else warp_field[self.y_coordinates, self.x_coordinates]
+        # sample locations are computed in double precision
+        np.add(self.x_coordinates, warps[..., 0], out=sample_x, dtype=np.float64)
+        np.add(self.y_coordinates, warps[..., 1], out=sample_y, dtype=np.float64)
+        # floors are kept in the inverse ratio arrays until the ratios are computed
+        np.copyto(base_x, np.floor(sample_x, out=self.inverse_ratios_x), casting='unsafe')
+        np.copyto(base_y, np.floor(sample_y, out=self.inverse_ratios_y), casting='unsafe')
+        np.subtract(sample_x, self.inverse_ratios_x, out=self.ratios_x)
+        np.subtract(sample_y, self.inverse_ratios_y, out=self.ratios_y)
+        np.subtract(1.0, self.ratios_x, out=self.inverse_ratios_x)
+        np.subtract(1.0, self.ratios_y, out=self.inverse_ratios_y)
+
+        mask = self.__mask_buffer
+        for (x_offset, y_offset), flat_index, in_bounds, out_of_bounds in \
+                zip(self.NEIGHBOR_OFFSETS, self.flat_indices, self.in_bounds_masks, self.out_of_bounds_masks):
+            np.add(base_x, x_offset, out=cell_x)
+            np.add(base_y, y_offset, out=cell_y)
+            np.greater_equal(cell_x, 0, out=in_bounds)
+            in_bounds &= np.less(cell_x, self.width, out=mask)
+            in_bounds &= np.greater_equal(cell_y, 0, out=mask)
+            in_bounds &= np.less(cell_y, self.height, out=mask)
+            np.logical_not(in_bounds, out=out_of_bounds)
+            np.clip(cell_y, 0, self.height - 1, out=flat_index)
+            flat_index *= self.width
+            flat_index += np.clip(cell_x, 0, self.width - 1, out=cell_x)
+            if self.batch_offsets is not None:
+                flat_index += self.batch_offsets
+
+    def __get_sampling_buffers(self, source_shape, dtype):
+        # 4 arrays to gather the neighbor values into & 3 for the interpolation
+        key = (source_shape, np.dtype(dtype))
+        if key not in self.__sampling_buffers:
+            shape = source_shape[:len(source_shape) - self.source_dimension_count] + self.shape
+            self.__sampling_buffers[key] = ([np.empty(shape, dtype=dtype) for _ in range(4)],
+                                            [np.empty(shape, dtype=np.float64) for _ in range(3)])
+        return self.__sampling_buffers[key]
+
+    def gather(self, field, replacement=1.0, out=None):
+        """
+        :param field: scalar field (or batch of fields) of the same shape as the warp field to gather values from,
+        or a stack of such along the first dimension
+        :param replacement: value (or array broadcastable to the shape of the sampled locations) to use for
+        out-of-bounds cells, converted to the type of the field
+        :param out: optional list of four arrays of the field's type to gather the values into
+        :return: list of the four neighbor value arrays, in the order {00, 01, 10, 11}
+        """
+        flat_field = field.reshape(field.shape[:field.ndim - self.source_dimension_count] + (-1,))
+        if out is None:
+            out = [np.empty(flat_field.shape[:-1] + self.shape, dtype=field.dtype) for _ in self.NEIGHBOR_OFFSETS]
+        for values, flat_index, out_of_bounds in zip(out, self.flat_indices, self.out_of_bounds_masks):
+            # indices are within bounds already, clipping is only there to avoid buffering in np.take
+            np.take(flat_field, flat_index, axis=-1, out=values, mode='clip')
+            np.copyto(values, replacement, where=out_of_bounds)
+        return out
+
+    def sample(self, field, replacement=1.0, out=None):
+        """
+        Bilinearly sample the given scalar field at every warped location
+        :param field: scalar field of the same shape as the warp field
+        :param replacement: value (or array of values of the shape of the sampled locations) to use for
+        out-of-bounds cells, interpolated at its own precision even if it is not representable in the field's type
+        :param out: optional array to store the results in
+        :return: array of interpolated values, of the shape of the sampled locations (float64 unless out is given)
+        """
+        return self.__sample(field, replacement, out)
+
+    def sample_stack(self, fields, replacements, out=None):
+        """
+        Bilinearly sample each scalar field in a stack at every warped location, reusing the same neighbor indices
+        and interpolation ratios for all of them
+        :param fields: array of shape (field_count, height, width) containing the scalar fields (or of shape
+        (field_count, batch_size, height, width) for a batch of warp fields)
+        :param replacements: iterable of field_count values to use for out-of-bounds cells, one per field
+        :param out: optional array to store the results in
+        :return: array of interpolated values, of shape (field_count,) + shape of the sampled locations (float64
+        unless out is given)
+        """
+        replacements = np.asarray(replacements, dtype=np.float64).reshape((-1,) + (1,) * len(self.shape))
+        if replacements.shape[0] != fields.shape[0]:
+            raise ValueError("Expecting one replacement value per field, got {:d} for {:d} fields."
+                             .format(replacements.shape[0], fields.shape[0]))
+        return self.__sample(fields, replacements, out)
+
+    @staticmethod
+    def __get_gather_dtype(field_dtype, replacement):
+        # the neighbor values are gathered in the type of the field unless the replacement would get rounded in it
+        replacement = np.asarray(replacement)
+        if np.array_equal(replacement.astype(field_dtype), replacement):
+            return np.dtype(field_dtype)
+        return np.promote_types(field_dtype, replacement.dtype)
+
+    def __sample(self, field, replacement, out):
+        gather_dtype = self.__get_gather_dtype(field.dtype, replacement)
+        if gather_dtype != field.dtype:
+            field = field.astype(gather_dtype)
+        gather_buffers, interpolation_buffers = self.__get_sampling_buffers(field.shape, field.dtype)
+        value00, value01, value10, value11 = self.gather(field, replacement, out=gather_buffers)
+        interpolated_value0, interpolated_value1, term = interpolation_buffers
+        if out is None:
+            out = np.empty(interpolated_value0.shape, dtype=np.float64)
+        np.multiply(value00, self.inverse_ratios_y, out=interpolated_value0)
+        interpolated_value0 += np.multiply(value01, self.ratios_y, out=term)
+        np.multiply(value10, self.inverse_ratios_y, out=interpolated_value1)
+        interpolated_value1 += np.multiply(value11, self.ratios_y, out=term)
+        interpolated_value0 *= self.inverse_ratios_x
+        interpolated_value1 *= self.ratios_x
+        return np.add(interpolated_value0, interpolated_value1, out=out)
@@ -18,6 +18,8 @@ import os.path
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib import cm
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 from matplotlib.ticker import LinearLocator, FormatStrFormatter
 from utils.point2d import Point2d
 from utils.sampling import get_focus_coordinates
@@ -69,9 +71,149 @@ def highlight_row_on_gray(gray_image, ix_row):
 # TODO: all visualization functions that currently accept an OpenCV writer and write image should instead simply
 # produce an image, which should be written, if necessary, by another routine
 
+class VectorFieldRasterizer:
+    """
+    Draws quiver plots of 2D vector fields directly into fixed-size BGR images with OpenCV, as a fast alternative to
+    rendering matplotlib figures. The background (axes frame, ticks & tick labels) is cached for each field shape,
+    vectors are drawn as arrows colored by magnitude, with all arrows of the same color drawn in a single call.
+    """
+    # left, top, right, bottom margins around the plot area, in pixels
+    MARGINS = (70, 60, 30, 50)
+    TICK_STEPS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+    MAXIMUM_TICK_COUNT = 12
+    ARROWHEAD_ANGLE = np.pi / 7
+    # fractional bits of point coordinates passed to OpenCV (for sub-pixel accuracy)
+    SHIFT = 4
+
+    def __init__(self, image_size=(1920, 1200), color_map_name="viridis", color_count=64):
+        """
+        :param image_size: width and height of the produced images, in pixels
+        :param color_map_name: name of the matplotlib color map to use for vector colors
+        :param color_count: number of distinct vector colors (colors are quantized)
+        """
+        self.image_size = image_size
+        colors_rgb = plt.get_cmap(color_map_name)(np.linspace(0.0, 1.0, color_count))[:, :3]
+        self.colors = [tuple(int(round(channel * 255)) for channel in reversed(color)) for color in colors_rgb]
+        self.__layouts = {}
+
+    def __get_layout(self, field_shape):
+        # plot origin, cell size & background image for fields of the given shape (rows, columns)
+        if field_shape in self.__layouts:
+            return self.__layouts[field_shape]
+        width, height = self.image_size
+        margin_left, margin_top, margin_right, margin_bottom = VectorFieldRasterizer.MARGINS
+        row_count, column_count = field_shape
+        cell_size = min((width - margin_left - margin_right) / column_count,
+                        (height - margin_top - margin_bottom) / row_count)
+        origin = (margin_left + (width - margin_left - margin_right - cell_size * column_count) / 2,
+                  margin_top + (height - margin_top - margin_bottom - cell_size * row_count) / 2)
+        background = np.full((height, width, 3), 255, dtype=np.uint8)
+        top_left = (int(origin[0]), int(origin[1]))
+        bottom_right = (int(origin[0] + cell_size * column_count), int(origin[1] + cell_size * row_count))
+        cv2.rectangle(background, top_left, bottom_right, (0, 0, 0), 1)
+        tick_step = next((step for step in VectorFieldRasterizer.TICK_STEPS
+                          if max(field_shape) / step <= VectorFieldRasterizer.MAXIMUM_TICK_COUNT),
+                         VectorFieldRasterizer.TICK_STEPS[-1])
+        # the y axis points down, like in the image
+        for column in range(0, column_count, tick_step):
+            x = int(origin[0] + (column + 0.5) * cell_size)
+            cv2.line(background, (x, bottom_right[1]), (x, bottom_right[1] + 6), (0, 0, 0), 1)
+            cv2.putText(background, str(column), (x - 8, bottom_right[1] + 24), cv2.FONT_HERSHEY_SIMPLEX, 0.5,
+                        (0, 0, 0), 1, cv2.LINE_AA)
+        for row in range(0, row_count, tick_step):
+            y = int(origin[1] + (row + 0.5) * cell_size)
+            cv2.line(background, (top_left[0] - 6, y), (top_left[0], y), (0, 0, 0), 1)
+            cv2.putText(background, str(row), (top_left[0] - 40, y + 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5,
+                        (0, 0, 0), 1, cv2.LINE_AA)
+        layout = (origin, cell_size, background)
+        self.__layouts[field_shape] = layout
+        return layout
+
+    def render(self, vector_field, iteration_number=None, sparsity_factor=1, use_magnitude_for_color=True, scale=1.0,
+               vectors_name="Warp vectors"):
+        """
+        Make an image of the vector field plot. Parameters are the same as for make_vector_field_plot_matplotlib.
+        :param vector_field: 2D vector field of shape (rows, columns, 2), with x & y vector components
+        :return: BGR image of size image_size
+        """
+        vector_field = vector_field[::sparsity_factor, ::sparsity_factor]
+        origin, cell_size, background = self.__get_layout(vector_field.shape[:2])
+        image = background.copy()
+        if iteration_number is not None:
+            title = "{:s}, iteration {:d}".format(vectors_name, iteration_number)
+        else:
+            title = vectors_name
+        (title_width, _), _ = cv2.getTextSize(title, cv2.FONT_HERSHEY_SIMPLEX, 0.9, 2)
+        cv2.putText(image, title, ((self.image_size[0] - title_width) // 2, 40), cv2.FONT_HERSHEY_SIMPLEX, 0.9,
+                    (0, 0, 0), 2, cv2.LINE_AA)
+
+        # color values, normalized to [0, 1] over the field (like matplotlib does with quiver colors)
+        if use_magnitude_for_color:
+            color_values = np.minimum(np.linalg.norm(vector_field, axis=2) / 10.0 * scale / 0.5, 1.0)
+        else:
+            y_grid, x_grid = np.indices(vector_field.shape[:2])
+            color_values = np.sqrt((y_grid - vector_field.shape[0] / 2.) ** 2 +
+                                   (x_grid - vector_field.shape[1] / 2.) ** 2)
+        value_range = color_values.max() - color_values.min()
+        if value_range > 0:
+            color_values = (color_values - color_values.min()) / value_range
+        else:
+            color_values = np.zeros_like(color_values)
+
+        # arrow tails at cell centers, vector lengths are scaled like quiver's scale_units='xy', angles='xy'
+        rows, columns = np.nonzero(np.any(vector_field != 0, axis=2))
+        pixel_vectors = vector_field[rows, columns].astype(np.float64) * (scale * cell_size)
+        tails = np.stack((origin[0] + (columns + 0.5) * cell_size, origin[1] + (rows + 0.5) * cell_size), axis=1)
+        tips = tails + pixel_vectors
+        lengths = np.linalg.norm(pixel_vectors, axis=1, keepdims=True)
+        directions = pixel_vectors / np.maximum(lengths, np.finfo(np.float64).tiny)
+        head_lengths = np.minimum(0.3 * lengths, 0.5 * cell_size + 2.0)
+        cosine, sine = np.cos(VectorFieldRasterizer.ARROWHEAD_ANGLE), np.sin(VectorFieldRasterizer.ARROWHEAD_ANGLE)
+        head_direction_left = np.stack((directions[:, 0] * cosine - directions[:, 1] * sine,
+                                        directions[:, 0] * sine + directions[:, 1] * cosine), axis=1)
+        head_direction_right = np.stack((directions[:, 0] * cosine + directions[:, 1] * sine,
+                                         -directions[:, 0] * sine + directions[:, 1] * cosine), axis=1)
+        # each arrow is drawn as a polyline: tail -> tip -> left barb, plus the segment tip -> right barb
+        shafts = np.stack((tails, tips, tips - head_direction_left * head_lengths), axis=1)
+        right_barbs = np.stack((tips, tips - head_direction_right * head_lengths), axis=1)
+        shafts = np.round(shafts * (1 << VectorFieldRasterizer.SHIFT)).astype(np.int32)
+        right_barbs = np.round(right_barbs * (1 << VectorFieldRasterizer.SHIFT)).astype(np.int32)
+
+        color_indices = np.minimum((color_values[rows, columns] * len(self.colors)).astype(np.int64),
+                                   len(self.colors) - 1)
+        if len(color_indices) > 0:
+            order = np.argsort(color_indices, kind="stable")
+            sorted_color_indices = color_indices[order]
+            group_starts = np.concatenate(([0], np.flatnonzero(np.diff(sorted_color_indices)) + 1))
+            group_ends = np.append(group_starts[1:], len(order))
+            for group_start, group_end in zip(group_starts, group_ends):
+                group = order[group_start:group_end]
+                color = self.colors[sorted_color_indices[group_start]]
+                cv2.polylines(image, shafts[group], False, color, 1, cv2.LINE_AA, VectorFieldRasterizer.SHIFT)
+                cv2.polylines(image, right_barbs[group], False, color, 1, cv2.LINE_AA, VectorFieldRasterizer.SHIFT)
+        return image
+
+
+_vector_field_rasterizer = None
+
+
 def make_vector_field_plot(warp_field, iteration_number=None, sparsity_factor=1,
                            use_magnitude_for_color=True, scale=1.0, vectors_name="Warp vectors"):
-    fig = plt.figure(figsize=(23.6, 14))
+    """
+    Make a 1920x1200 BGR image with a quiver plot of the 2D vector field (see VectorFieldRasterizer)
+    """
+    global _vector_field_rasterizer
+    if _vector_field_rasterizer is None:
+        _vector_field_rasterizer = VectorFieldRasterizer()
+    return _vector_field_rasterizer.render(warp_field, iteration_number, sparsity_factor, use_magnitude_for_color,
+                                           scale, vectors_name)
+
+
+def make_vector_field_plot_matplotlib(warp_field, iteration_number=None, sparsity_factor=1,
+                                      use_magnitude_for_color=True, scale=1.0, vectors_name="Warp vectors"):
+    # figure is rendered via its own Agg canvas rather than pyplot, which is not thread-safe
+    fig = Figure(figsize=(23.6, 14))
+    FigureCanvasAgg(fig)
     ax = fig.gca()
     if iteration_number is not None:
         ax.set_title("{:s}, iteration {:d}".format(vectors_name, iteration_number))
@@ -105,8 +247,6 @@ def make_vector_field_plot(warp_field, iteration_number=None, sparsity_factor=1,
               scale=1.0 / scale, angles='xy', scale_units='xy')
     fig.canvas.draw()
 
-    plt.close(fig)
-
     plot_image = np.frombuffer(fig.canvas.tostring_rgb(), dtype=np.uint8)
     plot_image = plot_image.reshape(fig.canvas.get_width_height()[::-1] + (3,))
     plot_image = plot_image[110:1310, 240:2160]
@@ -121,10 +261,10 @@ def make_3d_plots(canonical_field, live_field):
     :param live_field: warped/transformed live (target) SDF field
     :return: image (numpy array) of the 3D plot
     """
-    # plot warped live field
-    fig = plt.figure(figsize=(16, 10))
-    fig.canvas.mpl_connect('key_press_event', exit_func)
-    ax = fig.gca(projection='3d')
+    # plot warped live field (via its own Agg canvas rather than pyplot, which is not thread-safe)
+    fig = Figure(figsize=(16, 10))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111, projection='3d')
 
     # Make live data.
     x_grid = np.arange(0, live_field.shape[0])
@@ -163,7 +303,6 @@ def make_3d_plots(canonical_field, live_field):
     plot_image = np.fromstring(fig.canvas.tostring_rgb(), dtype=np.uint8, sep='')
     plot_image = plot_image.reshape(fig.canvas.get_width_height()[::-1] + (3,))
     plot_image = plot_image[150:870, 200:1430]
-    plt.close(fig)
     return plot_image
 
 
@@ -0,0 +1,250 @@
+#  ================================================================
+#  Created by agent on 10/18/26.
+#  Copyright (c) 2026 agent
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#  ================================================================
+
+# Background rendering & encoding of per-iteration visualizations, so that optimizers don't wait for figures to render
+
+# stdlib
+import atexit
+import collections
+import queue
+import threading
+import weakref
+from enum import Enum
+# libraries
+import numpy as np
+
+
+class FullQueuePolicy(Enum):
+    # wait until the oldest frame is rendered (no frames are lost)
+    BLOCK = 0
+    # skip the submitted frame
+    DROP_NEWEST = 1
+    # discard the oldest frame that hasn't been rendered yet to make room for the submitted one
+    DROP_OLDEST = 2
+
+
+class VisualizationScheduleMode(Enum):
+    # visualize every iteration
+    EVERY_ITERATION = 0
+    # visualize every period-th iteration, starting with the first one
+    EVERY_NTH_ITERATION = 1
+    # visualize only the first and the last frame_count iterations
+    FIRST_AND_LAST_ITERATIONS = 2
+    # visualize an iteration only if the energy changed by more than minimum_relative_energy_change (relative to the
+    # energy at the last visualized iteration) since the last visualized iteration
+    ON_ENERGY_CHANGE = 3
+
+
+class VisualizationSchedule:
+    """
+    Determines which iterations of each optimization run (e.g. of each hierarchy level) get visualized.
+    Assumes being used in an "immutable" manner, i.e. just a structure that holds values
+    """
+
+    def __init__(self, mode=VisualizationScheduleMode.EVERY_ITERATION, period=10, frame_count=10,
+                 minimum_relative_energy_change=0.01):
+        self.mode = mode
+        self.period = period
+        self.frame_count = frame_count
+        self.minimum_relative_energy_change = minimum_relative_energy_change
+
+
+# queues that still have a running worker, closed (and, therefore, flushed) when the interpreter exits
+_open_queues = weakref.WeakSet()
+
+
+def _close_open_queues():
+    for visualization_queue in list(_open_queues):
+        visualization_queue.close()
+
+
+atexit.register(_close_open_queues)
+
+
+def write_frame(writer, render_function, *arguments, **keyword_arguments):
+    """
+    Render an image and write it to a video writer (or anything else with a compatible 'write' method)
+    """
+    writer.write(render_function(*arguments, **keyword_arguments))
+
+
+def snapshot(value):
+    return value.copy() if isinstance(value, np.ndarray) else value
+
+
+class VisualizationQueue:
+    """
+    Bounded queue of rendering tasks, executed in order by a single background worker thread. Since the optimizers
+    keep updating their fields in-place, numpy array arguments of each task are copied when the task is submitted.
+    Each asynchronous queue has its own worker, so tasks must not use pyplot, which is not thread-safe: matplotlib
+    figures should be rendered via their own canvas instead (see make_3d_plots in utils/visualization.py).
+    With a maximum size of 0, tasks are executed synchronously upon submission instead.
+    Tasks visualizing optimization iterations can be submitted via submit_iteration, which filters them according
+    to the schedule.
+    """
+
+    def __init__(self, maximum_size=8, full_queue_policy=FullQueuePolicy.BLOCK, schedule=None):
+        """
+        :param maximum_size: maximum number of tasks waiting to be executed, 0 for synchronous execution
+        :param full_queue_policy: what to do when a task is submitted while the queue is full
+        :type full_queue_policy: FullQueuePolicy
+        :param schedule: schedule for iteration visualization tasks, by default, all iterations are visualized
+        :type schedule: VisualizationSchedule
+        """
+        self.maximum_size = maximum_size
+        self.full_queue_policy = full_queue_policy
+        self.schedule = schedule if schedule is not None else VisualizationSchedule()
+        self.dropped_task_count = 0
+        self.__run_index = None
+        # tasks of iterations that may turn out to be among the last ones of the current run
+        self.__held_tasks = collections.deque()
+        self.__last_visualized_energy = None
+        self.__error = None
+        self.__tasks = None
+        self.__worker = None
+        if maximum_size > 0:
+            self.__tasks = queue.Queue(maxsize=maximum_size)
+            self.__worker = threading.Thread(target=self.__run, args=(self.__tasks,), daemon=True)
+            self.__worker.start()
+            _open_queues.add(self)
+
+    @property
+    def asynchronous(self):
+        return self.__worker is not None
+
+    def __run(self, tasks):
+        while True:
+            task = tasks.get()
+            try:
+                if task is None:
+                    return
+                function, arguments, keyword_arguments = task
+                if self.__error is None:
+                    function(*arguments, **keyword_arguments)
+            except Exception as error:
+                # reported back on the next flush
+                self.__error = error
+            finally:
+                tasks.task_done()
+
+    def submit(self, function, *arguments, **keyword_arguments):
+        """
+        Submit a task, i.e. a call of the given function with the given arguments.
+        :return: True if the task was accepted, False if it was dropped (see FullQueuePolicy)
+        """
+        if not self.asynchronous:
+            function(*arguments, **keyword_arguments)
+            return True
+        return self.__enqueue(self.__make_task(function, arguments, keyword_arguments))
+
+    @staticmethod
+    def __make_task(function, arguments, keyword_arguments):
+        return (function, tuple(snapshot(argument) for argument in arguments),
+                {key: snapshot(value) for key, value in keyword_arguments.items()})
+
+    def __enqueue(self, task):
+        if self.full_queue_policy == FullQueuePolicy.BLOCK:
+            self.__tasks.put(task)
+            return True
+        while True:
+            try:
+                self.__tasks.put_nowait(task)
+                return True
+            except queue.Full:
+                if self.full_queue_policy == FullQueuePolicy.DROP_NEWEST:
+                    self.dropped_task_count += 1
+                    return False
+            try:
+                self.__tasks.get_nowait()
+                self.__tasks.task_done()
+                self.dropped_task_count += 1
+            except queue.Empty:
+                pass
+
+    def submit_iteration(self, run_index, iteration_number, energy, function, *arguments, **keyword_arguments):
+        """
+        Submit a task visualizing an iteration of an optimization run, if the schedule selects the iteration.
+        With VisualizationScheduleMode.FIRST_AND_LAST_ITERATIONS, tasks of iterations past the first ones are held
+        back until the end of the run (see end_run), and only the last ones among them are then submitted.
+        :param run_index: index of the optimization run (e.g. hierarchy level), a change of it ends the previous run
+        :param iteration_number: index of the iteration within the run
+        :param energy: energy at this iteration, only needed for VisualizationScheduleMode.ON_ENERGY_CHANGE
+        :return: True if the task was submitted immediately
+        """
+        if run_index != self.__run_index:
+            self.end_run()
+            self.__run_index = run_index
+        schedule = self.schedule
+        if schedule.mode == VisualizationScheduleMode.EVERY_NTH_ITERATION:
+            if iteration_number % schedule.period != 0:
+                return False
+        elif schedule.mode == VisualizationScheduleMode.FIRST_AND_LAST_ITERATIONS:
+            if iteration_number >= schedule.frame_count:
+                self.__held_tasks.append(self.__make_task(function, arguments, keyword_arguments))
+                if len(self.__held_tasks) > schedule.frame_count:
+                    self.__held_tasks.popleft()
+                return False
+        elif schedule.mode == VisualizationScheduleMode.ON_ENERGY_CHANGE:
+            last_energy = self.__last_visualized_energy
+            if last_energy is not None and \
+                    abs(energy - last_energy) <= schedule.minimum_relative_energy_change * abs(last_energy):
+                return False
+            self.__last_visualized_energy = energy
+        return self.submit(function, *arguments, **keyword_arguments)
+
+    def end_run(self):
+        """
+        End the current optimization run, submitting the tasks held back for its last iterations.
+        """
+        held_tasks = self.__held_tasks
+        self.__held_tasks = collections.deque()
+        self.__run_index = None
+        self.__last_visualized_energy = None
+        for task in held_tasks:
+            if self.asynchronous:
+                self.__enqueue(task)
+            else:
+                function, arguments, keyword_arguments = task
+                function(*arguments, **keyword_arguments)
+
+    def flush(self):
+        """
+        Wait until all submitted tasks have been executed.
+        Raises the first exception raised by any task since the last flush.
+        """
+        if self.asynchronous:
+            self.__tasks.join()
+        if self.__error is not None:
+            error = self.__error
+            self.__error = None
+            raise error
+
+    def close(self):
+        """
+        End the current run, flush the queue and stop the worker. Further tasks are executed synchronously.
+        """
+        if self.asynchronous and threading.current_thread() is self.__worker:
+            # closed by one of the tasks (e.g. upon garbage collection of the queue owner): the worker can't wait for
+            # itself, so the queue gets closed at exit instead
+            return
+        self.end_run()
+        if self.asynchronous:
+            self.__tasks.put(None)
+            self.__worker.join()
+            self.__worker = None
+            self.__tasks = None
+            _open_queues.discard(self)
+        self.flush()